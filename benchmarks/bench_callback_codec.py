@@ -0,0 +1,30 @@
+# benchmarks/bench_callback_codec.py
+import sys
+import time
+
+from callback_codec import CALLBACK_DATA_LIMIT, ROUTE_NEXT_POST, decode_callback, encode_navigation
+
+def benchmark(buttons: int = 100_000):
+    """Размер и время кодирования и разбора кнопки навигации"""
+    cursor = ('2024-01-01 12:34:56', 4_000_000_000)
+    data = encode_navigation(ROUTE_NEXT_POST, 4_000_000_000, 4_000_000_000, cursor)
+
+    started = time.perf_counter()
+    for _ in range(buttons):
+        encode_navigation(ROUTE_NEXT_POST, 12, 345, cursor)
+    encode = (time.perf_counter() - started) / buttons * 1_000_000
+
+    started = time.perf_counter()
+    for _ in range(buttons):
+        decode_callback(data)
+    decode = (time.perf_counter() - started) / buttons * 1_000_000
+
+    tampered = data[:-12] + ('A' if data[-12] != 'A' else 'B') + data[-11:]
+    assert decode_callback(data).cursor == cursor and decode_callback(tampered) is None
+
+    print(f"📦 navigation button: {len(data)} of {CALLBACK_DATA_LIMIT} bytes (largest ids)")
+    print(f"⏱️ encode {encode:.2f} µs, decode {decode:.2f} µs")
+
+if __name__ == '__main__':
+    # python -m benchmarks.bench_callback_codec [количество кнопок] - размер и скорость кодека
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,77 @@
+# benchmarks/bench_callback_router.py
+import asyncio
+import random
+import sys
+import time
+
+from callback_router import CallbackRouter
+
+# Маршруты бота в порядке прежней цепочки if/elif (для benchmark)
+_BENCHMARK_ROUTES = (
+    ('back_to_main', False), ('view_sections', False), ('view_section', True), ('view_subsection', True),
+    ('prev_post', True), ('next_post', True), ('search', False), ('search_page', True), ('search_open', True),
+    ('create_section', False), ('create_subsection_choose_section', False), ('create_subsection', True),
+    ('add_post_choose_section', False), ('add_post_choose_subsection', True), ('add_post', True),
+    ('manage_content', False), ('manage_sections', False), ('edit_section', True), ('delete_section', True),
+    ('confirm_delete_section', True),
+)
+
+def _chain_dispatch(data: str):
+    """Прежняя диспетчеризация: startswith по порядку и повторный разбор аргумента в обработчике"""
+    for name, with_argument in _BENCHMARK_ROUTES:
+        if with_argument:
+            if data.startswith(name + '_'):
+                return name, int(data.split('_')[-1])
+        elif data == name:
+            return name, None
+    return None
+
+def benchmark(callbacks: int = 200_000):
+    """Время диспетчеризации: цепочка startswith против таблицы маршрутов"""
+    router = CallbackRouter()
+
+    async def handler(*args):
+        pass
+
+    for name, with_argument in _BENCHMARK_ROUTES:
+        if with_argument:
+            router.prefixed(name, handler)
+        else:
+            router.exact(name, handler)
+
+    rng = random.Random(42)
+    data = [
+        f'{name}_{rng.randint(1, 10_000)}' if with_argument else name
+        for name, with_argument in rng.choices(_BENCHMARK_ROUTES, k=callbacks)
+    ]
+
+    for value in data[:1000]:
+        route, arguments = router.resolve(value)
+        chained = _chain_dispatch(value)
+        if route.name.rstrip('_*') != chained[0] or arguments != (() if chained[1] is None else (chained[1],)):
+            raise AssertionError(f"Routes disagree for {value}")
+
+    started = time.perf_counter()
+    for value in data:
+        _chain_dispatch(value)
+    chain = (time.perf_counter() - started) / callbacks * 1_000_000
+
+    started = time.perf_counter()
+    for value in data:
+        router.resolve(value)
+    table = (time.perf_counter() - started) / callbacks * 1_000_000
+
+    async def dispatch_all():
+        for value in data:
+            await router.dispatch(value)
+
+    started = time.perf_counter()
+    asyncio.run(dispatch_all())
+    counted = (time.perf_counter() - started) / callbacks * 1_000_000
+
+    print(f"⏱️ {callbacks} callbacks, {len(_BENCHMARK_ROUTES)} routes: startswith chain {chain:.2f} µs, "
+          f"route table {table:.2f} µs, with counters {counted:.2f} µs")
+
+if __name__ == '__main__':
+    # python -m benchmarks.bench_callback_router [количество callback] - время диспетчеризации
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
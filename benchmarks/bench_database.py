@@ -0,0 +1,140 @@
+# benchmarks/bench_database.py
+import asyncio
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, List
+
+import database
+from database import ConnectionManager, run_read, run_write
+from repository import SUBSECTIONS_WITH_COUNTS_SQL, first_posts
+
+# Смесь нажатий: листание записей, дерево разделов со счетчиками, новая запись
+_CALLBACKS = (('posts', 0.6), ('tree', 0.3), ('write', 0.1))
+
+INSERT_POST_SQL = '''
+    INSERT INTO posts (subsection_id, user_id, user_name, title, content_type, content_text)
+    VALUES (?, 0, 'bench', ?, 'text', ?)
+'''
+
+def _fill(path: str, posts_count: int):
+    """Временная база с 40 подразделами и posts_count записями"""
+    from migrations import migrate
+
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.executemany('INSERT OR IGNORE INTO sections (id, name) VALUES (?, ?)', [(i, f'Раздел {i}') for i in range(1, 5)])
+    conn.executemany(
+        'INSERT OR IGNORE INTO subsections (id, section_id, name) VALUES (?, ?, ?)',
+        [(i, (i - 1) // 10 + 1, f'Подраздел {i}') for i in range(1, 41)]
+    )
+    rng = random.Random(42)
+    conn.executemany(
+        INSERT_POST_SQL,
+        ((rng.randint(1, 40), f'Запись {i}', 'текст записи ' * rng.randint(5, 50)) for i in range(posts_count))
+    )
+    conn.commit()
+    conn.close()
+
+class _LockHolder(threading.Thread):
+    """Другой писатель в ту же базу (второй процесс бота, выгрузка дампа): раз в every
+    секунд держит блокировку записи hold секунд"""
+
+    def __init__(self, path: str, every: float, hold: float):
+        super().__init__(daemon=True)
+        self.path = path
+        self.every = every
+        self.hold = hold
+        self.stopped = threading.Event()
+
+    def run(self):
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        while not self.stopped.wait(self.every):
+            conn.execute('BEGIN IMMEDIATE')
+            time.sleep(self.hold)
+            conn.execute('COMMIT')
+        conn.close()
+
+def _read_posts(conn: sqlite3.Connection, subsection_id: int):
+    return first_posts(conn, subsection_id)
+
+def _read_tree(conn: sqlite3.Connection):
+    return conn.execute(SUBSECTIONS_WITH_COUNTS_SQL).fetchall()
+
+def _write_post(conn: sqlite3.Connection, subsection_id: int):
+    return conn.execute(INSERT_POST_SQL, (subsection_id, 'Новая запись', 'текст')).lastrowid
+
+async def _simulate(users: int, callbacks_per_user: int, think: float, reply: float, blocking: bool) -> List[float]:
+    """Задержки нажатий (от нажатия до ответа бота, мс) при users одновременных пользователях"""
+    conn = database.connection_manager.connection()
+    latencies: List[float] = []
+
+    async def query(func: Callable[..., Any], *args, write: bool = False):
+        if not blocking:
+            return await (run_write(func, *args) if write else run_read(func, *args))
+        # Прежний код: sqlite3 прямо в цикле событий
+        result = func(conn, *args)
+        conn.commit()
+        return result
+
+    async def user(user_id: int):
+        rng = random.Random(user_id)
+        loop = asyncio.get_running_loop()
+        pressed = loop.time() + rng.uniform(0, think)
+        for _ in range(callbacks_per_user):
+            await asyncio.sleep(max(0.0, pressed - loop.time()))
+            kind = rng.choices([name for name, _ in _CALLBACKS], [weight for _, weight in _CALLBACKS])[0]
+            subsection_id = rng.randint(1, 40)
+            if kind == 'posts':
+                await query(_read_posts, subsection_id)
+            elif kind == 'tree':
+                await query(_read_tree)
+            else:
+                await query(_write_post, subsection_id, write=True)
+            # Ответ пользователю: запрос к Telegram
+            await asyncio.sleep(reply)
+            # Задержка считается от момента нажатия: ожидание цикла событий тоже в нее входит
+            latencies.append((loop.time() - pressed) * 1000)
+            pressed += rng.expovariate(1 / think)
+
+    await asyncio.gather(*(user(user_id) for user_id in range(users)))
+    return latencies
+
+def _percentile(values: List[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+def benchmark(users: int = 200, callbacks_per_user: int = 10, posts_count: int = 20_000,
+              think: float = 1.0, reply: float = 0.02, lock_every: float = 1.0, lock_hold: float = 0.1):
+    """p50/p99 задержки нажатий: sqlite3 в цикле событий против пула читателей и потока-писателя.
+
+    Параллельно другой писатель раз в lock_every секунд держит блокировку записи lock_hold секунд"""
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'database_benchmark.db')
+    _fill(path, posts_count)
+    database.connection_manager = ConnectionManager(path)
+
+    try:
+        for blocking in (True, False):
+            holder = _LockHolder(path, lock_every, lock_hold)
+            holder.start()
+            started = time.perf_counter()
+            latencies = asyncio.run(_simulate(users, callbacks_per_user, think, reply, blocking))
+            elapsed = time.perf_counter() - started
+            holder.stopped.set()
+            holder.join()
+            label = 'sqlite3 on event loop' if blocking else 'reader pool + writer thread'
+            print(f"⏱️ {label}: {len(latencies)} callbacks from {users} users in {elapsed:.1f} s, "
+                  f"p50 {_percentile(latencies, 0.5):.1f} ms, p99 {_percentile(latencies, 0.99):.1f} ms")
+    finally:
+        database.shutdown()
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    # python -m benchmarks.bench_database [пользователей] - задержка нажатий при одновременных пользователях
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,53 @@
+# benchmarks/bench_dump.py
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from dump import export_dump, import_dump
+
+def _write_synthetic_dump(path: str, posts_count: int):
+    """Дамп с 4 разделами, 40 подразделами и posts_count записями"""
+    rng = random.Random(42)
+    words = ['рейд', 'гильдия', 'оружие', 'броня', 'квест', 'босс', 'тактика', 'лут', 'клан', 'событие']
+
+    with open(path, 'w', encoding='utf-8') as file:
+        for section_id in range(1, 5):
+            file.write(json.dumps({'type': 'section', 'id': section_id, 'name': f'Раздел {section_id}'}, ensure_ascii=False) + '\n')
+        for subsection_id in range(1, 41):
+            file.write(json.dumps({
+                'type': 'subsection', 'id': subsection_id, 'section_id': (subsection_id - 1) // 10 + 1,
+                'name': f'Подраздел {subsection_id}',
+            }, ensure_ascii=False) + '\n')
+        for post_id in range(1, posts_count + 1):
+            file.write(json.dumps({
+                'type': 'post', 'id': post_id, 'subsection_id': rng.randint(1, 40), 'user_id': 0,
+                'user_name': 'bench', 'title': ' '.join(rng.choices(words, k=3)), 'content_type': 'text',
+                'content_text': ' '.join(rng.choices(words, k=rng.randint(5, 20))),
+                'created_at': f'2024-01-01 00:00:{post_id % 60:02d}',
+            }, ensure_ascii=False) + '\n')
+
+def benchmark(posts_count: int = 1_000_000):
+    """Время загрузки и выгрузки дампа с posts_count записями"""
+    directory = tempfile.mkdtemp()
+    dump_path = os.path.join(directory, 'dump.jsonl')
+    db_path = os.path.join(directory, 'dump_benchmark.db')
+
+    _write_synthetic_dump(dump_path, posts_count)
+
+    started = time.perf_counter()
+    rows = import_dump(dump_path, db_path)
+    print(f"⏱️ import: {rows} rows in {time.perf_counter() - started:.1f} s")
+
+    started = time.perf_counter()
+    counts = export_dump(dump_path, db_path)
+    print(f"⏱️ export: {sum(counts.values())} rows in {time.perf_counter() - started:.1f} s")
+
+    shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    # python -m benchmarks.bench_dump [количество записей] - время загрузки и выгрузки дампа
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,182 @@
+# benchmarks/bench_render_memory.py
+import asyncio
+import itertools
+import random
+import sys
+from typing import Any, Dict, Optional, Tuple
+
+from telegram import InputMediaPhoto
+from telegram.error import BadRequest
+
+import render_memory
+from render_memory import MessageKey, RenderMemory, _show
+
+class _Markup:
+    """Клавиатура для benchmark (to_json, как у InlineKeyboardMarkup)"""
+
+    def __init__(self, buttons: Tuple[str, ...]):
+        self.buttons = buttons
+
+    def to_json(self) -> str:
+        return repr(self.buttons)
+
+class _StubTelegram:
+    """Сообщения чатов для benchmark: считает запросы и отвечает на правки, как Telegram"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.messages: Dict[MessageKey, Tuple[str, Any, Any]] = {}  # вид, содержимое, клавиатура
+        self.calls: Dict[str, int] = {}
+        self.failed = 0
+        self._ids = itertools.count(1)
+
+    async def call(self, method: str):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        await asyncio.sleep(self.latency)
+
+    def fail(self, message: str):
+        self.failed += 1
+        raise BadRequest(message)
+
+    def send(self, chat_id: int, kind: str, content: Any, markup: Any) -> '_StubMessage':
+        message = _StubMessage(self, chat_id, next(self._ids))
+        self.messages[(chat_id, message.message_id)] = (kind, content, markup)
+        return message
+
+class _StubMessage:
+    """Message для benchmark"""
+
+    def __init__(self, telegram: _StubTelegram, chat_id: int, message_id: int):
+        self.telegram = telegram
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+    @property
+    def photo(self) -> tuple:
+        return ('photo',) if self.telegram.messages[(self.chat_id, self.message_id)][0] == 'photo' else ()
+
+    async def reply_text(self, text, reply_markup=None):
+        await self.telegram.call('sendMessage')
+        return self.telegram.send(self.chat_id, 'text', text, reply_markup and reply_markup.to_json())
+
+    async def reply_photo(self, photo, caption=None, reply_markup=None):
+        await self.telegram.call('sendPhoto')
+        return self.telegram.send(self.chat_id, 'photo', (photo, caption), reply_markup and reply_markup.to_json())
+
+    async def delete(self):
+        await self.telegram.call('deleteMessage')
+        del self.telegram.messages[(self.chat_id, self.message_id)]
+
+class _StubQuery:
+    """CallbackQuery для benchmark"""
+
+    def __init__(self, message: _StubMessage):
+        self.message = message
+        self.telegram = message.telegram
+        self.key = (message.chat_id, message.message_id)
+
+    async def _edit(self, method: str, kind: str, content: Any = None, markup: Any = None, part: int = 1):
+        await self.telegram.call(method)
+        shown_kind, shown, shown_markup = self.telegram.messages[self.key]
+        if shown_kind != kind:
+            self.telegram.fail(f"There is no {'text' if kind == 'text' else 'media'} in the message to edit")
+        markup = markup and markup.to_json()
+        if part == 0:
+            content = shown
+        elif part == 2:
+            content = (shown[0], content)
+        if (shown, shown_markup) == (content, markup):
+            self.telegram.fail("Message is not modified: specified new message content and reply markup "
+                               "are exactly the same as a current content and reply markup of the message")
+        self.telegram.messages[self.key] = (kind, content, markup)
+
+    async def edit_message_text(self, text, reply_markup=None):
+        await self._edit('editMessageText', 'text', text, reply_markup)
+
+    async def edit_message_media(self, media, reply_markup=None):
+        await self._edit('editMessageMedia', 'photo', (media.media, media.caption), reply_markup)
+
+    async def edit_message_caption(self, caption=None, reply_markup=None):
+        await self._edit('editMessageCaption', 'photo', caption, reply_markup, part=2)
+
+    async def edit_message_reply_markup(self, reply_markup=None):
+        kind = self.telegram.messages[self.key][0]
+        await self._edit('editMessageReplyMarkup', kind, markup=reply_markup, part=0)
+
+async def _blind_show(query: _StubQuery, text: str, markup: _Markup, photo: Optional[str]):
+    """Прежний show_post: сначала editMessageMedia, при любой ошибке - editMessageText"""
+    if photo:
+        try:
+            await query.edit_message_media(media=InputMediaPhoto(media=photo, caption=text), reply_markup=markup)
+        except BadRequest:
+            await query.edit_message_text(text, reply_markup=markup)
+    else:
+        await query.edit_message_text(text, reply_markup=markup)
+
+async def _replay(screens, use_memory: bool, latency: float) -> Tuple[_StubTelegram, int, float]:
+    """Показывает экраны по очереди в одном сообщении на чат; возвращает Telegram,
+    число экранов, показанных не так, как нужно, и время"""
+    telegram = _StubTelegram(latency)
+    current: Dict[int, _StubMessage] = {}
+    lost = 0
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    for chat_id, text, buttons, photo in screens:
+        if chat_id not in current:
+            current[chat_id] = telegram.send(chat_id, 'text', None, None)
+        query = _StubQuery(current[chat_id])
+        markup = _Markup(buttons)
+        try:
+            if use_memory:
+                await _show(query, text, markup, photo, {})
+            else:
+                await _blind_show(query, text, markup, photo)
+        except BadRequest:
+            pass
+        # Следующее нажатие придет уже из нового сообщения, если старое было заменено
+        if (chat_id, query.message.message_id) not in telegram.messages:
+            current[chat_id] = next(
+                _StubMessage(telegram, chat, message_id)
+                for chat, message_id in reversed(telegram.messages) if chat == chat_id
+            )
+        expected = ('photo', (photo, text)) if photo else ('text', text)
+        if telegram.messages[(chat_id, current[chat_id].message_id)][:2] != expected:
+            lost += 1
+
+    return telegram, lost, loop.time() - started
+
+def benchmark(screens_count: int = 2_000, latency: float = 0.002):
+    """Запросы к API на смоделированной навигации по подразделу с текстовыми записями и записями с фото:
+    повторные нажатия, смена только клавиатуры, переходы между записями"""
+    rng = random.Random(42)
+    screens = []
+    state = {}
+    for _ in range(screens_count):
+        chat_id = rng.randint(1, 50)
+        text, buttons, photo = state.get(chat_id, ('📂 Выберите раздел:', ('a', 'b'), None))
+        roll = rng.random()
+        if roll < 0.3:
+            pass  # то же нажатие еще раз
+        elif roll < 0.45:
+            buttons = buttons + ('c',) if len(buttons) < 4 else buttons[:2]  # изменилась только клавиатура
+        else:
+            post_id = rng.randint(1, 500)
+            text, buttons = f'📌 Запись {post_id}', ('prev', 'next')
+            photo = f'photo-{post_id}' if post_id % 3 == 0 else None  # каждая третья запись с фото
+        state[chat_id] = (text, buttons, photo)
+        screens.append((chat_id, text, buttons, photo))
+
+    for use_memory in (False, True):
+        # _show работает с глобальной памятью модуля
+        render_memory.render_memory = RenderMemory(10_000)
+        telegram, lost, elapsed = asyncio.run(_replay(screens, use_memory, latency))
+        label = 'render memory' if use_memory else 'always edit'
+        print(f"📨 {label}: {sum(telegram.calls.values())} API calls {telegram.calls}, "
+              f"failed calls {telegram.failed}, screens shown wrong {lost}, "
+              f"{elapsed:.2f} s at {latency * 1000:.0f} ms per call")
+    print(f"📊 {render_memory.render_memory.stats()}")
+
+if __name__ == '__main__':
+    # python -m benchmarks.bench_render_memory [количество экранов] - запросы к API с памятью показанного и без нее
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2_000)
@@ -0,0 +1,83 @@
+# benchmarks/bench_repository.py
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from repository import POST_COLUMNS, Post, first_posts, load_sections, load_subsections_with_counts, post_cache
+
+def _measure_memory(build) -> float:
+    """Байт на строку для списка строк, построенного build()"""
+    tracemalloc.start()
+    rows = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / len(rows)
+
+def _measure_time(func, repeats: int) -> float:
+    """Среднее время вызова func в микросекундах"""
+    started = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - started) / repeats * 1_000_000
+
+def benchmark(posts_count: int = 10_000, repeats: int = 2_000):
+    """Сравнивает записи с выборкой SELECT * по памяти на запись и времени на экран"""
+    from migrations import migrate
+
+    path = os.path.join(tempfile.mkdtemp(), 'repository_benchmark.db')
+    conn = sqlite3.connect(path)
+    migrate(conn)
+
+    rng = random.Random(42)
+    conn.executemany(
+        'INSERT INTO posts (subsection_id, user_id, user_name, title, content_type, content_text) '
+        'VALUES (?, 0, ?, ?, ?, ?)',
+        (
+            (rng.randint(1, 8), 'bench', f'Запись {i}', 'text', 'текст записи ' * rng.randint(5, 50))
+            for i in range(posts_count)
+        )
+    )
+    conn.commit()
+
+    # Память на запись: полная строка таблицы против записи с нужными экрану колонками
+    raw = _measure_memory(lambda: conn.execute('SELECT * FROM posts').fetchall())
+    posts = _measure_memory(lambda: list(map(Post._make, conn.execute(f'SELECT {POST_COLUMNS} FROM posts'))))
+    listing = _measure_memory(lambda: conn.execute('SELECT id, subsection_id, title FROM posts').fetchall())
+    print(f"📦 SELECT * row: {raw:.0f} B, Post: {posts:.0f} B, (id, subsection_id, title): {listing:.0f} B")
+
+    # Состояние навигации каждого пользователя, листающего подраздел: все строки подраздела
+    # (прежний session['posts']) против курсора на запись из общего кэша
+    users = 500
+    subsection_size = conn.execute('SELECT COUNT(*) FROM posts WHERE subsection_id = 3').fetchone()[0]
+    all_rows = _measure_memory(lambda: [
+        conn.execute('SELECT * FROM posts WHERE subsection_id = ?', (3,)).fetchall() for _ in range(users)
+    ])
+    first_posts(conn, 3)
+    cursors = _measure_memory(lambda: [tuple(first_posts(conn, 3)[0].cursor) for _ in range(users)])
+    print(f"📦 navigation state per user ({subsection_size} posts): rows {all_rows / 1024:.0f} KiB, "
+          f"cursor {cursors:.0f} B; shared post cache {len(post_cache._posts)} posts")
+
+    # Время на экран: первая запись подраздела и дерево разделов
+    timings = {
+        'first posts (SELECT *)': _measure_time(lambda: conn.execute(
+            'SELECT * FROM posts WHERE subsection_id = ? ORDER BY created_at DESC, id DESC LIMIT 2', (3,)
+        ).fetchall(), repeats),
+        'first posts (ids + post_cache)': _measure_time(lambda: first_posts(conn, 3), repeats),
+        'tree (Section/Subsection)': _measure_time(
+            lambda: (load_sections(conn), load_subsections_with_counts(conn)), max(1, repeats // 20)
+        ),
+    }
+    for name, micros in timings.items():
+        print(f"⏱️ {name}: {micros:.1f} µs")
+
+    conn.close()
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+if __name__ == '__main__':
+    # python -m benchmarks.bench_repository [количество записей] - память и время построения записей
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,74 @@
+# benchmarks/bench_search.py
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from search import SEARCH_RANK_LIMIT, search
+
+# Словарь для синтетического корпуса бенчмарка
+_BENCHMARK_WORDS = (
+    'гайд сборка арена босс клан рейд билд урон защита лечение маг воин лучник '
+    'стратегия ресурсы золото опыт уровень подземелье событие награда команда '
+    'артефакт оружие броня навык талант питомец крафт рецепт турнир сезон '
+    'guide build pvp pve boss raid tank healer dps meta tier patch'
+).split()
+
+def benchmark(posts_count: int = 100_000, repeats: int = 50):
+    """Заполняет временную базу синтетическими записями и замеряет время поиска"""
+    from migrations import migrate
+
+    path = os.path.join(tempfile.mkdtemp(), 'search_benchmark.db')
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    migrate(conn)
+
+    rng = random.Random(42)
+    subsections = [row[0] for row in conn.execute('SELECT id FROM subsections')]
+
+    started = time.perf_counter()
+    conn.executemany(
+        'INSERT INTO posts (subsection_id, user_id, user_name, title, content_type, content_text, link_title) '
+        'VALUES (?, 0, ?, ?, ?, ?, ?)',
+        (
+            (
+                rng.choice(subsections),
+                'bench',
+                ' '.join(rng.choices(_BENCHMARK_WORDS, k=4)) + f' {i}',
+                'text',
+                ' '.join(rng.choices(_BENCHMARK_WORDS, k=60)),
+                ' '.join(rng.choices(_BENCHMARK_WORDS, k=3)) if i % 5 == 0 else None
+            )
+            for i in range(posts_count)
+        )
+    )
+    conn.commit()
+    print(f"✅ {posts_count} posts indexed in {time.perf_counter() - started:.1f} s")
+
+    queries = ['12345', 'рейд босс', 'сбор', 'гайд арена награда', 'pvp', 'tank heal', 'нет такого слова']
+    slow = False
+    for text in queries:
+        for page in (0, 3):
+            timings = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                _, _, truncated = search(conn, text, page)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            median, p95 = timings[len(timings) // 2], timings[int(len(timings) * 0.95) - 1]
+            slow = slow or p95 > 10
+            print(f"{'⚠️' if p95 > 10 else '✅'} {text!r} page {page}: median {median:.2f} ms, p95 {p95:.2f} ms"
+                  + (f" (ranked {SEARCH_RANK_LIMIT} newest matches)" if truncated else ""))
+
+    conn.close()
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+    return not slow
+
+if __name__ == '__main__':
+    # python -m benchmarks.bench_search [количество записей] - бенчмарк поиска на синтетическом корпусе
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    sys.exit(0 if benchmark(count) else 1)
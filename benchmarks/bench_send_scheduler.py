@@ -0,0 +1,92 @@
+# benchmarks/bench_send_scheduler.py
+import asyncio
+import random
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from telegram.error import RetryAfter
+
+from send_scheduler import (SEND_BULK, SEND_CHAT_BURST, SEND_CHAT_RATE, SEND_GLOBAL_RATE, SEND_GROUP_RATE,
+                            SEND_INTERACTIVE, SendScheduler, TokenBucket)
+
+class _StubBotApi:
+    """Bot API для benchmark: считает запросы корзинами с лимитами Telegram
+    и отвечает RetryAfter на превышение"""
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: int, latency: float):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.latency = latency
+        self.rejected = 0
+        self.retried = 0
+        self.delivered: Dict[str, List[float]] = {'interactive': [], 'bulk': []}
+        self._global: Optional[TokenBucket] = None
+        self._chats: Dict[int, TokenBucket] = {}
+
+    async def send_message(self, chat_id: int, kind: str, created: float) -> Dict[str, Any]:
+        await asyncio.sleep(self.latency)
+        now = time.perf_counter()
+        if self._global is None:
+            self._global = TokenBucket(self.global_rate, self.global_rate, now)
+        chat = self._chats.setdefault(chat_id, TokenBucket(self.chat_rate, self.chat_burst, now))
+
+        # Небольшой допуск на неточность таймеров, как у настоящего Telegram
+        if self._global.delay(now) > 0.01 or chat.delay(now) > 0.01:
+            self.rejected += 1
+            raise RetryAfter(1)
+        self._global.take()
+        chat.take()
+        self.delivered[kind].append(now - created)
+        return {'ok': True}
+
+async def _announce(scheduled: bool, clan: int, users: int, scale: float) -> _StubBotApi:
+    """Рассылка на весь клан и одновременно навигация users пользователей"""
+    api = _StubBotApi(SEND_GLOBAL_RATE * scale, SEND_CHAT_RATE * scale, SEND_CHAT_BURST, 0.005)
+    scheduler = SendScheduler(SEND_GLOBAL_RATE * scale, SEND_CHAT_RATE * scale, SEND_GROUP_RATE * scale,
+                              SEND_CHAT_BURST)
+    await scheduler.initialize()
+
+    async def send(chat_id: int, kind: str):
+        created = time.perf_counter()
+        callback = api.send_message
+        args = (chat_id, kind, created)
+        try:
+            if scheduled:
+                priority = SEND_BULK if kind == 'bulk' else SEND_INTERACTIVE
+                await scheduler.process_request(callback, args, {}, 'sendMessage', {'chat_id': chat_id}, priority)
+            else:
+                await callback(*args)
+        except RetryAfter:
+            pass
+
+    async def interactive():
+        rng = random.Random(42)
+        for _ in range(clan // 4):
+            await asyncio.sleep(rng.expovariate(users * scale / 2))
+            asyncio.create_task(send(rng.randint(1, users), 'interactive'))
+
+    tasks = [asyncio.create_task(send(10_000 + chat_id, 'bulk')) for chat_id in range(clan)]
+    await interactive()
+    await asyncio.gather(*tasks)
+    await asyncio.sleep(1)
+    await scheduler.shutdown()
+    api.retried = scheduler.retried
+    return api
+
+def benchmark(clan: int = 600, users: int = 20, scale: float = 5.0):
+    """Рассылка на clan чатов при активных пользователях: без планировщика и с ним (лимиты x scale)"""
+    for scheduled in (False, True):
+        api = asyncio.run(_announce(scheduled, clan, users, scale))
+        interactive, bulk = api.delivered['interactive'], api.delivered['bulk']
+        p95 = sorted(interactive)[int(len(interactive) * 0.95) - 1] if interactive else 0.0
+        print(f"📨 {'scheduler' if scheduled else 'direct'}: RetryAfter {api.rejected} (retried {api.retried}), "
+              f"delivered bulk {len(bulk)}/{clan}, interactive {len(interactive)}/{clan // 4} "
+              f"(p50 {statistics.median(interactive or [0]) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms), "
+              f"last bulk message after {max(bulk or [0]):.1f} s")
+
+if __name__ == '__main__':
+    # python -m benchmarks.bench_send_scheduler [чатов в рассылке] - рассылка на локальном Bot API с лимитами
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 600)
@@ -0,0 +1,130 @@
+# benchmarks/bench_session_manager.py
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict
+
+from session_manager import SessionManager, SharedSqliteSessionBackend, UserSession
+
+def _legacy_session() -> Dict[str, Any]:
+    """Сессия в прежнем виде - словарь с отдельным ключом на каждый флаг"""
+    return {
+        'created_at': time.time(),
+        'current_section': None,
+        'current_subsection': None,
+        'current_post_index': 0,
+        'search_query': None,
+        'adding_post': None,
+        'creating_section': False,
+        'creating_subsection': None,
+        'editing_section': None,
+        'editing_subsection': None,
+        'editing_post': None,
+        'awaiting_section_name': False,
+        'awaiting_subsection_name': False,
+        'awaiting_post_title': False,
+        'awaiting_post_content': False,
+        'awaiting_search_query': False,
+    }
+
+def _measure_sessions(build, count: int) -> float:
+    """Байт на сессию в хранилище из count сессий, построенном build(user_id)"""
+    tracemalloc.start()
+    store = {user_id: build(user_id) for user_id in range(1_000_000, 1_000_000 + count)}
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+    return size / count
+
+def benchmark(count: int = 100_000):
+    """Память на сессию при count одновременных сессиях: словарь против UserSession"""
+    legacy = _measure_sessions(lambda user_id: _legacy_session(), count)
+    compact = _measure_sessions(UserSession, count)
+    print(f"📦 {count} sessions: dict {legacy:.0f} B/session, UserSession {compact:.0f} B/session "
+          f"({legacy / compact:.1f}x less)")
+
+    # Волна /start вдвое больше предела: хранилище не растет сверх max_sessions
+    manager = SessionManager(max_sessions=count // 2)
+    tracemalloc.start()
+    started = time.perf_counter()
+    for user_id in range(count):
+        manager.create_session(user_id)
+    elapsed = time.perf_counter() - started
+    traced = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    stats = manager.stats()
+    print(f"🧹 {count} sessions into {manager.max_sessions} slots: {stats['live']} live, "
+          f"{stats['evicted_lru']} evicted, {elapsed / count * 1_000_000:.2f} µs/session; "
+          f"accounted {stats['bytes'] / stats['live']:.0f} B/session, traced {traced / stats['live']:.0f} B/session")
+
+def _shared_worker(path: str, worker: int, users: int, updates: int, results):
+    """Процесс бота: обновления случайных пользователей, каждое - прочитать, изменить, записать"""
+    manager = SessionManager()
+    backend = SharedSqliteSessionBackend(path)
+    manager.attach_backend(backend)
+    rng = random.Random(worker)
+
+    for _ in range(updates):
+        user_id = rng.randrange(users)
+        # Конфликт - другой процесс успел раньше: повторяем обновление на его версии
+        while True:
+            manager.refresh(user_id)
+            session = manager.ensure_session(user_id)
+            session.current_section = (session.current_section or 0) + 1
+            if manager.commit(user_id):
+                break
+
+    backend.close()
+    results.put(manager.conflicts)
+
+def shared_benchmark(workers: int = 4, users: int = 200, updates: int = 2_000):
+    """Несколько процессов на одной таблице сессий: пропускная способность и отсутствие потерянных записей"""
+    from migrations import migrate
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'sessions_benchmark.db')
+    conn = sqlite3.connect(path)
+    migrate(conn)
+
+    for count in sorted({1, workers}):
+        conn.execute('DELETE FROM sessions')
+        conn.commit()
+
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=_shared_worker, args=(path, worker, users, updates, results))
+            for worker in range(count)
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        conflicts = sum(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        # Каждое обновление увеличило счетчик ровно одной сессии
+        stored = sum(
+            json.loads(data)['current_section'] for (data,) in conn.execute('SELECT data FROM sessions')
+        )
+        print(f"⏱️ {count} workers: {count * updates / elapsed:.0f} upd/s, {conflicts} CAS conflicts, "
+              f"{stored}/{count * updates} updates stored")
+
+    conn.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    # python -m benchmarks.bench_session_manager [количество сессий] - память на одну сессию и вытеснение
+    # python -m benchmarks.bench_session_manager shared [процессов] - общее хранилище сессий в нескольких процессах
+    if len(sys.argv) > 1 and sys.argv[1] == 'shared':
+        shared_benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 4)
+    else:
+        benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,52 @@
+# benchmarks/bench_update_processor.py
+import asyncio
+import random
+import sys
+import time
+from typing import Dict, List
+
+from update_processor import CONCURRENT_UPDATES, UserLocks
+
+async def _simulate(users: int, updates_per_user: int, latency: float, concurrency: int,
+                    serialize: bool) -> float:
+    """Обновления в секунду при обработчике, ждущем Telegram latency секунд"""
+    rng = random.Random(42)
+    user_locks = UserLocks()
+    semaphore = asyncio.Semaphore(concurrency)
+    handled: Dict[int, List[int]] = {user_id: [] for user_id in range(users)}
+
+    # Обновления пользователей перемешаны, как в реальной ленте getUpdates
+    updates = [(user_id, number) for user_id in range(users) for number in range(updates_per_user)]
+    rng.shuffle(updates)
+    updates.sort(key=lambda update: update[1])
+
+    async def handler(user_id: int, number: int):
+        await asyncio.sleep(latency * rng.uniform(0.5, 1.5))
+        handled[user_id].append(number)
+
+    async def process(user_id: int, number: int):
+        async with semaphore:
+            if serialize:
+                async with user_locks.hold(user_id):
+                    await handler(user_id, number)
+            else:
+                await handler(user_id, number)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(process(user_id, number) for user_id, number in updates))
+    elapsed = time.perf_counter() - started
+
+    if serialize and any(numbers != sorted(numbers) for numbers in handled.values()):
+        raise AssertionError("Updates of one user were reordered")
+    return len(updates) / elapsed
+
+def benchmark(users: int = 500, updates_per_user: int = 4, latency: float = 0.02):
+    """Пропускная способность: последовательная обработка против параллельной по пользователям"""
+    sequential = asyncio.run(_simulate(users, updates_per_user, latency, 1, False))
+    concurrent = asyncio.run(_simulate(users, updates_per_user, latency, CONCURRENT_UPDATES, True))
+    print(f"⏱️ {users} users x {updates_per_user} updates, {latency * 1000:.0f} ms per handler: "
+          f"sequential {sequential:.0f} upd/s, per-user serialized x{CONCURRENT_UPDATES} {concurrent:.0f} upd/s")
+
+if __name__ == '__main__':
+    # python -m benchmarks.bench_update_processor [пользователей] - пропускная способность на смоделированных пользователях
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
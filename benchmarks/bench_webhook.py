@@ -0,0 +1,192 @@
+# benchmarks/bench_webhook.py
+import asyncio
+import json
+import random
+import socket
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+import httpx
+from telegram import Update
+from telegram.ext import Application, ContextTypes, MessageHandler, filters
+
+from update_processor import CONCURRENT_UPDATES
+from webhook import PendingUpdateQueue, webhook_settings
+
+SECRET = 'bench-secret'
+
+class _FakeTelegram:
+    """Локальный Bot API для benchmark: выдает обновления через getUpdates или
+    отправляет их на webhook и засекает момент, когда до него доходит ответ бота.
+    delay - задержка сети в одну сторону."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.updates: List[Dict[str, Any]] = []
+        self.created: Dict[int, float] = {}
+        self.replied: Dict[int, float] = {}
+        self.arrived = asyncio.Condition()
+        self.port = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve_connection, '127.0.0.1', 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Запросы бота по одному соединению (keep-alive); тело - form-urlencoded, как шлет PTB"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                target = request_line.split()[1].decode()
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    if name.lower() == 'content-length':
+                        length = int(value)
+                payload = dict(parse_qsl((await reader.readexactly(length)).decode()))
+
+                # Запрос идет до Telegram delay секунд, ответ - еще delay
+                await asyncio.sleep(self.delay)
+                result = await self._call(target.rsplit('/', 1)[-1], payload)
+                await asyncio.sleep(self.delay)
+
+                body = json.dumps({'ok': True, 'result': result}).encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             + f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Бот закрыл соединение или benchmark завершается посреди длинного опроса
+            pass
+        finally:
+            writer.close()
+
+    async def _call(self, endpoint: str, payload: Dict[str, str]) -> Any:
+        if endpoint == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        if endpoint == 'getUpdates':
+            return await self._get_updates(int(payload.get('offset', 0)), float(payload.get('timeout', 0)))
+        if endpoint == 'sendMessage':
+            # Бот отвечает номером обновления
+            self.replied[int(payload['text'])] = time.perf_counter()
+            return _message(int(payload['text']), int(payload['chat_id']), payload['text'])
+        return True  # setWebhook, deleteWebhook
+
+    async def _get_updates(self, offset: int, timeout: float) -> List[Dict[str, Any]]:
+        """Длинный опрос: ждет первое обновление с id не меньше offset"""
+        async with self.arrived:
+            try:
+                await asyncio.wait_for(
+                    self.arrived.wait_for(lambda: self.updates and self.updates[-1]['update_id'] >= offset),
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                return []
+        return [update for update in self.updates if update['update_id'] >= offset][:100]
+
+    async def generate(self, count: int, rate: float, webhook_url: Optional[str] = None):
+        """count обновлений с пуассоновским потоком rate в секунду"""
+        rng = random.Random(42)
+        pushes = []
+        async with httpx.AsyncClient(timeout=30) as client:
+            for update_id in range(1, count + 1):
+                await asyncio.sleep(rng.expovariate(rate))
+                update = {'update_id': update_id, 'message': _message(update_id, update_id, 'ping')}
+                self.created[update_id] = time.perf_counter()
+                async with self.arrived:
+                    self.updates.append(update)
+                    self.arrived.notify_all()
+                if webhook_url:
+                    pushes.append(asyncio.create_task(self._push(client, webhook_url, update)))
+            await asyncio.gather(*pushes)
+
+    async def _push(self, client: httpx.AsyncClient, webhook_url: str, update: Dict[str, Any]):
+        await asyncio.sleep(self.delay)
+        response = await client.post(webhook_url, json=update, headers={'X-Telegram-Bot-Api-Secret-Token': SECRET})
+        if response.status_code != 200:
+            raise AssertionError(f"Webhook answered {response.status_code}")
+
+    def latencies(self) -> List[float]:
+        """Время от появления обновления до получения ответа бота, мс"""
+        return [(self.replied[update_id] - created) * 1000 for update_id, created in self.created.items()]
+
+def _message(message_id: int, chat_id: int, text: str) -> Dict[str, Any]:
+    return {
+        'message_id': message_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+        'text': text
+    }
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def _reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await context.bot.send_message(update.effective_chat.id, str(update.update_id))
+
+async def _measure(mode: str, count: int, rate: float, delay: float) -> List[float]:
+    """Задержки update→reply в режиме polling или webhook: настоящее приложение PTB
+    с очередью PendingUpdateQueue, как в bot.py"""
+    telegram = _FakeTelegram(delay)
+    await telegram.start()
+    application = (
+        Application.builder()
+        .token('1:bench')
+        .base_url(f'http://127.0.0.1:{telegram.port}/bot')
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .update_queue(PendingUpdateQueue())
+        .build()
+    )
+    application.add_handler(MessageHandler(filters.TEXT, _reply))
+
+    async with application:
+        if mode == 'webhook':
+            port = _free_port()
+            await application.updater.start_webhook(
+                **webhook_settings(f'http://127.0.0.1:{port}/telegram', '127.0.0.1', port, SECRET)
+            )
+            webhook_url: Optional[str] = f'http://127.0.0.1:{port}/telegram'
+        else:
+            await application.updater.start_polling(poll_interval=0, timeout=10)
+            webhook_url = None
+        await application.start()
+
+        await telegram.generate(count, rate, webhook_url)
+        while len(telegram.replied) < count:
+            await asyncio.sleep(0.01)
+
+        await application.updater.stop()
+        await application.stop()
+
+    await telegram.stop()
+    return telegram.latencies()
+
+def benchmark(count: int = 500, rate: float = 100.0, delay: float = 0.02):
+    """Задержка от обновления до ответа: long polling против webhook на локальном Bot API"""
+    for mode in ('polling', 'webhook'):
+        latencies = sorted(asyncio.run(_measure(mode, count, rate, delay)))
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"⏱️ {mode}: {count} updates at {rate:.0f}/s, {delay * 1000:.0f} ms one-way: "
+              f"p50 {statistics.median(latencies):.1f} ms, p95 {p95:.1f} ms")
+
+if __name__ == '__main__':
+    # python -m benchmarks.bench_webhook [обновлений] [обновлений в секунду] - задержка polling против webhook
+    benchmark(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 100.0
+    )
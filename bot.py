@@ -1,160 +1,22 @@
-import sqlite3
+import logging
 import os
-import time
-from typing import Dict, Any
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+import sys
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
 
-# Путь к базе данных - исправленный для Replit
-DB_PATH = os.path.join(os.getcwd(), 'clan_bot.db')
-
-# Менеджер сессий
-class SessionManager:
-    def __init__(self):
-        self.sessions: Dict[int, Dict[str, Any]] = {}
-        self.session_timeout = 3600  # 1 час
-        
-    def create_session(self, user_id: int):
-        """Создает новую сессию для пользователя"""
-        self.sessions[user_id] = {
-            'created_at': time.time(),
-            'current_section': None,
-            'current_subsection': None,
-            'current_post_index': 0,
-            'posts': [],
-            'adding_post': None,
-            'creating_section': False,
-            'creating_subsection': None,
-            'editing_section': None,
-            'editing_subsection': None,
-            'editing_post': None,
-            'awaiting_section_name': False,
-            'awaiting_subsection_name': False,
-            'awaiting_post_title': False,
-            'awaiting_post_content': False
-        }
-        return self.sessions[user_id]
-    
-    def get_session(self, user_id: int):
-        """Получает сессию пользователя"""
-        session = self.sessions.get(user_id)
-        if session and time.time() - session['created_at'] > self.session_timeout:
-            del self.sessions[user_id]
-            return None
-        return session
-    
-    def update_session(self, user_id: int, updates: Dict[str, Any]):
-        """Обновляет сессию пользователя"""
-        if user_id in self.sessions:
-            self.sessions[user_id].update(updates)
-            self.sessions[user_id]['created_at'] = time.time()  # Обновляем время
-        else:
-            self.create_session(user_id)
-            self.sessions[user_id].update(updates)
-    
-    def clear_session(self, user_id: int):
-        """Очищает сессию пользователя"""
-        if user_id in self.sessions:
-            del self.sessions[user_id]
-    
-    def clear_adding_data(self, user_id: int):
-        """Очищает данные о добавлении контента"""
-        if user_id in self.sessions:
-            self.sessions[user_id]['adding_post'] = None
-            self.sessions[user_id]['creating_section'] = False
-            self.sessions[user_id]['creating_subsection'] = None
-            self.sessions[user_id]['editing_section'] = None
-            self.sessions[user_id]['editing_subsection'] = None
-            self.sessions[user_id]['editing_post'] = None
-            self.sessions[user_id]['awaiting_section_name'] = False
-            self.sessions[user_id]['awaiting_subsection_name'] = False
-            self.sessions[user_id]['awaiting_post_title'] = False
-            self.sessions[user_id]['awaiting_post_content'] = False
-
-# Глобальный менеджер сессий
-session_manager = SessionManager()
-
-def get_db_connection():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
-
-def init_db():
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Таблица разделов
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sections (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT,
-                created_by INTEGER,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Таблица подразделов
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS subsections (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                section_id INTEGER,
-                name TEXT NOT NULL,
-                description TEXT,
-                created_by INTEGER,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (section_id) REFERENCES sections (id)
-            )
-        ''')
-        
-        # Таблица записей
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS posts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                subsection_id INTEGER,
-                user_id INTEGER,
-                user_name TEXT,
-                title TEXT NOT NULL,
-                content_type TEXT CHECK(content_type IN ('text', 'image', 'link', 'mixed')),
-                content_text TEXT,
-                image_file_id TEXT,
-                link_url TEXT,
-                link_title TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (subsection_id) REFERENCES subsections (id)
-            )
-        ''')
-        
-        # Создаем базовые разделы
-        cursor.execute('''
-            INSERT OR IGNORE INTO sections (id, name, description) 
-            VALUES 
-                (1, '📚 Гайды по игре', 'Полезные гайды и стратегии'),
-                (2, '⚔️ Библиотека сборок', 'Эффективные сборки персонажей'),
-                (3, '📝 Заметки клана', 'Важные объявления и заметки'),
-                (4, '🔗 Полезные ссылки', 'Ссылки на ресурсы и инструменты')
-        ''')
-        
-        # Создаем базовые подразделы
-        cursor.execute('''
-            INSERT OR IGNORE INTO subsections (id, section_id, name, description) 
-            VALUES 
-                (1, 1, '🎯 Основы игры', 'Базовые гайды для новичков'),
-                (2, 1, '🏆 Продвинутые стратегии', 'Стратегии для опытных игроков'),
-                (3, 2, '⚔️ PvP сборки', 'Сборки для арены'),
-                (4, 2, '🐉 PvE сборки', 'Сборки для против боссов'),
-                (5, 3, '📢 Объявления', 'Важные объявления клана'),
-                (6, 3, '💡 Идеи и предложения', 'Предложения по развитию клана'),
-                (7, 4, '🌐 Официальные ресурсы', 'Официальные сайты и соцсети'),
-                (8, 4, '🛠️ Калькуляторы и инструменты', 'Полезные инструменты для игры')
-        ''')
-        
-        conn.commit()
-        conn.close()
-        print(f"✅ Database initialized at: {DB_PATH}")
-        
-    except Exception as e:
-        print(f"❌ Database initialization error: {e}")
-        raise
+from callback_codec import ROUTE_NEXT_POST, ROUTE_PREV_POST, PostNavigation, encode_navigation, is_packed, set_callback_secret
+from callback_router import CallbackRouter
+from content_cache import content_cache
+from database import DB_DELETE_BACKGROUND_THRESHOLD, execute, delete_chunked, shutdown
+from metrics import component_sources, metrics_reporter
+from migrations import init_db
+from render_memory import edit_photo, edit_text
+from repository import fetch_first_posts, fetch_older_posts, fetch_newer_posts, fetch_post, fetch_post_position
+from session_manager import session_manager
+from search import SEARCH_PAGE_SIZE, SEARCH_RANK_LIMIT, search_posts
+from send_scheduler import SendScheduler
+from update_processor import CONCURRENT_UPDATES, PerUserUpdateProcessor
+from webhook import PendingUpdateQueue, run_webhook
 
 # Обработчик ошибок
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -182,13 +44,6 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except:
                 pass
 
-# Безопасное получение данных из кортежа
-def safe_get(data, index, default="Неизвестно"):
-    """Безопасно получает элемент из кортежа по индексу"""
-    if data and len(data) > index:
-        return data[index]
-    return default
-
 # Главное меню
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -198,6 +53,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     keyboard = [
         [InlineKeyboardButton("📚 Просмотреть разделы", callback_data='view_sections')],
+        [InlineKeyboardButton("🔍 Поиск", callback_data='search')],
         [InlineKeyboardButton("➕ Создать раздел", callback_data='create_section')],
         [InlineKeyboardButton("📁 Создать подраздел", callback_data='create_subsection_choose_section')],
         [InlineKeyboardButton("📝 Добавить запись", callback_data='add_post_choose_section')],
@@ -214,7 +70,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=reply_markup
         )
     else:
-        await update.callback_query.edit_message_text(
+        await edit_text(
+            update.callback_query,
             f'🏰 Добро пожаловать, {user.first_name}, в базу знаний клана Sons of Garitos!\n\n'
             'Теперь вы можете создавать разделы, подразделы и добавлять различные типы контента!',
             reply_markup=reply_markup
@@ -236,39 +93,27 @@ async def view_sections(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except:
         pass
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    sections = cursor.execute('SELECT * FROM sections ORDER BY id').fetchall()
-    conn.close()
+    tree = await content_cache.snapshot()
+    sections = tree.sections_with_counts()
     
     if not sections:
-        await query.edit_message_text("Разделы пока не созданы.")
+        await edit_text(query, "Разделы пока не созданы.")
         return
     
     keyboard = []
-    for section in sections:
-        conn = get_db_connection()
-        subs_count = conn.execute('SELECT COUNT(*) FROM subsections WHERE section_id = ?', (section[0],)).fetchone()[0]
-        posts_count = conn.execute('''
-            SELECT COUNT(*) FROM posts p 
-            JOIN subsections s ON p.subsection_id = s.id 
-            WHERE s.section_id = ?
-        ''', (section[0],)).fetchone()[0]
-        conn.close()
-        
-        section_name = safe_get(section, 1, "Без названия")
+    for section, subs_count, posts_count in sections:
         keyboard.append([InlineKeyboardButton(
-            f"{section_name} ({subs_count} подраз., {posts_count} зап.)", 
-            callback_data=f"view_section_{section[0]}"
+            f"{section.name} ({subs_count} подраз., {posts_count} зап.)", 
+            callback_data=f"view_section_{section.id}"
         )])
     
     keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data='back_to_main')])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text("📂 Выберите раздел:", reply_markup=reply_markup)
+    await edit_text(query, "📂 Выберите раздел:", reply_markup=reply_markup)
 
 # Просмотр подразделов в разделе
-async def view_subsections(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def view_subsections(update: Update, context: ContextTypes.DEFAULT_TYPE, section_id: int):
     query = update.callback_query
     user_id = update.effective_user.id
     
@@ -283,26 +128,18 @@ async def view_subsections(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except:
         pass
     
-    section_id = int(query.data.split('_')[-1])
-    
     # Обновляем сессию
     session_manager.update_session(user_id, {'current_section': section_id})
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    section = cursor.execute('SELECT * FROM sections WHERE id = ?', (section_id,)).fetchone()
-    subsections = cursor.execute(
-        'SELECT * FROM subsections WHERE section_id = ? ORDER BY id', 
-        (section_id,)
-    ).fetchall()
-    conn.close()
+    tree = await content_cache.snapshot()
+    section = tree.section(section_id)
+    subsections = tree.subsections_with_counts(section_id)
     
     if not section:
-        await query.edit_message_text("❌ Раздел не найден!")
+        await edit_text(query, "❌ Раздел не найден!")
         return
     
-    section_name = safe_get(section, 1, "Без названия")
+    section_name = section.name
     
     if not subsections:
         keyboard = [
@@ -314,7 +151,8 @@ async def view_subsections(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await query.edit_message_text(
+        await edit_text(
+            query,
             f"В разделе '{section_name}' пока нет подразделов.\n\n"
             f"Создайте первый подраздел!",
             reply_markup=reply_markup
@@ -322,15 +160,10 @@ async def view_subsections(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     keyboard = []
-    for subsection in subsections:
-        conn = get_db_connection()
-        posts_count = conn.execute('SELECT COUNT(*) FROM posts WHERE subsection_id = ?', (subsection[0],)).fetchone()[0]
-        conn.close()
-        
-        subsection_name = safe_get(subsection, 2, "Без названия")
+    for subsection, posts_count in subsections:
         keyboard.append([InlineKeyboardButton(
-            f"{subsection_name} ({posts_count} зап.)", 
-            callback_data=f"view_subsection_{subsection[0]}"
+            f"{subsection.name} ({posts_count} зап.)", 
+            callback_data=f"view_subsection_{subsection.id}"
         )])
     
     keyboard.extend([
@@ -343,14 +176,15 @@ async def view_subsections(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text(
+    await edit_text(
+        query,
         f"📁 Раздел: {section_name}\n\n"
         f"Выберите подраздел:",
         reply_markup=reply_markup
     )
 
 # Просмотр записей в подразделе
-async def view_subsection_posts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def view_subsection_posts(update: Update, context: ContextTypes.DEFAULT_TYPE, subsection_id: int):
     query = update.callback_query
     user_id = update.effective_user.id
     
@@ -365,51 +199,35 @@ async def view_subsection_posts(update: Update, context: ContextTypes.DEFAULT_TY
     except:
         pass
     
-    subsection_id = int(query.data.split('_')[-1])
-    
-    # Обновляем сессию пользователя
-    session_manager.update_session(user_id, {
-        'current_subsection': subsection_id,
-        'current_post_index': 0
-    })
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    subsection = cursor.execute('SELECT * FROM subsections WHERE id = ?', (subsection_id,)).fetchone()
+    tree = await content_cache.snapshot()
+    subsection = tree.subsection(subsection_id)
     if not subsection:
-        await query.edit_message_text("❌ Подраздел не найден!")
-        conn.close()
+        await edit_text(query, "❌ Подраздел не найден!")
         return
     
-    section = cursor.execute('SELECT * FROM sections WHERE id = ?', (subsection[1],)).fetchone()
-    posts = cursor.execute(
-        'SELECT * FROM posts WHERE subsection_id = ? ORDER BY created_at DESC', 
-        (subsection_id,)
-    ).fetchall()
-    conn.close()
+    section = tree.section(subsection.section_id)
+    # Загружаем только первую запись (и признак следующей), а не весь подраздел
+    posts = await fetch_first_posts(subsection_id)
     
     if not section:
-        await query.edit_message_text("❌ Раздел не найден!")
+        await edit_text(query, "❌ Раздел не найден!")
         return
     
-    section_name = safe_get(section, 1, "Без названия")
-    subsection_name = safe_get(subsection, 2, "Без названия")
-    
-    # Сохраняем посты в сессии пользователя
-    session_manager.update_session(user_id, {'posts': posts})
+    section_name = section.name
+    subsection_name = subsection.name
     
     if not posts:
         keyboard = [
             [InlineKeyboardButton("📝 Добавить запись", callback_data=f"add_post_{subsection_id}")],
             [InlineKeyboardButton("✏️ Редактировать подраздел", callback_data=f"edit_subsection_{subsection_id}")],
             [InlineKeyboardButton("🗑️ Удалить подраздел", callback_data=f"delete_subsection_{subsection_id}")],
-            [InlineKeyboardButton("📁 К подразделам", callback_data=f"view_section_{section[0]}")],
+            [InlineKeyboardButton("📁 К подразделам", callback_data=f"view_section_{section.id}")],
             [InlineKeyboardButton("🏠 Главное меню", callback_data='back_to_main')]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await query.edit_message_text(
+        await edit_text(
+            query,
             f"📁 Раздел: {section_name}\n"
             f"📂 Подраздел: {subsection_name}\n\n"
             f"Записей пока нет.\n\n"
@@ -418,21 +236,25 @@ async def view_subsection_posts(update: Update, context: ContextTypes.DEFAULT_TY
         )
         return
     
+    post = posts[0]
+    total = tree.post_count(subsection_id)
+    
     # Показываем первую запись с навигацией
-    await show_post(update, context, subsection, section, posts[0], 0, len(posts))
+    await show_post(update, context, subsection, section, post, 0, total, False, len(posts) > 1)
 
-async def show_post(update: Update, context: ContextTypes.DEFAULT_TYPE, subsection, section, post, index, total):
+async def show_post(update: Update, context: ContextTypes.DEFAULT_TYPE, subsection, section, post, index, total,
+                    has_prev, has_next):
     query = update.callback_query
     
     # Формируем текст записи
-    section_name = safe_get(section, 1, "Без названия")
-    subsection_name = safe_get(subsection, 2, "Без названия")
-    post_title = safe_get(post, 4, "Без заголовка")
-    post_content = safe_get(post, 6, "")
-    post_author = safe_get(post, 3, "Неизвестно")
-    post_date = safe_get(post, 10, "")
-    link_url = safe_get(post, 8, "")
-    link_title = safe_get(post, 9, "")
+    section_name = section.name
+    subsection_name = subsection.name
+    post_title = post.title
+    post_content = post.content_text
+    post_author = post.user_name or "Неизвестно"
+    post_date = post.created_at
+    link_url = post.link_url
+    link_title = post.link_title
     
     post_text = f"📁 {section_name} → {subsection_name}\n\n"
     post_text += f"📌 {post_title}\n\n"
@@ -452,41 +274,93 @@ async def show_post(update: Update, context: ContextTypes.DEFAULT_TYPE, subsecti
     
     # Навигация по записям
     nav_buttons = []
-    if index > 0:
-        nav_buttons.append(InlineKeyboardButton("⬅️ Предыдущая", callback_data=f"prev_post_{index}"))
-    if index < total - 1:
-        nav_buttons.append(InlineKeyboardButton("Следующая ➡️", callback_data=f"next_post_{index}"))
+    if has_prev:
+        prev_data = encode_navigation(ROUTE_PREV_POST, subsection.id, index, post.cursor)
+        nav_buttons.append(InlineKeyboardButton("⬅️ Предыдущая", callback_data=prev_data))
+    if has_next:
+        next_data = encode_navigation(ROUTE_NEXT_POST, subsection.id, index, post.cursor)
+        nav_buttons.append(InlineKeyboardButton("Следующая ➡️", callback_data=next_data))
     if nav_buttons:
         keyboard.append(nav_buttons)
     
     # Действия с записью
     keyboard.extend([
-        [InlineKeyboardButton("✏️ Редактировать запись", callback_data=f"edit_post_{post[0]}")],
-        [InlineKeyboardButton("🗑️ Удалить запись", callback_data=f"delete_post_{post[0]}")],
-        [InlineKeyboardButton("📝 Добавить запись", callback_data=f"add_post_{subsection[0]}")],
-        [InlineKeyboardButton("✏️ Редактировать подраздел", callback_data=f"edit_subsection_{subsection[0]}")],
-        [InlineKeyboardButton("🗑️ Удалить подраздел", callback_data=f"delete_subsection_{subsection[0]}")],
-        [InlineKeyboardButton("📂 К подразделам", callback_data=f"view_section_{section[0]}")],
+        [InlineKeyboardButton("✏️ Редактировать запись", callback_data=f"edit_post_{post.id}")],
+        [InlineKeyboardButton("🗑️ Удалить запись", callback_data=f"delete_post_{post.id}")],
+        [InlineKeyboardButton("📝 Добавить запись", callback_data=f"add_post_{subsection.id}")],
+        [InlineKeyboardButton("✏️ Редактировать подраздел", callback_data=f"edit_subsection_{subsection.id}")],
+        [InlineKeyboardButton("🗑️ Удалить подраздел", callback_data=f"delete_subsection_{subsection.id}")],
+        [InlineKeyboardButton("📂 К подразделам", callback_data=f"view_section_{section.id}")],
         [InlineKeyboardButton("🏠 Главное меню", callback_data='back_to_main')]
     ])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    # Если есть изображение, отправляем его с текстом
-    image_file_id = safe_get(post, 7, "")
+    # Если есть изображение, отправляем его с текстом; текстовое сообщение
+    # заменяется фото (и наоборот) сразу, без заведомо неудачной правки
+    image_file_id = post.image_file_id
     if image_file_id:
-        try:
-            await query.edit_message_media(
-                media=InputMediaPhoto(media=image_file_id, caption=post_text),
-                reply_markup=reply_markup
-            )
-        except:
-            await query.edit_message_text(post_text, reply_markup=reply_markup)
+        await edit_photo(query, image_file_id, post_text, reply_markup=reply_markup)
+    else:
+        await edit_text(query, post_text, reply_markup=reply_markup)
+
+# Навигация по записям: подраздел и курсор текущей записи приходят в самой кнопке,
+# поэтому переход работает без сессии, в том числе после перезапуска бота
+async def navigate_posts(update: Update, context: ContextTypes.DEFAULT_TYPE, navigation: PostNavigation):
+    query = update.callback_query
+    
+    try:
+        await query.answer()
+    except:
+        pass
+    
+    subsection_id = navigation.subsection_id
+    action = 'prev' if navigation.route == ROUTE_PREV_POST else 'next'
+    
+    tree = await content_cache.snapshot()
+    subsection = tree.subsection(subsection_id)
+    section = tree.section(subsection.section_id) if subsection else None
+    if not subsection or not section:
+        await edit_text(query, "❌ Подраздел не найден!")
+        return
+    
+    # Соседнюю запись ищем от курсора, поэтому добавление и удаление записей
+    # другими участниками не сбивает навигацию
+    if action == 'prev':
+        posts = await fetch_newer_posts(subsection_id, navigation.cursor)
+        new_index = navigation.index - 1
+    else:  # next
+        posts = await fetch_older_posts(subsection_id, navigation.cursor)
+        new_index = navigation.index + 1
+    
+    if not posts:
+        # Соседние записи удалены - возвращаемся к началу подраздела
+        posts = await fetch_first_posts(subsection_id)
+        action, new_index = 'first', 0
+        if not posts:
+            await edit_text(query, "❌ Записи не найдены!")
+            return
+    
+    post = posts[0]
+    total = tree.post_count(subsection_id)
+    has_more = len(posts) > 1
+    
+    if action == 'prev':
+        has_prev, has_next = has_more, True
+        if not has_prev:
+            new_index = 0
+    elif action == 'next':
+        has_prev, has_next = True, has_more
+        if not has_next:
+            new_index = total - 1
     else:
-        await query.edit_message_text(post_text, reply_markup=reply_markup)
+        has_prev, has_next = False, has_more
+    new_index = max(0, min(new_index, total - 1))
+    
+    await show_post(update, context, subsection, section, post, new_index, total, has_prev, has_next)
 
-# Навигация по записям
-async def navigate_posts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# Поиск по записям
+async def search_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user_id = update.effective_user.id
     
@@ -501,25 +375,120 @@ async def navigate_posts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except:
         pass
     
-    action, index = query.data.split('_')[0], int(query.data.split('_')[-1])
+    session_manager.clear_adding_data(user_id)
+    session_manager.update_session(user_id, {'awaiting_search_query': True})
     
-    subsection_id = session['current_subsection']
-    posts = session['posts']
+    keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data='back_to_main')]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    subsection = cursor.execute('SELECT * FROM subsections WHERE id = ?', (subsection_id,)).fetchone()
-    section = cursor.execute('SELECT * FROM sections WHERE id = ?', (subsection[1],)).fetchone()
-    conn.close()
+    await edit_text(query, "🔍 Введите слова для поиска по записям:", reply_markup=reply_markup)
+
+# Команда /search <запрос>
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    text = ' '.join(context.args)
     
-    if action == 'prev':
-        new_index = index - 1
-    else:  # next
-        new_index = index + 1
+    session_manager.clear_adding_data(user_id)
+    if not text:
+        session_manager.update_session(user_id, {'awaiting_search_query': True})
+        await update.message.reply_text("🔍 Введите слова для поиска по записям:")
+        return
+    
+    session_manager.update_session(user_id, {'search_query': text})
+    await show_search_results(update, context, text, 0)
+
+async def show_search_results(update: Update, context: ContextTypes.DEFAULT_TYPE, text, page):
+    results, has_next, truncated = await search_posts(text, page)
+    tree = await content_cache.snapshot()
+    
+    keyboard = []
+    if not results:
+        result_text = f"🔍 По запросу «{text}» ничего не найдено."
+    else:
+        result_text = f"🔍 Результаты по запросу «{text}» (стр. {page + 1}):\n\n"
+        if truncated:
+            result_text += f"⚠️ Совпадений больше {SEARCH_RANK_LIMIT}: показаны лучшие среди самых новых. Уточните запрос.\n\n"
+        for number, (post_id, subsection_id, title, preview) in enumerate(results, start=page * SEARCH_PAGE_SIZE + 1):
+            subsection = tree.subsection(subsection_id)
+            subsection_name = subsection.name if subsection else "Без названия"
+            result_text += f"{number}. 📌 {title}\n📂 {subsection_name}\n"
+            if preview:
+                result_text += f"{preview}…\n"
+            result_text += "\n"
+            keyboard.append([InlineKeyboardButton(f"{number}. {title}", callback_data=f"search_open_{post_id}")])
+    
+    # Постраничная навигация по результатам
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"search_page_{page - 1}"))
+    if has_next:
+        nav_buttons.append(InlineKeyboardButton("Далее ➡️", callback_data=f"search_page_{page + 1}"))
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+    
+    keyboard.extend([
+        [InlineKeyboardButton("🔍 Новый поиск", callback_data='search')],
+        [InlineKeyboardButton("🏠 Главное меню", callback_data='back_to_main')]
+    ])
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    if update.callback_query:
+        await edit_text(update.callback_query, result_text, reply_markup=reply_markup)
+    else:
+        await update.message.reply_text(result_text, reply_markup=reply_markup)
+
+# Страница результатов поиска
+async def search_page(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int):
+    query = update.callback_query
+    user_id = update.effective_user.id
+    
+    # Проверяем сессию
+    session = session_manager.get_session(user_id)
+    if not session or not session.search_query:
+        await query.answer("❌ Сессия устарела. Используйте /start")
+        return
+    
+    try:
+        await query.answer()
+    except:
+        pass
     
-    # Обновляем индекс в сессии
-    session_manager.update_session(user_id, {'current_post_index': new_index})
-    await show_post(update, context, subsection, section, posts[new_index], new_index, len(posts))
+    await show_search_results(update, context, session.search_query, page)
+
+# Переход к записи из результатов поиска
+async def open_search_result(update: Update, context: ContextTypes.DEFAULT_TYPE, post_id: int):
+    query = update.callback_query
+    user_id = update.effective_user.id
+    
+    # Проверяем сессию
+    session = session_manager.get_session(user_id)
+    if not session:
+        await query.answer("❌ Сессия устарела. Используйте /start")
+        return
+    
+    try:
+        await query.answer()
+    except:
+        pass
+    
+    post = await fetch_post(post_id)
+    if not post:
+        await edit_text(query, "❌ Запись не найдена!")
+        return
+    
+    tree = await content_cache.snapshot()
+    subsection = tree.subsection(post.subsection_id)
+    section = tree.section(subsection.section_id) if subsection else None
+    if not subsection or not section:
+        await edit_text(query, "❌ Подраздел не найден!")
+        return
+    
+    # Открываем запись в ленте ее подраздела, чтобы дальше работала обычная навигация
+    index = await fetch_post_position(post)
+    total = tree.post_count(post.subsection_id)
+    index = min(index, total - 1)
+    
+    await show_post(update, context, subsection, section, post, index, total, index > 0, index < total - 1)
 
 # Выбор раздела для создания подраздела
 async def create_subsection_choose_section(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -537,25 +506,24 @@ async def create_subsection_choose_section(update: Update, context: ContextTypes
     except:
         pass
     
-    conn = get_db_connection()
-    sections = conn.execute('SELECT * FROM sections ORDER BY id').fetchall()
-    conn.close()
+    tree = await content_cache.snapshot()
+    sections = tree.sections()
     
     keyboard = []
     for section in sections:
-        section_name = safe_get(section, 1, "Без названия")
+        section_name = section.name
         keyboard.append([InlineKeyboardButton(
             section_name, 
-            callback_data=f"create_subsection_{section[0]}"
+            callback_data=f"create_subsection_{section.id}"
         )])
     
     keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data='back_to_main')])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text("📁 **Создание подраздела**\n\nВыберите раздел:", reply_markup=reply_markup)
+    await edit_text(query, "📁 **Создание подраздела**\n\nВыберите раздел:", reply_markup=reply_markup)
 
 # Создание подраздела
-async def create_subsection(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def create_subsection(update: Update, context: ContextTypes.DEFAULT_TYPE, section_id: int):
     query = update.callback_query
     user_id = update.effective_user.id
     
@@ -570,26 +538,23 @@ async def create_subsection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except:
         pass
     
-    section_id = int(query.data.split('_')[-1])
-    
     # Обновляем сессию
     session_manager.update_session(user_id, {
         'creating_subsection': {'section_id': section_id},
         'awaiting_subsection_name': True
     })
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    section = cursor.execute('SELECT * FROM sections WHERE id = ?', (section_id,)).fetchone()
-    conn.close()
+    tree = await content_cache.snapshot()
+    section = tree.section(section_id)
     
     if not section:
-        await query.edit_message_text("❌ Раздел не найден!")
+        await edit_text(query, "❌ Раздел не найден!")
         return
     
-    section_name = safe_get(section, 1, "Без названия")
+    section_name = section.name
     
-    await query.edit_message_text(
+    await edit_text(
+        query,
         f"📁 **Создание подраздела в разделе:** {section_name}\n\n"
         "Введите название для нового подраздела:"
     )
@@ -610,25 +575,24 @@ async def add_post_choose_section(update: Update, context: ContextTypes.DEFAULT_
     except:
         pass
     
-    conn = get_db_connection()
-    sections = conn.execute('SELECT * FROM sections ORDER BY id').fetchall()
-    conn.close()
+    tree = await content_cache.snapshot()
+    sections = tree.sections()
     
     keyboard = []
     for section in sections:
-        section_name = safe_get(section, 1, "Без названия")
+        section_name = section.name
         keyboard.append([InlineKeyboardButton(
             section_name, 
-            callback_data=f"add_post_choose_subsection_{section[0]}"
+            callback_data=f"add_post_choose_subsection_{section.id}"
         )])
     
     keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data='back_to_main')])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text("📝 **Добавление записи**\n\nВыберите раздел:", reply_markup=reply_markup)
+    await edit_text(query, "📝 **Добавление записи**\n\nВыберите раздел:", reply_markup=reply_markup)
 
 # Выбор подраздела для добавления записи
-async def add_post_choose_subsection(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def add_post_choose_subsection(update: Update, context: ContextTypes.DEFAULT_TYPE, section_id: int):
     query = update.callback_query
     user_id = update.effective_user.id
     
@@ -643,43 +607,42 @@ async def add_post_choose_subsection(update: Update, context: ContextTypes.DEFAU
     except:
         pass
     
-    section_id = int(query.data.split('_')[-1])
-    
-    conn = get_db_connection()
-    subsections = conn.execute('SELECT * FROM subsections WHERE section_id = ? ORDER BY id', (section_id,)).fetchall()
-    section = conn.execute('SELECT * FROM sections WHERE id = ?', (section_id,)).fetchone()
-    conn.close()
+    tree = await content_cache.snapshot()
+    subsections = tree.subsections(section_id)
+    section = tree.section(section_id)
     
     if not section:
-        await query.edit_message_text("❌ Раздел не найден!")
+        await edit_text(query, "❌ Раздел не найден!")
         return
     
-    section_name = safe_get(section, 1, "Без названия")
+    section_name = section.name
     
     if not subsections:
-        await query.edit_message_text(
+        await edit_text(
+            query,
             f"В разделе '{section_name}' нет подразделов. Сначала создайте подраздел."
         )
         return
     
     keyboard = []
     for subsection in subsections:
-        subsection_name = safe_get(subsection, 2, "Без названия")
+        subsection_name = subsection.name
         keyboard.append([InlineKeyboardButton(
             subsection_name, 
-            callback_data=f"add_post_{subsection[0]}"
+            callback_data=f"add_post_{subsection.id}"
         )])
     
     keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data='add_post_choose_section')])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text(
+    await edit_text(
+        query,
         f"📝 **Добавление записи в раздел:** {section_name}\n\nВыберите подраздел:",
         reply_markup=reply_markup
     )
 
 # Начало добавления записи
-async def add_post_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def add_post_start(update: Update, context: ContextTypes.DEFAULT_TYPE, subsection_id: int):
     query = update.callback_query
     user_id = update.effective_user.id
     
@@ -694,8 +657,6 @@ async def add_post_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except:
         pass
     
-    subsection_id = int(query.data.split('_')[-1])
-    
     # Обновляем сессию
     session_manager.update_session(user_id, {
         'adding_post': {
@@ -704,30 +665,27 @@ async def add_post_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         }
     })
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     # Получаем данные подраздела
-    subsection = cursor.execute('SELECT * FROM subsections WHERE id = ?', (subsection_id,)).fetchone()
+    tree = await content_cache.snapshot()
+    subsection = tree.subsection(subsection_id)
     
     if not subsection:
-        await query.edit_message_text("❌ Подраздел не найден!")
-        conn.close()
+        await edit_text(query, "❌ Подраздел не найден!")
         return
     
     # Получаем данные раздела
-    section = cursor.execute('SELECT * FROM sections WHERE id = ?', (subsection[1],)).fetchone()
-    conn.close()
+    section = tree.section(subsection.section_id)
     
     if not section:
-        await query.edit_message_text("❌ Раздел не найден!")
+        await edit_text(query, "❌ Раздел не найден!")
         return
     
     # Безопасно получаем названия
-    section_name = safe_get(section, 1, "Без названия")
-    subsection_name = safe_get(subsection, 2, "Без названия")
+    section_name = section.name
+    subsection_name = subsection.name
     
-    await query.edit_message_text(
+    await edit_text(
+        query,
         f"📝 **Добавление записи**\n\n"
         f"📁 Раздел: {section_name}\n"
         f"📂 Подраздел: {subsection_name}\n\n"
@@ -756,7 +714,8 @@ async def create_section(update: Update, context: ContextTypes.DEFAULT_TYPE):
         'awaiting_section_name': True
     })
     
-    await query.edit_message_text(
+    await edit_text(
+        query,
         "➕ **Создание раздела**\n\n"
         "Введите название для нового раздела:"
     )
@@ -786,7 +745,7 @@ async def manage_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text("⚙️ **Управление контентом**\n\nВыберите что хотите управлять:", reply_markup=reply_markup)
+    await edit_text(query, "⚙️ **Управление контентом**\n\nВыберите что хотите управлять:", reply_markup=reply_markup)
 
 # Управление разделами
 async def manage_sections(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -804,39 +763,42 @@ async def manage_sections(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except:
         pass
     
-    conn = get_db_connection()
-    sections = conn.execute('SELECT * FROM sections ORDER BY id').fetchall()
-    conn.close()
+    tree = await content_cache.snapshot()
+    sections = [section for section in tree.sections() if section.id not in _deleting_sections]
+    deleting = [section.name for section in tree.sections() if section.id in _deleting_sections]
     
-    if not sections:
+    if not sections and not deleting:
         keyboard = [
             [InlineKeyboardButton("➕ Создать раздел", callback_data='create_section')],
             [InlineKeyboardButton("◀️ Назад", callback_data='manage_content')]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text("Разделы пока не созданы.", reply_markup=reply_markup)
+        await edit_text(query, "Разделы пока не созданы.", reply_markup=reply_markup)
         return
     
     keyboard = []
     for section in sections:
-        section_name = safe_get(section, 1, "Без названия")
+        section_name = section.name
         keyboard.append([InlineKeyboardButton(
             f"✏️ {section_name}", 
-            callback_data=f"edit_section_{section[0]}"
+            callback_data=f"edit_section_{section.id}"
         )])
         keyboard.append([InlineKeyboardButton(
             f"🗑️ Удалить {section_name}", 
-            callback_data=f"delete_section_{section[0]}"
+            callback_data=f"delete_section_{section.id}"
         )])
     
     keyboard.append([InlineKeyboardButton("➕ Создать раздел", callback_data='create_section')])
     keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data='manage_content')])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text("📚 **Управление разделами**\n\nВыберите раздел для редактирования или удаления:", reply_markup=reply_markup)
+    text = "📚 **Управление разделами**\n\nВыберите раздел для редактирования или удаления:"
+    if deleting:
+        text += "\n\n⏳ Удаляются в фоне: " + ", ".join(deleting)
+    await edit_text(query, text, reply_markup=reply_markup)
 
 # Редактирование раздела
-async def edit_section(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def edit_section(update: Update, context: ContextTypes.DEFAULT_TYPE, section_id: int):
     query = update.callback_query
     user_id = update.effective_user.id
     
@@ -851,26 +813,24 @@ async def edit_section(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except:
         pass
     
-    section_id = int(query.data.split('_')[-1])
-    
     # Обновляем сессию
     session_manager.update_session(user_id, {
         'editing_section': section_id,
         'awaiting_section_name': True
     })
     
-    conn = get_db_connection()
-    section = conn.execute('SELECT * FROM sections WHERE id = ?', (section_id,)).fetchone()
-    conn.close()
+    tree = await content_cache.snapshot()
+    section = tree.section(section_id)
     
     if not section:
-        await query.edit_message_text("❌ Раздел не найден!")
+        await edit_text(query, "❌ Раздел не найден!")
         return
     
-    section_name = safe_get(section, 1, "Без названия")
-    section_description = safe_get(section, 2, "нет")
+    section_name = section.name
+    section_description = section.description or "нет"
     
-    await query.edit_message_text(
+    await edit_text(
+        query,
         f"✏️ **Редактирование раздела**\n\n"
         f"Текущее название: {section_name}\n"
         f"Текущее описание: {section_description}\n\n"
@@ -878,7 +838,7 @@ async def edit_section(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 # Удаление раздела
-async def delete_section(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def delete_section(update: Update, context: ContextTypes.DEFAULT_TYPE, section_id: int):
     query = update.callback_query
     user_id = update.effective_user.id
     
@@ -893,48 +853,66 @@ async def delete_section(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except:
         pass
     
-    section_id = int(query.data.split('_')[-1])
-    
-    conn = get_db_connection()
-    section = conn.execute('SELECT * FROM sections WHERE id = ?', (section_id,)).fetchone()
+    tree = await content_cache.snapshot()
+    section = tree.section(section_id)
     
     if not section:
-        await query.edit_message_text("❌ Раздел не найден!")
-        conn.close()
+        await edit_text(query, "❌ Раздел не найден!")
         return
     
-    section_name = safe_get(section, 1, "Без названия")
+    section_name = section.name
+    
+    if section_id in _deleting_sections:
+        await _show_deleting_section(query, section_name)
+        return
     
-    # Проверяем есть ли подразделы
-    subs_count = conn.execute('SELECT COUNT(*) FROM subsections WHERE section_id = ?', (section_id,)).fetchone()[0]
+    # Раздел удаляется только после подтверждения, даже пустой
+    subs_count = len(tree.subsections(section_id))
     
     if subs_count > 0:
-        conn.close()
         keyboard = [
             [InlineKeyboardButton("✅ Да, удалить всё", callback_data=f"confirm_delete_section_{section_id}")],
             [InlineKeyboardButton("❌ Нет, отмена", callback_data='manage_sections')]
         ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(
+        confirm_text = (
             f"⚠️ **Удаление раздела**\n\n"
             f"Раздел '{section_name}' содержит {subs_count} подразделов.\n"
             f"Все подразделы и записи в них будут также удалены!\n\n"
-            f"Вы уверены что хотите удалить раздел?",
-            reply_markup=reply_markup
+            f"Вы уверены что хотите удалить раздел?"
+        )
+    else:
+        keyboard = [
+            [InlineKeyboardButton("✅ Да, удалить", callback_data=f"confirm_delete_section_{section_id}")],
+            [InlineKeyboardButton("❌ Нет, отмена", callback_data='manage_sections')]
+        ]
+        confirm_text = (
+            f"⚠️ **Удаление раздела**\n\n"
+            f"Раздел '{section_name}' пуст.\n\n"
+            f"Вы уверены что хотите удалить раздел?"
         )
-        return
-    
-    # Удаляем раздел если нет подразделов
-    conn.execute('DELETE FROM sections WHERE id = ?', (section_id,))
-    conn.commit()
-    conn.close()
     
-    await query.edit_message_text(f"✅ Раздел '{section_name}' успешно удален!")
-    await manage_sections(update, context)
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await edit_text(query, confirm_text, reply_markup=reply_markup)
+
+# Разделы, которые удаляются в фоне в этом процессе: они скрыты из списка разделов,
+# и повторное удаление для них не запускается
+_deleting_sections = set()
+
+async def _show_deleting_section(query, section_name):
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data='manage_sections')]]
+    await edit_text(query, f"⏳ Раздел '{section_name}' уже удаляется в фоне.", reply_markup=InlineKeyboardMarkup(keyboard))
+
+async def _delete_section_in_background(section_id: int):
+    """Удаляет записи большого раздела пачками, затем сам раздел"""
+    try:
+        await delete_chunked('posts', 'subsection_id IN (SELECT id FROM subsections WHERE section_id = ?)', (section_id,))
+        await execute('DELETE FROM sections WHERE id = ?', (section_id,))
+        content_cache.invalidate()
+    finally:
+        _deleting_sections.discard(section_id)
 
 # Подтверждение удаления раздела
-async def confirm_delete_section(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def confirm_delete_section(update: Update, context: ContextTypes.DEFAULT_TYPE, section_id: int):
     query = update.callback_query
     user_id = update.effective_user.id
     
@@ -949,29 +927,37 @@ async def confirm_delete_section(update: Update, context: ContextTypes.DEFAULT_T
     except:
         pass
     
-    section_id = int(query.data.split('_')[-1])
-    
-    conn = get_db_connection()
-    section = conn.execute('SELECT * FROM sections WHERE id = ?', (section_id,)).fetchone()
+    tree = await content_cache.snapshot()
+    section = tree.section(section_id)
     
     if not section:
-        await query.edit_message_text("❌ Раздел не найден!")
-        conn.close()
+        await edit_text(query, "❌ Раздел не найден!")
         return
     
-    section_name = safe_get(section, 1, "Без названия")
+    section_name = section.name
+    posts_count = sum(tree.post_count(subsection.id) for subsection in tree.subsections(section_id))
     
-    # Удаляем все связанные записи и подразделы
-    subsections = conn.execute('SELECT id FROM subsections WHERE section_id = ?', (section_id,)).fetchall()
-    for subsection in subsections:
-        conn.execute('DELETE FROM posts WHERE subsection_id = ?', (subsection[0],))
+    # Повторное подтверждение (вторая кнопка, двойное нажатие) не запускает второе удаление
+    if section_id in _deleting_sections:
+        await _show_deleting_section(query, section_name)
+        return
+    
+    if posts_count > DB_DELETE_BACKGROUND_THRESHOLD:
+        # Крупный раздел удаляется пачками, не блокируя запись для остальных участников
+        _deleting_sections.add(section_id)
+        context.application.create_task(_delete_section_in_background(section_id), update=update)
+        await edit_text(
+            query,
+            f"⏳ Раздел '{section_name}' содержит {posts_count} записей и будет удален в фоне."
+        )
+        await manage_sections(update, context)
+        return
     
-    conn.execute('DELETE FROM subsections WHERE section_id = ?', (section_id,))
-    conn.execute('DELETE FROM sections WHERE id = ?', (section_id,))
-    conn.commit()
-    conn.close()
+    # Подразделы и записи удаляются каскадно в том же запросе
+    await execute('DELETE FROM sections WHERE id = ?', (section_id,))
+    content_cache.invalidate()
     
-    await query.edit_message_text(f"✅ Раздел '{section_name}' и все его содержимое успешно удалены!")
+    await edit_text(query, f"✅ Раздел '{section_name}' и все его содержимое успешно удалены!")
     await manage_sections(update, context)
 
 # Обработка текстовых сообщений
@@ -985,67 +971,62 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user = update.effective_user
     
-    if session.get('awaiting_subsection_name'):
+    if session.awaiting_search_query:
+        search_query = update.message.text
+        session_manager.update_session(user_id, {'awaiting_search_query': False, 'search_query': search_query})
+        await show_search_results(update, context, search_query, 0)
+    
+    elif session.awaiting_subsection_name:
         subsection_name = update.message.text
         
-        if session.get('editing_subsection'):
+        if session.editing_subsection:
             # Редактирование существующего подраздела
-            subsection_id = session['editing_subsection']
-            conn = get_db_connection()
-            conn.execute('UPDATE subsections SET name = ? WHERE id = ?', (subsection_name, subsection_id))
-            conn.commit()
-            conn.close()
+            subsection_id = session.editing_subsection
+            await execute('UPDATE subsections SET name = ? WHERE id = ?', (subsection_name, subsection_id))
+            content_cache.invalidate()
             
             session_manager.clear_adding_data(user_id)
             await update.message.reply_text(f"✅ Подраздел '{subsection_name}' успешно обновлен!")
         else:
             # Создание нового подраздела
-            section_id = session['creating_subsection']['section_id']
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
+            section_id = session.creating_subsection['section_id']
+            await execute(
                 'INSERT INTO subsections (section_id, name, description, created_by) VALUES (?, ?, ?, ?)',
                 (section_id, subsection_name, "Описание подраздела", user.id)
             )
-            conn.commit()
-            conn.close()
+            content_cache.invalidate()
             
             session_manager.clear_adding_data(user_id)
             await update.message.reply_text(f"✅ Подраздел '{subsection_name}' успешно создан!")
         
         await start(update, context)
     
-    elif session.get('awaiting_section_name'):
+    elif session.awaiting_section_name:
         section_name = update.message.text
         
-        if session.get('editing_section'):
+        if session.editing_section:
             # Редактирование существующего раздела
-            section_id = session['editing_section']
-            conn = get_db_connection()
-            conn.execute('UPDATE sections SET name = ? WHERE id = ?', (section_name, section_id))
-            conn.commit()
-            conn.close()
+            section_id = session.editing_section
+            await execute('UPDATE sections SET name = ? WHERE id = ?', (section_name, section_id))
+            content_cache.invalidate()
             
             session_manager.clear_adding_data(user_id)
             await update.message.reply_text(f"✅ Раздел '{section_name}' успешно обновлен!")
         else:
             # Создание нового раздела
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
+            await execute(
                 'INSERT INTO sections (name, description, created_by) VALUES (?, ?, ?)',
                 (section_name, "Описание раздела", user.id)
             )
-            conn.commit()
-            conn.close()
+            content_cache.invalidate()
             
             session_manager.clear_adding_data(user_id)
             await update.message.reply_text(f"✅ Раздел '{section_name}' успешно создан!")
         
         await start(update, context)
     
-    elif session.get('adding_post'):
-        post_data = session['adding_post']
+    elif session.adding_post:
+        post_data = session.adding_post
         
         if post_data['step'] == 'title':
             post_data['title'] = update.message.text
@@ -1063,9 +1044,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             post_data['content_text'] = update.message.text
             
             # Сохраняем запись в БД
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
+            await execute('''
                 INSERT INTO posts (subsection_id, user_id, user_name, title, content_type, content_text)
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (
@@ -1076,8 +1055,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 'text',
                 post_data['content_text']
             ))
-            conn.commit()
-            conn.close()
+            content_cache.invalidate()
             
             session_manager.clear_adding_data(user_id)
             await update.message.reply_text("✅ Запись успешно добавлена!")
@@ -1095,8 +1073,8 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Сессия устарела. Используйте /start")
         return
     
-    if session.get('adding_post'):
-        post_data = session['adding_post']
+    if session.adding_post:
+        post_data = session.adding_post
         
         # Сохраняем file_id изображения
         photo = update.message.photo[-1]
@@ -1107,54 +1085,55 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await update.message.reply_text("🖼️ Изображение сохранено! Теперь введите текст записи:")
 
+async def stale_button(update: Update, context: ContextTypes.DEFAULT_TYPE, *args):
+    """Кнопки навигации прежнего формата и упакованные кнопки с неверной подписью"""
+    await update.callback_query.answer("⚠️ Кнопка устарела. Откройте подраздел заново")
+
+# Маршруты кнопок: точные значения callback_data, префиксы с числовым аргументом
+# и упакованные кнопки навигации (callback_codec)
+callback_router = CallbackRouter()
+callback_router.exact('back_to_main', start, stateless=True)
+callback_router.exact('view_sections', view_sections)
+callback_router.prefixed('view_section', view_subsections)
+callback_router.prefixed('view_subsection', view_subsection_posts)
+callback_router.packed(ROUTE_PREV_POST, 'prev_post', navigate_posts)
+callback_router.packed(ROUTE_NEXT_POST, 'next_post', navigate_posts)
+callback_router.prefixed('prev_post', stale_button)
+callback_router.prefixed('next_post', stale_button)
+callback_router.exact('search', search_start)
+callback_router.prefixed('search_page', search_page)
+callback_router.prefixed('search_open', open_search_result)
+callback_router.exact('create_section', create_section)
+callback_router.exact('create_subsection_choose_section', create_subsection_choose_section)
+callback_router.prefixed('create_subsection', create_subsection)
+callback_router.exact('add_post_choose_section', add_post_choose_section)
+callback_router.prefixed('add_post_choose_subsection', add_post_choose_subsection)
+callback_router.prefixed('add_post', add_post_start)
+callback_router.exact('manage_content', manage_content)
+callback_router.exact('manage_sections', manage_sections)
+callback_router.prefixed('edit_section', edit_section)
+callback_router.prefixed('delete_section', delete_section)
+callback_router.prefixed('confirm_delete_section', confirm_delete_section)
+
 # Обработка callback запросов
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user_id = update.effective_user.id
     data = query.data
     
-    # Проверяем сессию для всех callback, кроме back_to_main
-    if data != 'back_to_main':
+    # Проверяем сессию для всех callback, кроме back_to_main и кнопок навигации по записям
+    if callback_router.requires_session(data):
         session = session_manager.get_session(user_id)
         if not session:
             await query.answer("❌ Сессия устарела. Используйте /start")
             return
     
     try:
-        if data == 'back_to_main':
-            await start(update, context)
-        elif data == 'view_sections':
-            await view_sections(update, context)
-        elif data.startswith('view_section_'):
-            await view_subsections(update, context)
-        elif data.startswith('view_subsection_'):
-            await view_subsection_posts(update, context)
-        elif data.startswith('prev_post_') or data.startswith('next_post_'):
-            await navigate_posts(update, context)
-        elif data == 'create_section':
-            await create_section(update, context)
-        elif data == 'create_subsection_choose_section':
-            await create_subsection_choose_section(update, context)
-        elif data.startswith('create_subsection_'):
-            await create_subsection(update, context)
-        elif data == 'add_post_choose_section':
-            await add_post_choose_section(update, context)
-        elif data.startswith('add_post_choose_subsection_'):
-            await add_post_choose_subsection(update, context)
-        elif data.startswith('add_post_'):
-            await add_post_start(update, context)
-        elif data == 'manage_content':
-            await manage_content(update, context)
-        elif data == 'manage_sections':
-            await manage_sections(update, context)
-        elif data.startswith('edit_section_'):
-            await edit_section(update, context)
-        elif data.startswith('delete_section_'):
-            await delete_section(update, context)
-        elif data.startswith('confirm_delete_section_'):
-            await confirm_delete_section(update, context)
-        else:
-            await query.answer("⚠️ Функция в разработке")
+        if not await callback_router.dispatch(data, update, context):
+            if is_packed(data):
+                await stale_button(update, context)
+            else:
+                await query.answer("⚠️ Функция в разработке")
     except Exception as e:
         print(f"Error in callback: {e}")
         try:
@@ -1162,15 +1141,52 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except:
             pass
 
+async def start_background_tasks(application: Application):
+    """Запускает фоновые задачи после инициализации приложения"""
+    session_manager.start_sweeper()
+    # Раз в METRICS_INTERVAL секунд счетчики компонентов пишутся в лог одной строкой JSON
+    metrics_reporter.start(lambda: component_sources(callback_router, application))
+
+async def stop_background_tasks(application: Application):
+    """Останавливает фоновые задачи при завершении"""
+    session_manager.stop_sweeper()
+    metrics_reporter.stop()
+    # Изменения сессий с последнего сброса записываются до остановки очереди писателя
+    session_manager.flush(wait=True)
+
 def main():
+    # Логи PTB и метрики; запросы httpx к Bot API не логируются
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
     # Инициализация базы данных
     init_db()
     
+    # Кнопки навигации подписываются ключом из токена: одинаковым у всех процессов и после перезапуска
+    token = os.getenv('TELEGRAM_BOT_TOKEN')
+    set_callback_secret(token)
+    
     # Создание приложения
-    application = Application.builder().token(os.getenv('TELEGRAM_BOT_TOKEN')).build()
+    application = (
+        Application.builder()
+        .token(token)
+        # Обновления разных пользователей обрабатываются параллельно, одного - по очереди
+        .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+        # Исходящие запросы идут через корзины токенов с учетом лимитов Telegram
+        .rate_limiter(SendScheduler())
+        # Не больше WEBHOOK_MAX_PENDING обновлений в очереди и в обработке
+        .update_queue(PendingUpdateQueue())
+        .post_init(start_background_tasks)
+        .post_shutdown(stop_background_tasks)
+        .build()
+    )
     
     # Добавление обработчиков
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("search", search_command))
     application.add_handler(CallbackQueryHandler(handle_callback))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
@@ -1178,9 +1194,16 @@ def main():
     # Добавление обработчика ошибок
     application.add_error_handler(error_handler)
     
-    # Запуск бота
-    print("🤖 Bot started with user session management!")
-    application.run_polling()
+    # Запуск бота: python bot.py [polling|webhook]; для webhook нужны WEBHOOK_URL и WEBHOOK_SECRET
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'polling'
+    print(f"🤖 Bot started with user session management! ({mode})")
+    if mode == 'webhook':
+        run_webhook(application)
+    else:
+        application.run_polling()
+    
+    # Закрываем соединения с базой данных
+    shutdown()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,105 @@
+# callback_codec.py
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import secrets
+import struct
+from typing import NamedTuple, Optional, Tuple
+
+# Упакованные кнопки начинаются с символа, которого нет в текстовых callback_data
+PACKED_PREFIX = '~'
+
+# Версия формата; кнопки другой версии считаются устаревшими
+CALLBACK_CODEC_VERSION = 1
+
+# Ограничение Telegram на callback_data
+CALLBACK_DATA_LIMIT = 64
+
+# Маршруты упакованных кнопок
+ROUTE_PREV_POST = 1
+ROUTE_NEXT_POST = 2
+
+# Ключ подписи одинаков у всех процессов бота и переживает перезапуск: он берется из
+# CALLBACK_SECRET или из токена, который точка входа передает в set_callback_secret().
+# До этого вызова ключ случайный, и кнопки действительны до перезапуска процесса
+CALLBACK_SECRET = os.getenv('CALLBACK_SECRET')
+
+def _derive_key(secret: str) -> bytes:
+    return hashlib.sha256(b'callback_data:' + secret.encode()).digest()
+
+_KEY = _derive_key(CALLBACK_SECRET or secrets.token_hex(32))
+
+def set_callback_secret(token: str):
+    """Подписывает кнопки ключом из токена бота, если не задан CALLBACK_SECRET"""
+    global _KEY
+    if not CALLBACK_SECRET and token:
+        _KEY = _derive_key(token)
+
+# Версия, маршрут, подраздел, номер записи, id записи; за ними created_at и подпись
+_HEADER = struct.Struct('>BBIII')
+_TAG_SIZE = 8
+
+# Вместо created_at, который не помещается в callback_data (микросекунды и часовой пояс
+# из импортированных дампов): курсор только по id, дату записи читает запрос навигации.
+# Байт 0xFF не встречается в UTF-8, поэтому не совпадает ни с одной датой
+_DATE_BY_ID = b'\xff'
+
+class PostNavigation(NamedTuple):
+    """Кнопка навигации по записям: все, что нужно для перехода, без сессии пользователя"""
+    route: int
+    subsection_id: int
+    index: int
+    post_id: int
+    created_at: Optional[str]  # None - дата не поместилась в кнопку
+
+    @property
+    def cursor(self) -> Tuple[Optional[str], int]:
+        """Курсор текущей записи для keyset-навигации"""
+        return self.created_at, self.post_id
+
+def _tag(payload: bytes) -> bytes:
+    return hmac.new(_KEY, payload, hashlib.sha256).digest()[:_TAG_SIZE]
+
+def _pack(payload: bytes) -> str:
+    return PACKED_PREFIX + base64.urlsafe_b64encode(payload + _tag(payload)).rstrip(b'=').decode()
+
+def encode_navigation(route: int, subsection_id: int, index: int, cursor: Tuple[str, int]) -> str:
+    """callback_data кнопки перехода от записи cursor с номером index"""
+    created_at, post_id = cursor
+    header = _HEADER.pack(CALLBACK_CODEC_VERSION, route, subsection_id, index, post_id)
+    # Записи без даты (created_at IS NULL из старых дампов) идут с пустой строкой, как в базе
+    data = _pack(header + (created_at or '').encode())
+    if len(data) > CALLBACK_DATA_LIMIT:
+        data = _pack(header + _DATE_BY_ID)
+    return data
+
+def is_packed(data: str) -> bool:
+    """callback_data в упакованном формате (возможно, устаревшем или поддельном)"""
+    return data.startswith(PACKED_PREFIX)
+
+def decode_callback(data: str) -> Optional[PostNavigation]:
+    """Разбирает упакованную кнопку; None, если подпись не сходится или версия другая"""
+    encoded = data[len(PACKED_PREFIX):]
+    try:
+        raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+    except (binascii.Error, ValueError):
+        return None
+
+    if len(raw) < _HEADER.size + _TAG_SIZE:
+        return None
+    payload, tag = raw[:-_TAG_SIZE], raw[-_TAG_SIZE:]
+    if not hmac.compare_digest(tag, _tag(payload)):
+        return None
+
+    version, route, subsection_id, index, post_id = _HEADER.unpack_from(payload)
+    if version != CALLBACK_CODEC_VERSION:
+        return None
+    created_at: Optional[str] = None
+    if payload[_HEADER.size:] != _DATE_BY_ID:
+        try:
+            created_at = payload[_HEADER.size:].decode()
+        except UnicodeDecodeError:
+            return None
+    return PostNavigation(route, subsection_id, index, post_id, created_at)
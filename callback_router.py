@@ -0,0 +1,140 @@
+# callback_router.py
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from callback_codec import decode_callback, is_packed
+
+class Route:
+    """Маршрут callback_data: обработчик, разбор аргумента и счетчики вызовов"""
+    __slots__ = ('name', 'handler', 'parse', 'stateless', 'calls', 'errors', 'seconds')
+
+    def __init__(self, name: str, handler: Callable, parse: Optional[Callable[[str], Any]] = None,
+                 stateless: bool = False):
+        self.name = name
+        self.handler = handler
+        self.parse = parse
+        self.stateless = stateless
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Число вызовов, ошибок и среднее время обработчика"""
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'avg_ms': self.seconds / self.calls * 1000 if self.calls else 0.0
+        }
+
+class CallbackRouter:
+    """Таблица маршрутов callback_data вместо цепочки startswith.
+
+    Данные без аргумента ищутся в словаре точных значений, данные вида
+    '<префикс>_<аргумент>' - в словаре префиксов; аргумент разбирается один раз,
+    и обработчик получает его готовым: handler(*args, argument). Порядок
+    регистрации не важен, поэтому 'add_post_3' не может попасть в 'add_post_choose_subsection'.
+
+    Упакованные кнопки (callback_codec) ищутся по номеру маршрута, обработчик
+    получает разобранную кнопку. Такие маршруты не требуют сессии пользователя."""
+
+    def __init__(self):
+        self._exact: Dict[str, Route] = {}
+        self._prefixed: Dict[str, Route] = {}
+        self._packed: Dict[int, Route] = {}
+        self.unmatched = 0
+
+    def exact(self, data: str, handler: Callable, stateless: bool = False):
+        """Маршрут для callback_data, совпадающего с data; stateless - обработчику не нужна сессия"""
+        if data in self._exact:
+            raise ValueError(f"Route already registered: {data}")
+        self._exact[data] = Route(data, handler, stateless=stateless)
+
+    def prefixed(self, prefix: str, handler: Callable, parse: Callable[[str], Any] = int):
+        """Маршрут для callback_data '<prefix>_<аргумент>'; аргумент разбирается функцией parse"""
+        if prefix in self._prefixed:
+            raise ValueError(f"Route already registered: {prefix}_*")
+        self._prefixed[prefix] = Route(prefix + '_*', handler, parse)
+
+    def packed(self, route_id: int, name: str, handler: Callable):
+        """Маршрут упакованной кнопки с номером route_id"""
+        if route_id in self._packed:
+            raise ValueError(f"Route already registered: {name}")
+        self._packed[route_id] = Route(name, handler, stateless=True)
+
+    def requires_session(self, data: str) -> bool:
+        """Нужно ли проверять сессию перед обработкой; подпись кнопки здесь не проверяется"""
+        if is_packed(data):
+            return False
+        route = self._exact.get(data) or self._prefixed.get(data.rpartition('_')[0])
+        return route is None or not route.stateless
+
+    def resolve(self, data: str) -> Optional[Tuple[Route, tuple]]:
+        """Маршрут и аргументы обработчика; None, если маршрута нет, аргумент не разбирается
+        или упакованная кнопка устарела"""
+        if is_packed(data):
+            button = decode_callback(data)
+            route = self._packed.get(button.route) if button else None
+            return (route, (button,)) if route else None
+
+        route = self._exact.get(data)
+        if route is not None:
+            return route, ()
+
+        prefix, _, argument = data.rpartition('_')
+        route = self._prefixed.get(prefix)
+        if route is None:
+            return None
+        try:
+            return route, (route.parse(argument),)
+        except ValueError:
+            return None
+
+    async def dispatch(self, data: str, *args) -> bool:
+        """Вызывает асинхронный обработчик маршрута; False, если маршрута нет"""
+        resolved = self.resolve(data)
+        if resolved is None:
+            self.unmatched += 1
+            return False
+
+        route, arguments = resolved
+        started = time.perf_counter()
+        try:
+            await route.handler(*args, *arguments)
+        except Exception:
+            route.errors += 1
+            raise
+        finally:
+            route.calls += 1
+            route.seconds += time.perf_counter() - started
+        return True
+
+    def dispatch_sync(self, data: str, *args, before: Optional[Callable[[], Any]] = None) -> bool:
+        """dispatch для синхронных обработчиков (python-telegram-bot 13);
+        before вызывается перед обработчиком, только если маршрут найден"""
+        resolved = self.resolve(data)
+        if resolved is None:
+            self.unmatched += 1
+            return False
+
+        route, arguments = resolved
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        try:
+            route.handler(*args, *arguments)
+        except Exception:
+            route.errors += 1
+            raise
+        finally:
+            route.calls += 1
+            route.seconds += time.perf_counter() - started
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики по маршрутам, которые вызывались хотя бы раз"""
+        routes = {
+            route.name: route.stats()
+            for route in (*self._exact.values(), *self._prefixed.values(), *self._packed.values())
+            if route.calls
+        }
+        return {'routes': routes, 'unmatched': self.unmatched}
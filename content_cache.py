@@ -0,0 +1,127 @@
+# content_cache.py
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import run_read
+from repository import CONTENT_VERSION_SQL, Section, Subsection, load_sections, load_subsections_with_counts, post_cache
+
+class TreeSnapshot:
+    """Неизменяемый снимок дерева разделов и подразделов"""
+
+    def __init__(self, sections: List[Section], subsections: List[Tuple[Subsection, int]]):
+        self._sections: Dict[int, Section] = {section.id: section for section in sections}
+        self._subsections: Dict[int, Subsection] = {}
+        self._children: Dict[int, List[int]] = {section.id: [] for section in sections}
+        self._post_counts: Dict[int, int] = {}
+
+        for subsection, posts_count in subsections:
+            self._subsections[subsection.id] = subsection
+            self._children.setdefault(subsection.section_id, []).append(subsection.id)
+            self._post_counts[subsection.id] = posts_count
+
+    def section(self, section_id: int) -> Optional[Section]:
+        """Раздел по id"""
+        return self._sections.get(section_id)
+
+    def subsection(self, subsection_id: int) -> Optional[Subsection]:
+        """Подраздел по id"""
+        return self._subsections.get(subsection_id)
+
+    def sections(self) -> List[Section]:
+        """Все разделы по порядку id"""
+        return list(self._sections.values())
+
+    def subsections(self, section_id: int) -> List[Subsection]:
+        """Подразделы раздела по порядку id"""
+        return [self._subsections[i] for i in self._children.get(section_id, [])]
+
+    def post_count(self, subsection_id: int) -> int:
+        """Количество записей в подразделе"""
+        return self._post_counts.get(subsection_id, 0)
+
+    def sections_with_counts(self) -> List[Tuple[Section, int, int]]:
+        """Разделы в виде (раздел, подразделов, записей)"""
+        result = []
+        for section_id, section in self._sections.items():
+            children = self._children.get(section_id, [])
+            posts_count = sum(self._post_counts[i] for i in children)
+            result.append((section, len(children), posts_count))
+        return result
+
+    def subsections_with_counts(self, section_id: int) -> List[Tuple[Subsection, int]]:
+        """Подразделы раздела в виде (подраздел, записей)"""
+        return [
+            (subsection, self._post_counts[subsection.id])
+            for subsection in self.subsections(section_id)
+        ]
+
+class ContentCache:
+    """Кэш дерева контента; сбрасывается увеличением номера поколения при любой записи"""
+
+    def __init__(self):
+        self.generation = 0
+        self._snapshot: Optional[TreeSnapshot] = None
+        self._snapshot_generation = -1
+        self.hits = 0
+        self.misses = 0
+        self.watch_version = False
+        self._content_version: Optional[int] = None
+
+    def invalidate(self):
+        """Вызывается после каждого изменения разделов, подразделов или записей"""
+        self.generation += 1
+        post_cache.invalidate()
+
+    def watch_other_processes(self):
+        """В базу пишут и другие процессы бота: перед каждым обращением кэши сверяются
+        с content_version, который увеличивают триггеры на таблицах контента"""
+        self.watch_version = True
+        post_cache.watch_version = True
+
+    def _check_version(self, conn: sqlite3.Connection):
+        version = conn.execute(CONTENT_VERSION_SQL).fetchone()[0]
+        if version != self._content_version:
+            self._content_version = version
+            self.generation += 1
+
+    def _load(self, conn: sqlite3.Connection, generation: int) -> TreeSnapshot:
+        """Читает дерево из базы и запоминает поколение, для которого оно прочитано"""
+        snapshot = TreeSnapshot(load_sections(conn), load_subsections_with_counts(conn))
+        # Если во время чтения прошла запись, снимок будет перечитан при следующем обращении
+        if generation >= self._snapshot_generation:
+            self._snapshot = snapshot
+            self._snapshot_generation = generation
+        return snapshot
+
+    def snapshot_sync(self, conn: sqlite3.Connection) -> TreeSnapshot:
+        """Снимок дерева для синхронного кода"""
+        if self.watch_version:
+            self._check_version(conn)
+        if self._snapshot is not None and self._snapshot_generation == self.generation:
+            self.hits += 1
+            return self._snapshot
+        self.misses += 1
+        return self._load(conn, self.generation)
+
+    async def snapshot(self) -> TreeSnapshot:
+        """Снимок дерева; база читается только после изменений"""
+        if self.watch_version:
+            await run_read(self._check_version)
+        if self._snapshot is not None and self._snapshot_generation == self.generation:
+            self.hits += 1
+            return self._snapshot
+        self.misses += 1
+        return await run_read(self._load, self.generation)
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика попаданий в кэш"""
+        total = self.hits + self.misses
+        return {
+            'generation': self.generation,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+# Глобальный кэш дерева контента
+content_cache = ContentCache()
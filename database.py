@@ -0,0 +1,435 @@
+# database.py
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Путь к базе данных
+DB_PATH = os.path.join(os.getcwd(), 'clan_bot.db')
+
+# Размер пула потоков для чтения
+DB_READER_THREADS = int(os.getenv('DB_READER_THREADS', '4'))
+
+# Настройки SQLite (cache_size в КиБ при отрицательном значении, mmap_size в байтах)
+DB_CACHE_SIZE = int(os.getenv('DB_CACHE_SIZE', '-16000'))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(64 * 1024 * 1024)))
+DB_BUSY_TIMEOUT = int(os.getenv('DB_BUSY_TIMEOUT', '5000'))  # мс
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '256'))
+
+# Соединение пересоздается по возрасту и проверяется не чаще раза в интервал
+DB_CONNECTION_MAX_AGE = int(os.getenv('DB_CONNECTION_MAX_AGE', '3600'))
+DB_HEALTH_CHECK_INTERVAL = 60
+
+# Групповая фиксация: изменения копятся до DB_WRITE_BATCH_SIZE штук или DB_WRITE_BATCH_DELAY мс
+# после первого и записываются одной транзакцией (один fsync на пачку)
+DB_WRITE_BATCH_SIZE = int(os.getenv('DB_WRITE_BATCH_SIZE', '64'))
+DB_WRITE_BATCH_DELAY = float(os.getenv('DB_WRITE_BATCH_DELAY', '2'))  # мс
+
+# Удаления крупнее порога выполняются в фоне пачками, чтобы не держать блокировку записи
+DB_DELETE_CHUNK_SIZE = int(os.getenv('DB_DELETE_CHUNK_SIZE', '500'))
+DB_DELETE_BACKGROUND_THRESHOLD = int(os.getenv('DB_DELETE_BACKGROUND_THRESHOLD', '5000'))
+
+# Копия базы в памяти для чтений (DB_READ_REPLICA=1). Не включается для файлов больше
+# DB_READ_REPLICA_MAX_SIZE байт; без нее чтения идут напрямую в файл
+DB_READ_REPLICA = os.getenv('DB_READ_REPLICA', '0') == '1'
+DB_READ_REPLICA_MAX_SIZE = int(os.getenv('DB_READ_REPLICA_MAX_SIZE', str(256 * 1024 * 1024)))
+
+# Копия обновляется в фоне не чаще раза в интервал (секунды); до обновления чтения идут в файл
+DB_READ_REPLICA_REFRESH_INTERVAL = float(os.getenv('DB_READ_REPLICA_REFRESH_INTERVAL', '1'))
+
+class ConnectionManager:
+    """Долгоживущие соединения с базой: по одному на поток"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+        self.opened = 0
+        self.recycled = 0
+
+    def _open(self) -> sqlite3.Connection:
+        """Открывает соединение и применяет настройки"""
+        conn = sqlite3.connect(
+            self.path, check_same_thread=False, timeout=DB_BUSY_TIMEOUT / 1000,
+            cached_statements=DB_STATEMENT_CACHE_SIZE
+        )
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = {DB_CACHE_SIZE}')
+        conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+        conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}')
+        conn.execute('PRAGMA foreign_keys = ON')
+
+        with self._lock:
+            self._connections.append(conn)
+            self.opened += 1
+
+        now = time.monotonic()
+        self._local.conn = conn
+        self._local.opened_at = now
+        self._local.checked_at = now
+        return conn
+
+    def _discard(self, conn: sqlite3.Connection):
+        """Закрывает соединение и убирает его из пула"""
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+            self.recycled += 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self._local.conn = None
+
+    def _is_healthy(self, conn: sqlite3.Connection) -> bool:
+        """Проверяет, что соединение живое и не осталось в транзакции"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def connection(self) -> sqlite3.Connection:
+        """Возвращает соединение текущего потока, при необходимости пересоздавая его"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return self._open()
+
+        now = time.monotonic()
+        if now - self._local.opened_at > DB_CONNECTION_MAX_AGE:
+            self._discard(conn)
+            return self._open()
+
+        if now - self._local.checked_at > DB_HEALTH_CHECK_INTERVAL:
+            if not self._is_healthy(conn):
+                self._discard(conn)
+                return self._open()
+            self._local.checked_at = now
+
+        return conn
+
+    def close_all(self):
+        """Закрывает все соединения пула"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+# Глобальный менеджер соединений
+connection_manager = ConnectionManager(DB_PATH)
+
+def get_db_connection() -> sqlite3.Connection:
+    """Возвращает долгоживущее соединение текущего потока (закрывать не нужно)"""
+    return connection_manager.connection()
+
+class ReadReplica:
+    """Копия базы в памяти для чтений.
+
+    Фиксация только помечает копию устаревшей: пока она не обновлена, чтения идут
+    в файл, поэтому запись сразу видна следующему чтению. Фоновый поток снимает
+    свежую копию через backup API не чаще раза в DB_READ_REPLICA_REFRESH_INTERVAL
+    и каждый раз заново проверяет размер базы."""
+
+    def __init__(self):
+        self._conn: Optional[sqlite3.Connection] = None
+        self._path: Optional[str] = None
+        self._fresh = False
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.refreshes = 0
+        self.discarded = 0
+        self.refresh_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._path is not None
+
+    def connection(self) -> Optional[sqlite3.Connection]:
+        """Соединение с копией или None, если копия устарела или выключена и чтения идут в файл"""
+        with self._lock:
+            return self._conn if self._fresh else None
+
+    def start(self, path: str) -> bool:
+        """Снимает первую копию и запускает фоновое обновление"""
+        self._path = path
+        self._stopped.clear()
+        if not self.refresh():
+            return False
+        self._thread = threading.Thread(target=self._loop, name='db-replica', daemon=True)
+        self._thread.start()
+        return True
+
+    def mark_stale(self):
+        """Вызывается потоком-писателем после фиксации, до ответа вызывающим"""
+        with self._lock:
+            self._generation += 1
+            self._fresh = False
+        self._changed.set()
+
+    def refresh(self) -> bool:
+        """Снимает свежую копию базы; копия, во время снятия которой была фиксация, отбрасывается"""
+        path = self._path
+        if path is None:
+            return False
+
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size > DB_READ_REPLICA_MAX_SIZE:
+            print(f"⚠️ Read replica disabled: database is {size // (1024 * 1024)} MiB")
+            self.disable()
+            return False
+
+        started = time.perf_counter()
+        with self._lock:
+            generation = self._generation
+        try:
+            replica = sqlite3.connect(':memory:', check_same_thread=False, cached_statements=DB_STATEMENT_CACHE_SIZE)
+            connection_manager.connection().backup(replica)
+        except (sqlite3.Error, MemoryError) as e:
+            # Устаревшая копия хуже медленной: переходим на чтение из файла
+            print(f"⚠️ Read replica disabled: {e}")
+            self.disable()
+            return False
+
+        with self._lock:
+            if generation != self._generation:
+                self.discarded += 1
+                return True
+            # Запросы, начатые на старой копии, дочитают ее; соединение закроется вместе с последней ссылкой
+            self._conn = replica
+            self._fresh = True
+        self.refreshes += 1
+        self.refresh_seconds += time.perf_counter() - started
+        return True
+
+    def _loop(self):
+        last = time.monotonic()
+        while not self._stopped.is_set():
+            self._changed.wait()
+            self._changed.clear()
+            if self._stopped.wait(max(0.0, last + DB_READ_REPLICA_REFRESH_INTERVAL - time.monotonic())):
+                return
+            last = time.monotonic()
+            if not self.refresh():
+                return
+
+    def disable(self):
+        """Переключает чтения обратно на файл базы"""
+        with self._lock:
+            self._path = None
+            self._conn = None
+            self._fresh = False
+
+    def stop(self):
+        """Останавливает фоновое обновление"""
+        self._stopped.set()
+        self._changed.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика обновлений копии"""
+        return {
+            'enabled': self.enabled,
+            'fresh': self._fresh,
+            'refreshes': self.refreshes,
+            'discarded': self.discarded,
+            'avg_refresh_ms': self.refresh_seconds / self.refreshes * 1000 if self.refreshes else 0.0
+        }
+
+# Копия базы для чтений; включается start_read_replica()
+read_replica = ReadReplica()
+
+def start_read_replica() -> bool:
+    """Загружает копию базы в память, если она включена настройками и база не слишком велика"""
+    if not DB_READ_REPLICA:
+        return False
+
+    size = os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0
+    if size > DB_READ_REPLICA_MAX_SIZE:
+        print(f"⚠️ Read replica skipped: database is {size // (1024 * 1024)} MiB")
+        return False
+
+    return read_replica.start(connection_manager.path)
+
+def get_read_connection() -> sqlite3.Connection:
+    """Соединение для чтений: копия в памяти, если она включена, иначе соединение потока"""
+    return read_replica.connection() or get_db_connection()
+
+class WriteQueue:
+    """Очередь изменений с единственным потоком-писателем и групповой фиксацией"""
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+
+    def submit(self, func: Callable[..., Any], args: Sequence[Any] = (), replicate: bool = True) -> Future:
+        """Ставит func(conn, *args) в очередь; Future завершается после фиксации пачки.
+
+        replicate=False - изменение таблиц, которые не читаются через копию в памяти:
+        пачка только из таких изменений не пересоздает копию"""
+        future: Future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='db-writer', daemon=True)
+                self._thread.start()
+            self._queue.put((func, args, future, replicate))
+        return future
+
+    def _collect(self, first) -> list:
+        """Добирает в пачку изменения, пришедшие в течение DB_WRITE_BATCH_DELAY"""
+        batch = [first]
+        deadline = time.monotonic() + DB_WRITE_BATCH_DELAY / 1000
+        while len(batch) < DB_WRITE_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Остановка: дописываем текущую пачку и выходим
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _apply(self, batch: list):
+        """Выполняет пачку в одной транзакции; ошибка одного изменения не отменяет остальные"""
+        conn = get_db_connection()
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for func, args, future, _ in batch:
+                conn.execute('SAVEPOINT batch_item')
+                try:
+                    results.append((future, func(conn, *args), None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO batch_item')
+                    results.append((future, None, e))
+                conn.execute('RELEASE batch_item')
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        # Копия помечается устаревшей до ответа вызывающим, чтобы следующее чтение видело их изменения
+        if read_replica.enabled and any(replicate for _, _, _, replicate in batch):
+            read_replica.mark_stale()
+
+        self.batches += 1
+        self.writes += len(batch)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [entry for entry in self._collect(item) if entry[2].set_running_or_notify_cancel()]
+            if batch:
+                self._apply(batch)
+
+    def stop(self):
+        """Дожидается записи всех поставленных изменений и останавливает поток"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._queue.put(None)
+        thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика групповой фиксации"""
+        return {
+            'batches': self.batches,
+            'writes': self.writes,
+            'avg_batch': self.writes / self.batches if self.batches else 0.0,
+            'pending': self._queue.qsize()
+        }
+
+# Все изменения выполняются одним потоком-писателем, чтения - пулом потоков.
+# Обработчики бота только ожидают результат и не блокируют цикл событий.
+write_queue = WriteQueue()
+_readers = ThreadPoolExecutor(max_workers=DB_READER_THREADS, thread_name_prefix='db-reader')
+
+def _run(func: Callable[..., Any], args: Sequence[Any]):
+    """Выполняет функцию чтения с копией в памяти или соединением потока пула"""
+    conn = get_read_connection()
+    try:
+        result = func(conn, *args)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+
+async def run_read(func: Callable[..., Any], *args):
+    """Выполняет func(conn, *args) в пуле читателей"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_readers, _run, func, args)
+
+async def run_write(func: Callable[..., Any], *args):
+    """Выполняет func(conn, *args) в потоке-писателе; результат возвращается после фиксации"""
+    return await asyncio.wrap_future(write_queue.submit(func, args))
+
+def run_write_sync(func: Callable[..., Any], *args):
+    """То же, что run_write, для синхронного кода"""
+    return write_queue.submit(func, args).result()
+
+async def fetchone(sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+    """Возвращает первую строку результата запроса"""
+    return await run_read(lambda conn: conn.execute(sql, params).fetchone())
+
+async def fetchall(sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+    """Возвращает все строки результата запроса"""
+    return await run_read(lambda conn: conn.execute(sql, params).fetchall())
+
+async def execute(sql: str, params: Sequence[Any] = ()) -> int:
+    """Выполняет изменяющий запрос и возвращает id последней вставленной строки"""
+    return await run_write(lambda conn: conn.execute(sql, params).lastrowid)
+
+def execute_sync(sql: str, params: Sequence[Any] = ()) -> int:
+    """Синхронный вариант execute, тоже через очередь писателя"""
+    return run_write_sync(lambda conn: conn.execute(sql, params).lastrowid)
+
+async def delete_chunked(table: str, where: str, params: Sequence[Any] = (),
+                         chunk_size: int = DB_DELETE_CHUNK_SIZE) -> int:
+    """Удаляет строки пачками; каждая пачка - отдельное изменение в очереди писателя"""
+    sql = f'DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT {chunk_size})'
+    deleted = 0
+    while True:
+        count = await run_write(lambda conn: conn.execute(sql, params).rowcount)
+        deleted += count
+        if count < chunk_size:
+            return deleted
+
+def shutdown():
+    """Останавливает пулы потоков и закрывает соединения"""
+    write_queue.stop()
+    read_replica.stop()
+    _readers.shutdown(wait=True)
+    connection_manager.close_all()
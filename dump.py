@@ -0,0 +1,193 @@
+# dump.py
+import json
+import os
+import sqlite3
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from database import DB_PATH
+from migrations import drop_bulk_load_hooks, migrate, restore_bulk_load_hooks
+
+# Тип строки дампа и ее таблица; родители выгружаются и загружаются раньше детей
+DUMP_TABLES = (('section', 'sections'), ('subsection', 'subsections'), ('post', 'posts'))
+
+# Строк в одном executemany и строк в одной транзакции загрузки (после каждой
+# транзакции сохраняется контрольная точка)
+IMPORT_BATCH_SIZE = 5_000
+IMPORT_COMMIT_ROWS = 250_000
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    """Отдельное соединение для выгрузки и загрузки, без пула и реплики бота"""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA cache_size = -65536')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    """Колонки таблицы в порядке определения"""
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+def iter_dump(conn: sqlite3.Connection) -> Iterator[Dict[str, Any]]:
+    """Строки разделов, подразделов и записей по одной, в порядке id"""
+    for kind, table in DUMP_TABLES:
+        columns = _table_columns(conn, table)
+        for row in conn.execute(f'SELECT {", ".join(columns)} FROM {table} ORDER BY id'):
+            record = {'type': kind}
+            record.update(zip(columns, row))
+            yield record
+
+def export_dump(path: str, db_path: str = DB_PATH) -> Dict[str, int]:
+    """Выгружает базу знаний в JSONL-файл; бот может продолжать работать"""
+    conn = _connect(db_path)
+    counts = {kind: 0 for kind, _ in DUMP_TABLES}
+    temp_path = path + '.tmp'
+
+    try:
+        # Одна читающая транзакция - согласованный снимок всех трех таблиц
+        conn.execute('BEGIN')
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            for record in iter_dump(conn):
+                file.write(json.dumps(record, ensure_ascii=False))
+                file.write('\n')
+                counts[record['type']] += 1
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+
+    # Неполный файл никогда не оказывается на месте готового дампа
+    os.replace(temp_path, path)
+    return counts
+
+def _checkpoint_path(path: str) -> str:
+    return path + '.checkpoint'
+
+def _read_checkpoint(path: str) -> Tuple[int, int]:
+    """Смещение в файле дампа и число загруженных строк из прерванной загрузки"""
+    try:
+        with open(_checkpoint_path(path), encoding='utf-8') as file:
+            checkpoint = json.load(file)
+        return checkpoint['offset'], checkpoint['rows']
+    except FileNotFoundError:
+        return 0, 0
+
+def _write_checkpoint(path: str, offset: int, rows: int):
+    """Атомарно сохраняет контрольную точку после зафиксированной транзакции"""
+    temp_path = _checkpoint_path(path) + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump({'offset': offset, 'rows': rows}, file)
+    os.replace(temp_path, _checkpoint_path(path))
+
+def _iter_records(path: str, offset: int) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Строки дампа начиная со смещения offset вместе со смещением конца строки"""
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        for line in file:
+            offset += len(line)
+            if line.strip():
+                yield offset, json.loads(line)
+
+def _iter_batches(path: str, offset: int) -> Iterator[Tuple[int, str, Tuple[str, ...], List[tuple]]]:
+    """Пачки строк одной таблицы с одинаковым набором колонок"""
+    tables = dict(DUMP_TABLES)
+    key: Optional[Tuple[str, Tuple[str, ...]]] = None
+    rows: List[tuple] = []
+    end = offset
+
+    for end_offset, record in _iter_records(path, offset):
+        kind = record.pop('type', None)
+        if kind not in tables:
+            raise ValueError(f"Unknown record type at byte {end}: {kind!r}")
+
+        columns = tuple(record)
+        if key != (kind, columns) or len(rows) >= IMPORT_BATCH_SIZE:
+            if rows:
+                yield end, tables[key[0]], key[1], rows
+            key, rows = (kind, columns), []
+
+        rows.append(tuple(record.values()))
+        end = end_offset
+
+    if rows:
+        yield end, tables[key[0]], key[1], rows
+
+def _placeholder(table: str, column: str) -> str:
+    """Записи без даты загружаются с пустой строкой, как после миграции 8"""
+    return "coalesce(?, '')" if (table, column) == ('posts', 'created_at') else '?'
+
+def import_dump(path: str, db_path: str = DB_PATH) -> int:
+    """Загружает JSONL-дамп, заменяя строки с совпадающими id; бот должен быть остановлен.
+
+    Прерванная загрузка продолжается с контрольной точки при повторном запуске."""
+    conn = _connect(db_path)
+    offset, loaded = _read_checkpoint(path)
+
+    try:
+        migrate(conn)
+
+        # Родители и дети приходят разными пачками, поэтому ключи проверяются в конце
+        conn.execute('PRAGMA foreign_keys = OFF')
+        conn.execute('BEGIN IMMEDIATE')
+        drop_bulk_load_hooks(conn)
+        # Удаление фиксируется с первой пачкой: если загрузка прервется, индексы и поиск
+        # восстановит повторный запуск загрузки или init_db при старте бота
+        print("⚠️ Navigation indexes and search triggers are dropped until the import finishes")
+        columns_by_table = {table: set(_table_columns(conn, table)) for _, table in DUMP_TABLES}
+
+        pending = 0
+        for end, table, columns, rows in _iter_batches(path, offset):
+            unknown = set(columns) - columns_by_table[table]
+            if unknown:
+                raise ValueError(f"Unknown columns for {table}: {', '.join(sorted(unknown))}")
+
+            conn.executemany(
+                f'INSERT OR REPLACE INTO {table} ({", ".join(columns)}) '
+                f'VALUES ({", ".join(_placeholder(table, column) for column in columns)})',
+                rows
+            )
+            pending += len(rows)
+
+            if pending >= IMPORT_COMMIT_ROWS:
+                conn.execute('COMMIT')
+                loaded += pending
+                pending = 0
+                _write_checkpoint(path, end, loaded)
+                print(f"💾 Imported {loaded} rows")
+                conn.execute('BEGIN IMMEDIATE')
+
+        loaded += pending
+        restore_bulk_load_hooks(conn)
+
+        problems = conn.execute('PRAGMA foreign_key_check').fetchall()
+        if problems:
+            raise sqlite3.IntegrityError(f"Foreign key violations in dump: {problems[:5]}")
+
+        conn.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+    try:
+        os.remove(_checkpoint_path(path))
+    except FileNotFoundError:
+        pass
+
+    return loaded
+
+if __name__ == '__main__':
+    # python dump.py export <файл> - выгрузить разделы, подразделы и записи
+    # python dump.py import <файл> - загрузить дамп (повторный запуск продолжает прерванную загрузку)
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+
+    if command == 'export' and len(sys.argv) == 3:
+        result = export_dump(sys.argv[2])
+        print(f"✅ Exported: {', '.join(f'{kind}s {count}' for kind, count in result.items())}")
+    elif command == 'import' and len(sys.argv) == 3:
+        print(f"✅ Imported {import_dump(sys.argv[2])} rows")
+    else:
+        print("Usage: python dump.py export|import <file>")
+        sys.exit(2)
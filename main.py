@@ -1,10 +1,18 @@
 import os
 import logging
-import sqlite3
-import time
-from typing import Dict, Any, List, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Updater, CommandHandler, CallbackQueryHandler, MessageHandler, Filters, CallbackContext
+from telegram.ext import Updater, CommandHandler, CallbackQueryHandler, MessageHandler, Filters, CallbackContext, TypeHandler
+
+from callback_codec import ROUTE_NEXT_POST, ROUTE_PREV_POST, PostNavigation, encode_navigation, is_packed, set_callback_secret
+from callback_router import CallbackRouter
+from content_cache import content_cache
+from database import get_read_connection, execute_sync, shutdown
+from metrics import METRICS_INTERVAL, component_sources, report
+from migrations import init_db
+from render_memory import edit_photo_sync, edit_text_sync
+from repository import first_posts, older_posts, newer_posts, post_by_id, post_position
+from session_manager import SESSION_FLUSH_INTERVAL, session_manager
+from search import SEARCH_PAGE_SIZE, SEARCH_RANK_LIMIT, search
 
 # Импортируем конфиг
 try:
@@ -19,172 +27,15 @@ logging.basicConfig(
     level=logging.INFO
 )
 
-# Путь к базе данных
-DB_PATH = 'clan_bot.db'
-
-# Глобальный словарь для хранения сессий пользователей
-user_sessions: Dict[int, Dict[str, Any]] = {}
-SESSION_TIMEOUT = 3600  # 1 час в секундах
-
-class UserSession:
-    """Класс для управления сессией пользователя"""
-    
-    def __init__(self, user_id: int):
-        self.user_id = user_id
-        self.created_at = time.time()
-        self.current_section: Optional[int] = None
-        self.current_subsection: Optional[int] = None
-        self.current_post_index: int = 0
-        self.posts: List[Any] = []
-        
-        # Состояния для добавления контента
-        self.adding_post: Optional[Dict[str, Any]] = None
-        self.creating_section: bool = False
-        self.creating_subsection: Optional[Dict[str, Any]] = None
-        self.editing_section: Optional[int] = None
-        self.editing_subsection: Optional[int] = None
-        self.editing_post: Optional[int] = None
-        
-        # Флаги ожидания ввода
-        self.awaiting_section_name: bool = False
-        self.awaiting_subsection_name: bool = False
-        self.awaiting_post_title: bool = False
-        self.awaiting_post_content: bool = False
-    
-    def is_valid(self) -> bool:
-        """Проверяет, действительна ли сессия"""
-        return time.time() - self.created_at < SESSION_TIMEOUT
-    
-    def update_time(self):
-        """Обновляет время сессии"""
-        self.created_at = time.time()
-    
-    def clear_adding_state(self):
-        """Очищает состояние добавления контента"""
-        self.adding_post = None
-        self.creating_section = False
-        self.creating_subsection = None
-        self.editing_section = None
-        self.editing_subsection = None
-        self.editing_post = None
-        self.awaiting_section_name = False
-        self.awaiting_subsection_name = False
-        self.awaiting_post_title = False
-        self.awaiting_post_content = False
-
-def get_user_session(user_id: int) -> Optional[UserSession]:
-    """Получает сессию пользователя"""
-    session = user_sessions.get(user_id)
-    if session and session.is_valid():
-        session.update_time()
-        return session
-    elif session:
-        # Удаляем просроченную сессию
-        del user_sessions[user_id]
-    return None
-
-def create_user_session(user_id: int) -> UserSession:
-    """Создает новую сессию пользователя"""
-    session = UserSession(user_id)
-    user_sessions[user_id] = session
-    return session
-
-def clear_user_session(user_id: int):
-    """Очищает сессию пользователя"""
-    if user_id in user_sessions:
-        del user_sessions[user_id]
-
-def get_db_connection():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
-
-def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Таблица разделов
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sections (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            created_by INTEGER,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Таблица подразделов
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS subsections (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            section_id INTEGER,
-            name TEXT NOT NULL,
-            description TEXT,
-            created_by INTEGER,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (section_id) REFERENCES sections (id)
-        )
-    ''')
-    
-    # Таблица записей
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS posts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            subsection_id INTEGER,
-            user_id INTEGER,
-            user_name TEXT,
-            title TEXT NOT NULL,
-            content_type TEXT,
-            content_text TEXT,
-            image_file_id TEXT,
-            link_url TEXT,
-            link_title TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (subsection_id) REFERENCES subsections (id)
-        )
-    ''')
-    
-    # Создаем базовые разделы
-    cursor.execute('''
-        INSERT OR IGNORE INTO sections (id, name, description) 
-        VALUES 
-            (1, '📚 Гайды по игре', 'Полезные гайды и стратегии'),
-            (2, '⚔️ Библиотека сборок', 'Эффективные сборки персонажей'),
-            (3, '📝 Заметки клана', 'Важные объявления и заметки'),
-            (4, '🔗 Полезные ссылки', 'Ссылки на ресурсы и инструменты')
-    ''')
-    
-    # Создаем базовые подразделы
-    cursor.execute('''
-        INSERT OR IGNORE INTO subsections (id, section_id, name, description) 
-        VALUES 
-            (1, 1, '🎯 Основы игры', 'Базовые гайды для новичков'),
-            (2, 1, '🏆 Продвинутые стратегии', 'Стратегии для опытных игроков'),
-            (3, 2, '⚔️ PvP сборки', 'Сборки для арены'),
-            (4, 2, '🐉 PvE сборки', 'Сборки для против боссов'),
-            (5, 3, '📢 Объявления', 'Важные объявления клана'),
-            (6, 3, '💡 Идеи и предложения', 'Предложения по развитию клана'),
-            (7, 4, '🌐 Официальные ресурсы', 'Официальные сайты и соцсети'),
-            (8, 4, '🛠️ Калькуляторы и инструменты', 'Полезные инструменты для игры')
-    ''')
-    
-    conn.commit()
-    conn.close()
-    print("✅ Database initialized")
-
-def safe_get(data, index, default="Неизвестно"):
-    """Безопасно получает элемент из кортежа по индексу"""
-    if data and len(data) > index:
-        return data[index]
-    return default
-
 def start(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
     
     # Создаем новую сессию для пользователя
-    session = create_user_session(user_id)
+    session = session_manager.create_session(user_id)
     
     keyboard = [
         [InlineKeyboardButton("📚 Просмотреть разделы", callback_data='view_sections')],
+        [InlineKeyboardButton("🔍 Поиск", callback_data='search')],
         [InlineKeyboardButton("➕ Создать раздел", callback_data='create_section')],
         [InlineKeyboardButton("📁 Создать подраздел", callback_data='create_subsection_choose_section')],
         [InlineKeyboardButton("📝 Добавить запись", callback_data='add_post_choose_section')],
@@ -202,123 +53,69 @@ def start(update: Update, context: CallbackContext):
     if update.message:
         update.message.reply_text(welcome_text, reply_markup=reply_markup)
     else:
-        update.callback_query.edit_message_text(welcome_text, reply_markup=reply_markup)
+        edit_text_sync(update.callback_query, welcome_text, reply_markup=reply_markup)
 
 def button_handler(update: Update, context: CallbackContext):
     query = update.callback_query
     user_id = update.effective_user.id
     
-    # Проверяем сессию для всех callback, кроме back_to_main
-    if query.data != 'back_to_main':
-        session = get_user_session(user_id)
+    # Проверяем сессию для всех callback, кроме кнопок навигации по записям
+    if callback_router.requires_session(query.data):
+        session = session_manager.get_session(user_id)
         if not session:
             query.answer("❌ Сессия устарела. Используйте /start", show_alert=True)
             return
     
-    query.answer()
-    
-    if query.data == 'view_sections':
-        show_sections(query, context)
-    elif query.data.startswith('view_section_'):
-        show_subsections(query, context)
-    elif query.data.startswith('view_subsection_'):
-        show_subsection_posts(query, context)
-    elif query.data.startswith('prev_post_') or query.data.startswith('next_post_'):
-        navigate_posts(query, context)
-    elif query.data == 'add_post_choose_section':
-        add_post_choose_section(query, context)
-    elif query.data.startswith('add_post_choose_subsection_'):
-        add_post_choose_subsection(query, context)
-    elif query.data.startswith('add_post_'):
-        add_post_start(query, context)
-    elif query.data == 'create_section':
-        create_section(query, context)
-    elif query.data == 'create_subsection_choose_section':
-        create_subsection_choose_section(query, context)
-    elif query.data.startswith('create_subsection_'):
-        create_subsection(query, context)
-    elif query.data == 'manage_content':
-        manage_content(query, context)
-    elif query.data == 'manage_sections':
-        manage_sections(query, context)
-    elif query.data.startswith('edit_section_'):
-        edit_section(query, context)
-    elif query.data.startswith('delete_section_'):
-        delete_section(query, context)
-    elif query.data.startswith('confirm_delete_section_'):
-        confirm_delete_section(query, context)
-    elif query.data.startswith('edit_subsection_'):
-        edit_subsection(query, context)
-    elif query.data.startswith('delete_subsection_'):
-        delete_subsection(query, context)
-    elif query.data.startswith('confirm_delete_subsection_'):
-        confirm_delete_subsection(query, context)
-    elif query.data.startswith('edit_post_'):
-        edit_post(query, context)
-    elif query.data.startswith('delete_post_'):
-        delete_post(query, context)
-    elif query.data.startswith('confirm_delete_post_'):
-        confirm_delete_post(query, context)
-    elif query.data == 'back_to_main':
-        back_to_main(query, context)
+    # Кнопка разбирается один раз: на найденный маршрут отвечаем перед обработчиком
+    if not callback_router.dispatch_sync(query.data, query, context, before=query.answer):
+        if is_packed(query.data):
+            query.answer("⚠️ Кнопка устарела. Откройте подраздел заново")
+        else:
+            query.answer("⚠️ Функция в разработке")
 
 def show_sections(query, context):
     user_id = query.from_user.id
-    session = get_user_session(user_id)
+    session = session_manager.get_session(user_id)
     if not session:
-        query.edit_message_text("❌ Сессия устарела. Используйте /start")
+        edit_text_sync(query, "❌ Сессия устарела. Используйте /start")
         return
     
-    conn = get_db_connection()
-    sections = conn.execute('SELECT * FROM sections ORDER BY id').fetchall()
-    conn.close()
+    conn = get_read_connection()
+    tree = content_cache.snapshot_sync(conn)
+    sections = tree.sections_with_counts()
     
     if not sections:
-        query.edit_message_text("Разделы пока не созданы.")
+        edit_text_sync(query, "Разделы пока не созданы.")
         return
     
     keyboard = []
-    for section in sections:
-        conn = get_db_connection()
-        subs_count = conn.execute('SELECT COUNT(*) FROM subsections WHERE section_id = ?', (section[0],)).fetchone()[0]
-        posts_count = conn.execute('''
-            SELECT COUNT(*) FROM posts p 
-            JOIN subsections s ON p.subsection_id = s.id 
-            WHERE s.section_id = ?
-        ''', (section[0],)).fetchone()[0]
-        conn.close()
-        
+    for section, subs_count, posts_count in sections:
         keyboard.append([InlineKeyboardButton(
-            f"{safe_get(section, 1)} ({subs_count} подраз., {posts_count} зап.)", 
-            callback_data=f"view_section_{section[0]}"
+            f"{section.name} ({subs_count} подраз., {posts_count} зап.)", 
+            callback_data=f"view_section_{section.id}"
         )])
     
     keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data='back_to_main')])
     reply_markup = InlineKeyboardMarkup(keyboard)
-    query.edit_message_text("📂 Выберите раздел:", reply_markup=reply_markup)
+    edit_text_sync(query, "📂 Выберите раздел:", reply_markup=reply_markup)
 
-def show_subsections(query, context):
+def show_subsections(query, context, section_id: int):
     user_id = query.from_user.id
-    session = get_user_session(user_id)
+    session = session_manager.get_session(user_id)
     if not session:
-        query.edit_message_text("❌ Сессия устарела. Используйте /start")
+        edit_text_sync(query, "❌ Сессия устарела. Используйте /start")
         return
     
-    section_id = int(query.data.split('_')[-1])
-    
     # Обновляем сессию
     session.current_section = section_id
     
-    conn = get_db_connection()
-    section = conn.execute('SELECT * FROM sections WHERE id = ?', (section_id,)).fetchone()
-    subsections = conn.execute(
-        'SELECT * FROM subsections WHERE section_id = ? ORDER BY id', 
-        (section_id,)
-    ).fetchall()
-    conn.close()
+    conn = get_read_connection()
+    tree = content_cache.snapshot_sync(conn)
+    section = tree.section(section_id)
+    subsections = tree.subsections_with_counts(section_id)
     
     if not section:
-        query.edit_message_text("❌ Раздел не найден!")
+        edit_text_sync(query, "❌ Раздел не найден!")
         return
     
     if not subsections:
@@ -330,18 +127,14 @@ def show_subsections(query, context):
             [InlineKeyboardButton("🏠 Главное меню", callback_data='back_to_main')]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        query.edit_message_text(f"В разделе '{safe_get(section, 1)}' пока нет подразделов.\n\nСоздайте первый подраздел!", reply_markup=reply_markup)
+        edit_text_sync(query, f"В разделе '{section.name}' пока нет подразделов.\n\nСоздайте первый подраздел!", reply_markup=reply_markup)
         return
     
     keyboard = []
-    for subsection in subsections:
-        conn = get_db_connection()
-        posts_count = conn.execute('SELECT COUNT(*) FROM posts WHERE subsection_id = ?', (subsection[0],)).fetchone()[0]
-        conn.close()
-        
+    for subsection, posts_count in subsections:
         keyboard.append([InlineKeyboardButton(
-            f"{safe_get(subsection, 2)} ({posts_count} зап.)", 
-            callback_data=f"view_subsection_{subsection[0]}"
+            f"{subsection.name} ({posts_count} зап.)", 
+            callback_data=f"view_subsection_{subsection.id}"
         )])
     
     keyboard.extend([
@@ -353,66 +146,66 @@ def show_subsections(query, context):
     ])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    query.edit_message_text(f"📁 Раздел: {safe_get(section, 1)}\n\nВыберите подраздел:", reply_markup=reply_markup)
+    edit_text_sync(query, f"📁 Раздел: {section.name}\n\nВыберите подраздел:", reply_markup=reply_markup)
 
-def show_subsection_posts(query, context):
+def show_subsection_posts(query, context, subsection_id: int):
     user_id = query.from_user.id
-    session = get_user_session(user_id)
+    session = session_manager.get_session(user_id)
     if not session:
-        query.edit_message_text("❌ Сессия устарела. Используйте /start")
+        edit_text_sync(query, "❌ Сессия устарела. Используйте /start")
         return
     
-    subsection_id = int(query.data.split('_')[-1])
-    
-    # Обновляем сессию пользователя
-    session.current_subsection = subsection_id
-    session.current_post_index = 0
-    
-    conn = get_db_connection()
-    subsection = conn.execute('SELECT * FROM subsections WHERE id = ?', (subsection_id,)).fetchone()
-    section = conn.execute('SELECT * FROM sections WHERE id = ?', (subsection[1],)).fetchone()
-    posts = conn.execute(
-        'SELECT * FROM posts WHERE subsection_id = ? ORDER BY created_at DESC', 
-        (subsection_id,)
-    ).fetchall()
-    conn.close()
+    conn = get_read_connection()
+    tree = content_cache.snapshot_sync(conn)
+    subsection = tree.subsection(subsection_id)
+    section = tree.section(subsection.section_id) if subsection else None
+    if not subsection or not section:
+        # Подраздел удалили, пока у пользователя была открыта старая кнопка
+        keyboard = [[InlineKeyboardButton("📂 К разделам", callback_data='view_sections')]]
+        edit_text_sync(query, "❌ Подраздел не найден!", reply_markup=InlineKeyboardMarkup(keyboard))
+        return
     
-    # Сохраняем посты в сессии пользователя
-    session.posts = posts
+    # Загружаем только первую запись (и признак следующей), а не весь подраздел
+    posts = first_posts(conn, subsection_id)
     
     if not posts:
         keyboard = [
             [InlineKeyboardButton("📝 Добавить запись", callback_data=f"add_post_{subsection_id}")],
             [InlineKeyboardButton("✏️ Редактировать подраздел", callback_data=f"edit_subsection_{subsection_id}")],
             [InlineKeyboardButton("🗑️ Удалить подраздел", callback_data=f"delete_subsection_{subsection_id}")],
-            [InlineKeyboardButton("📁 К подразделам", callback_data=f"view_section_{section[0]}")],
+            [InlineKeyboardButton("📁 К подразделам", callback_data=f"view_section_{section.id}")],
             [InlineKeyboardButton("🏠 Главное меню", callback_data='back_to_main')]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        query.edit_message_text(
-            f"📁 Раздел: {safe_get(section, 1)}\n"
-            f"📂 Подраздел: {safe_get(subsection, 2)}\n\n"
+        edit_text_sync(
+            query,
+            f"📁 Раздел: {section.name}\n"
+            f"📂 Подраздел: {subsection.name}\n\n"
             f"Записей пока нет.\n\n"
             f"Создайте первую запись!",
             reply_markup=reply_markup
         )
         return
     
+    post = posts[0]
+    total = tree.post_count(subsection_id)
+    
     # Показываем первую запись с навигацией
-    show_post_navigation(query, context, posts[0], 0, len(posts), subsection, section)
+    show_post_navigation(query, context, post, 0, total, subsection, section, False, len(posts) > 1)
 
-def show_post_navigation(query, context, post, index, total, subsection, section):
-    post_text = f"📁 {safe_get(section, 1)} → {safe_get(subsection, 2)}\n\n"
-    post_text += f"📌 {safe_get(post, 4)}\n\n"
+def show_post_navigation(query, context, post, index, total, subsection, section, has_prev, has_next):
+    post_text = f"📁 {section.name} → {subsection.name}\n\n"
+    post_text += f"📌 {post.title}\n\n"
     
-    if safe_get(post, 6):  # content_text
-        post_text += f"{safe_get(post, 6)}\n\n"
+    if post.content_text:
+        post_text += f"{post.content_text}\n\n"
     
-    if safe_get(post, 8) and safe_get(post, 9):  # link_url и link_title
-        post_text += f"🔗 {safe_get(post, 9)}\n{safe_get(post, 8)}\n\n"
+    if post.link_url and post.link_title:
+        post_text += f"🔗 {post.link_title}\n{post.link_url}\n\n"
     
-    post_text += f"👤 Автор: {safe_get(post, 3)}\n"
-    post_text += f"📅 {safe_get(post, 10)}\n"
+    post_text += f"👤 Автор: {post.user_name or 'Неизвестно'}\n"
+    if post.created_at:
+        post_text += f"📅 {post.created_at}\n"
     post_text += f"📊 ({index + 1}/{total})"
     
     # Кнопки навигации
@@ -420,64 +213,189 @@ def show_post_navigation(query, context, post, index, total, subsection, section
     
     # Навигация между записями
     nav_buttons = []
-    if index > 0:
-        nav_buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"prev_post_{index}"))
-    if index < total - 1:
-        nav_buttons.append(InlineKeyboardButton("Вперед ➡️", callback_data=f"next_post_{index}"))
+    if has_prev:
+        prev_data = encode_navigation(ROUTE_PREV_POST, subsection.id, index, post.cursor)
+        nav_buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data=prev_data))
+    if has_next:
+        next_data = encode_navigation(ROUTE_NEXT_POST, subsection.id, index, post.cursor)
+        nav_buttons.append(InlineKeyboardButton("Вперед ➡️", callback_data=next_data))
     
     if nav_buttons:
         keyboard.append(nav_buttons)
     
     # Кнопки действий
     keyboard.extend([
-        [InlineKeyboardButton("✏️ Редактировать запись", callback_data=f"edit_post_{post[0]}")],
-        [InlineKeyboardButton("🗑️ Удалить запись", callback_data=f"delete_post_{post[0]}")],
-        [InlineKeyboardButton("📝 Добавить запись", callback_data=f"add_post_{subsection[0]}")],
-        [InlineKeyboardButton("✏️ Редактировать подраздел", callback_data=f"edit_subsection_{subsection[0]}")],
-        [InlineKeyboardButton("🗑️ Удалить подраздел", callback_data=f"delete_subsection_{subsection[0]}")],
-        [InlineKeyboardButton("📁 К подразделам", callback_data=f"view_section_{section[0]}")],
+        [InlineKeyboardButton("✏️ Редактировать запись", callback_data=f"edit_post_{post.id}")],
+        [InlineKeyboardButton("🗑️ Удалить запись", callback_data=f"delete_post_{post.id}")],
+        [InlineKeyboardButton("📝 Добавить запись", callback_data=f"add_post_{subsection.id}")],
+        [InlineKeyboardButton("✏️ Редактировать подраздел", callback_data=f"edit_subsection_{subsection.id}")],
+        [InlineKeyboardButton("🗑️ Удалить подраздел", callback_data=f"delete_subsection_{subsection.id}")],
+        [InlineKeyboardButton("📁 К подразделам", callback_data=f"view_section_{section.id}")],
         [InlineKeyboardButton("🏠 Главное меню", callback_data='back_to_main')]
     ])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    if safe_get(post, 7):  # image_file_id
-        query.edit_message_caption(caption=post_text, reply_markup=reply_markup)
+    if post.image_file_id:
+        edit_photo_sync(query, post.image_file_id, post_text, reply_markup=reply_markup)
     else:
-        query.edit_message_text(post_text, reply_markup=reply_markup)
+        edit_text_sync(query, post_text, reply_markup=reply_markup)
 
-def navigate_posts(query, context):
-    user_id = query.from_user.id
-    session = get_user_session(user_id)
-    if not session:
-        query.edit_message_text("❌ Сессия устарела. Используйте /start")
+# Подраздел и курсор текущей записи приходят в самой кнопке, сессия не нужна
+def navigate_posts(query, context, navigation: PostNavigation):
+    subsection_id = navigation.subsection_id
+    action = 'prev' if navigation.route == ROUTE_PREV_POST else 'next'
+    
+    conn = get_read_connection()
+    tree = content_cache.snapshot_sync(conn)
+    subsection = tree.subsection(subsection_id)
+    section = tree.section(subsection.section_id) if subsection else None
+    if not subsection or not section:
+        edit_text_sync(query, "❌ Подраздел не найден!")
         return
     
-    action = query.data.split('_')[0]  # 'prev' или 'next'
-    current_index = int(query.data.split('_')[-1])
+    # Соседнюю запись ищем от курсора, поэтому добавление и удаление записей
+    # другими участниками не сбивает навигацию
+    if action == 'prev':
+        posts = newer_posts(conn, subsection_id, navigation.cursor)
+        new_index = navigation.index - 1
+    else:  # next
+        posts = older_posts(conn, subsection_id, navigation.cursor)
+        new_index = navigation.index + 1
     
-    subsection_id = session.current_subsection
-    posts = session.posts
+    if not posts:
+        # Соседние записи удалены - возвращаемся к началу подраздела
+        posts = first_posts(conn, subsection_id)
+        action, new_index = 'first', 0
+        if not posts:
+            edit_text_sync(query, "❌ Записи не найдены!")
+            return
     
-    conn = get_db_connection()
-    subsection = conn.execute('SELECT * FROM subsections WHERE id = ?', (subsection_id,)).fetchone()
-    section = conn.execute('SELECT * FROM sections WHERE id = ?', (subsection[1],)).fetchone()
-    conn.close()
+    post = posts[0]
+    total = tree.post_count(subsection_id)
+    has_more = len(posts) > 1
     
     if action == 'prev':
-        new_index = current_index - 1
-    else:  # next
-        new_index = current_index + 1
+        has_prev, has_next = has_more, True
+        if not has_prev:
+            new_index = 0
+    elif action == 'next':
+        has_prev, has_next = True, has_more
+        if not has_next:
+            new_index = total - 1
+    else:
+        has_prev, has_next = False, has_more
+    new_index = max(0, min(new_index, total - 1))
     
-    session.current_post_index = new_index
-    show_post_navigation(query, context, posts[new_index], new_index, len(posts), subsection, section)
+    show_post_navigation(query, context, post, new_index, total, subsection, section, has_prev, has_next)
+
+def search_start(query, context):
+    session = session_manager.get_session(query.from_user.id)
+    session.clear_adding_state()
+    session.awaiting_search_query = True
+    
+    keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data='back_to_main')]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    edit_text_sync(query, "🔍 Введите слова для поиска по записям:", reply_markup=reply_markup)
+
+def search_command(update: Update, context: CallbackContext):
+    """Команда /search <запрос> - открывает сессию, если ее еще нет"""
+    user_id = update.effective_user.id
+    session = session_manager.ensure_session(user_id)
+    text = ' '.join(context.args)
+    
+    session.clear_adding_state()
+    if not text:
+        session.awaiting_search_query = True
+        update.message.reply_text("🔍 Введите слова для поиска по записям:")
+        return
+    
+    session.search_query = text
+    result_text, reply_markup = render_search_results(text, 0)
+    update.message.reply_text(result_text, reply_markup=reply_markup)
+
+def render_search_results(text, page):
+    conn = get_read_connection()
+    results, has_next, truncated = search(conn, text, page)
+    tree = content_cache.snapshot_sync(conn)
+    
+    keyboard = []
+    if not results:
+        result_text = f"🔍 По запросу «{text}» ничего не найдено."
+    else:
+        result_text = f"🔍 Результаты по запросу «{text}» (стр. {page + 1}):\n\n"
+        if truncated:
+            result_text += f"⚠️ Совпадений больше {SEARCH_RANK_LIMIT}: показаны лучшие среди самых новых. Уточните запрос.\n\n"
+        for number, (post_id, subsection_id, title, preview) in enumerate(results, start=page * SEARCH_PAGE_SIZE + 1):
+            subsection = tree.subsection(subsection_id)
+            result_text += f"{number}. 📌 {title}\n📂 {subsection.name if subsection else 'Неизвестно'}\n"
+            if preview:
+                result_text += f"{preview}…\n"
+            result_text += "\n"
+            keyboard.append([InlineKeyboardButton(f"{number}. {title}", callback_data=f"search_open_{post_id}")])
+    
+    # Постраничная навигация по результатам
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"search_page_{page - 1}"))
+    if has_next:
+        nav_buttons.append(InlineKeyboardButton("Вперед ➡️", callback_data=f"search_page_{page + 1}"))
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+    
+    keyboard.extend([
+        [InlineKeyboardButton("🔍 Новый поиск", callback_data='search')],
+        [InlineKeyboardButton("🏠 Главное меню", callback_data='back_to_main')]
+    ])
+    return result_text, InlineKeyboardMarkup(keyboard)
+
+def search_page(query, context, page: int):
+    session = session_manager.get_session(query.from_user.id)
+    if not session.search_query:
+        edit_text_sync(query, "❌ Сессия устарела. Используйте /start")
+        return
+    
+    result_text, reply_markup = render_search_results(session.search_query, page)
+    edit_text_sync(query, result_text, reply_markup=reply_markup)
+
+def open_search_result(query, context, post_id: int):
+    conn = get_read_connection()
+    post = post_by_id(conn, post_id)
+    if not post:
+        edit_text_sync(query, "❌ Запись не найдена!")
+        return
+    
+    tree = content_cache.snapshot_sync(conn)
+    subsection = tree.subsection(post.subsection_id)
+    section = tree.section(subsection.section_id) if subsection else None
+    if not subsection or not section:
+        edit_text_sync(query, "❌ Подраздел не найден!")
+        return
+    
+    # Открываем запись в ленте ее подраздела, чтобы дальше работала обычная навигация
+    index = post_position(conn, post)
+    total = tree.post_count(post.subsection_id)
+    index = min(index, total - 1)
+    
+    show_post_navigation(query, context, post, index, total, subsection, section, index > 0, index < total - 1)
 
 # ... (остальные функции остаются похожими, но с проверкой сессии)
 
+# Маршруты кнопок; кнопки редактирования и удаления в этой версии еще не реализованы
+callback_router = CallbackRouter()
+callback_router.exact('view_sections', show_sections)
+callback_router.prefixed('view_section', show_subsections)
+callback_router.prefixed('view_subsection', show_subsection_posts)
+callback_router.packed(ROUTE_PREV_POST, 'prev_post', navigate_posts)
+callback_router.packed(ROUTE_NEXT_POST, 'next_post', navigate_posts)
+callback_router.exact('search', search_start)
+callback_router.prefixed('search_page', search_page)
+callback_router.prefixed('search_open', open_search_result)
+
 def handle_message(update: Update, context: CallbackContext):
     """Обработчик текстовых сообщений - реагирует только на активные сессии"""
     user_id = update.effective_user.id
-    session = get_user_session(user_id)
+    session = session_manager.get_session(user_id)
     
     # Если нет активной сессии - ИГНОРИРУЕМ сообщение (бот молчит)
     if not session:
@@ -485,30 +403,31 @@ def handle_message(update: Update, context: CallbackContext):
     
     user = update.effective_user
     
-    if session.awaiting_subsection_name:
+    if session.awaiting_search_query:
+        session.awaiting_search_query = False
+        session.search_query = update.message.text
+        result_text, reply_markup = render_search_results(session.search_query, 0)
+        update.message.reply_text(result_text, reply_markup=reply_markup)
+    
+    elif session.awaiting_subsection_name:
         subsection_name = update.message.text
         
         if session.editing_subsection:
             # Редактирование существующего подраздела
             subsection_id = session.editing_subsection
-            conn = get_db_connection()
-            conn.execute('UPDATE subsections SET name = ? WHERE id = ?', (subsection_name, subsection_id))
-            conn.commit()
-            conn.close()
+            execute_sync('UPDATE subsections SET name = ? WHERE id = ?', (subsection_name, subsection_id))
+            content_cache.invalidate()
             
             session.clear_adding_state()
             update.message.reply_text(f"✅ Подраздел '{subsection_name}' успешно обновлен!")
         else:
             # Создание нового подраздела
             section_id = session.creating_subsection['section_id']
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
+            execute_sync(
                 'INSERT INTO subsections (section_id, name, description, created_by) VALUES (?, ?, ?, ?)',
                 (section_id, subsection_name, "Описание подраздела", user.id)
             )
-            conn.commit()
-            conn.close()
+            content_cache.invalidate()
             
             session.clear_adding_state()
             update.message.reply_text(f"✅ Подраздел '{subsection_name}' успешно создан!")
@@ -521,23 +440,18 @@ def handle_message(update: Update, context: CallbackContext):
         if session.editing_section:
             # Редактирование существующего раздела
             section_id = session.editing_section
-            conn = get_db_connection()
-            conn.execute('UPDATE sections SET name = ? WHERE id = ?', (section_name, section_id))
-            conn.commit()
-            conn.close()
+            execute_sync('UPDATE sections SET name = ? WHERE id = ?', (section_name, section_id))
+            content_cache.invalidate()
             
             session.clear_adding_state()
             update.message.reply_text(f"✅ Раздел '{section_name}' успешно обновлен!")
         else:
             # Создание нового раздела
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
+            execute_sync(
                 'INSERT INTO sections (name, description, created_by) VALUES (?, ?, ?)',
                 (section_name, "Описание раздела", user.id)
             )
-            conn.commit()
-            conn.close()
+            content_cache.invalidate()
             
             session.clear_adding_state()
             update.message.reply_text(f"✅ Раздел '{section_name}' успешно создан!")
@@ -560,9 +474,7 @@ def handle_message(update: Update, context: CallbackContext):
             post_data['content_text'] = update.message.text
             
             # Сохраняем запись в БД
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
+            execute_sync('''
                 INSERT INTO posts (subsection_id, user_id, user_name, title, content_type, content_text)
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (
@@ -573,8 +485,7 @@ def handle_message(update: Update, context: CallbackContext):
                 'text',
                 post_data['content_text']
             ))
-            conn.commit()
-            conn.close()
+            content_cache.invalidate()
             
             session.clear_adding_state()
             update.message.reply_text("✅ Запись успешно добавлена!")
@@ -585,7 +496,7 @@ def handle_message(update: Update, context: CallbackContext):
 def handle_photo(update: Update, context: CallbackContext):
     """Обработчик фото - реагирует только на активные сессии"""
     user_id = update.effective_user.id
-    session = get_user_session(user_id)
+    session = session_manager.get_session(user_id)
     
     # Если нет активной сессии - ИГНОРИРУЕМ фото (бот молчит)
     if not session:
@@ -603,6 +514,7 @@ def handle_photo(update: Update, context: CallbackContext):
 def back_to_main_message(update: Update, context: CallbackContext):
     keyboard = [
         [InlineKeyboardButton("📚 Просмотреть разделы", callback_data='view_sections')],
+        [InlineKeyboardButton("🔍 Поиск", callback_data='search')],
         [InlineKeyboardButton("➕ Создать раздел", callback_data='create_section')],
         [InlineKeyboardButton("📁 Создать подраздел", callback_data='create_subsection_choose_section')],
         [InlineKeyboardButton("📝 Добавить запись", callback_data='add_post_choose_section')],
@@ -612,6 +524,24 @@ def back_to_main_message(update: Update, context: CallbackContext):
     reply_markup = InlineKeyboardMarkup(keyboard)
     update.message.reply_text('🏰 Главное меню базы знаний клана:', reply_markup=reply_markup)
 
+def refresh_session(update: Update, context: CallbackContext):
+    """Сверяет сессию с общим хранилищем до обработчиков обновления (группа -1)"""
+    if update.effective_user:
+        session_manager.refresh(update.effective_user.id)
+
+def commit_session(update: Update, context: CallbackContext):
+    """Записывает сессию после обработчиков обновления (группа 1)"""
+    if update.effective_user:
+        session_manager.commit(update.effective_user.id)
+
+def maintain_sessions(context: CallbackContext):
+    """Удаляет просроченные сессии и сбрасывает измененные в базу (задача JobQueue)"""
+    session_manager.maintain()
+
+def report_metrics(context: CallbackContext):
+    """Пишет счетчики компонентов в лог одной строкой JSON (задача JobQueue)"""
+    report(component_sources(callback_router))
+
 def main():
     # Используем токен из config.py
     TOKEN = BOT_TOKEN
@@ -620,6 +550,9 @@ def main():
         print("❌ BOT_TOKEN не настроен! Проверьте файл config.py")
         return
     
+    # Кнопки навигации подписываются ключом из токена: одинаковым у всех процессов и после перезапуска
+    set_callback_secret(TOKEN)
+    
     try:
         # Инициализируем базу данных
         init_db()
@@ -628,18 +561,33 @@ def main():
         updater = Updater(TOKEN, use_context=True)
         dp = updater.dispatcher
         
+        # Сессия сверяется с хранилищем до обработчиков и записывается после них
+        dp.add_handler(TypeHandler(Update, refresh_session), group=-1)
+        dp.add_handler(TypeHandler(Update, commit_session), group=1)
+        
         # Добавляем обработчики - ВАЖНО: правильный порядок
         dp.add_handler(CommandHandler("start", start))
+        dp.add_handler(CommandHandler("search", search_command))
         dp.add_handler(CallbackQueryHandler(button_handler))
         
         # Обработчики сообщений - будут срабатывать ТОЛЬКО при активной сессии
         dp.add_handler(MessageHandler(Filters.text & ~Filters.command, handle_message))
         dp.add_handler(MessageHandler(Filters.photo, handle_photo))
         
+        # Фоновая очистка просроченных сессий и сброс измененных в базу
+        updater.job_queue.run_repeating(maintain_sessions, interval=SESSION_FLUSH_INTERVAL, first=SESSION_FLUSH_INTERVAL)
+        if METRICS_INTERVAL > 0:
+            updater.job_queue.run_repeating(report_metrics, interval=METRICS_INTERVAL, first=METRICS_INTERVAL)
+        
         print("✅ Bot started successfully! Will only respond to /start and active sessions.")
+        # Только polling: режим webhook есть у bot.py и bot_session.py (см. webhook.py)
         updater.start_polling()
         updater.idle()
         
+        # Сохраняем сессии и закрываем соединения с базой данных
+        session_manager.flush(wait=True)
+        shutdown()
+        
     except Exception as e:
         print(f"❌ Bot error: {e}")
         import traceback
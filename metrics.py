@@ -0,0 +1,71 @@
+# metrics.py
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Optional
+
+from content_cache import content_cache
+from database import read_replica, write_queue
+from render_memory import render_memory
+from repository import post_cache
+from session_manager import session_manager
+
+# Период записи метрик в лог, секунды; 0 - не записывать
+METRICS_INTERVAL = int(os.getenv('METRICS_INTERVAL', 60))
+
+logger = logging.getLogger('metrics')
+
+def component_sources(router: Any = None, application: Any = None) -> Dict[str, Any]:
+    """Компоненты бота со счетчиками stats(); application - приложение PTB 20"""
+    sources = {
+        'sessions': session_manager,
+        'content_cache': content_cache,
+        'post_cache': post_cache,
+        'render_memory': render_memory,
+        'write_queue': write_queue,
+        'read_replica': read_replica,
+    }
+    if router is not None:
+        sources['router'] = router
+    if application is not None:
+        sources['updates'] = application.update_processor
+        sources['update_queue'] = application.update_queue
+        sources['send_scheduler'] = application.bot.rate_limiter
+    return sources
+
+def collect(sources: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """stats() каждого компонента под его именем; компоненты без stats() пропускаются"""
+    return {name: source.stats() for name, source in sources.items() if hasattr(source, 'stats')}
+
+def report(sources: Dict[str, Any]):
+    """Одна строка лога со всеми метриками в JSON - для сбора и алертов"""
+    logger.info('%s', json.dumps(collect(sources), ensure_ascii=False, sort_keys=True, default=str))
+
+class MetricsReporter:
+    """Периодическая запись метрик в лог в цикле событий бота"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def _loop(self, sources: Callable[[], Dict[str, Any]], interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                report(sources())
+            except Exception:
+                logger.exception("Metrics report failed")
+
+    def start(self, sources: Callable[[], Dict[str, Any]], interval: float = METRICS_INTERVAL):
+        """Запускает запись метрик раз в interval секунд в текущем цикле событий"""
+        if self._task is None and interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self._loop(sources, interval))
+
+    def stop(self):
+        """Останавливает запись метрик"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+# Глобальный сборщик метрик
+metrics_reporter = MetricsReporter()
@@ -0,0 +1,411 @@
+# migrations.py
+import sqlite3
+import sys
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from database import DB_PATH, get_db_connection, start_read_replica
+from content_cache import content_cache
+from session_manager import SESSION_BACKEND, start_session_persistence
+from repository import (SECTIONS_SQL, SUBSECTIONS_WITH_COUNTS_SQL, FIRST_POSTS_SQL, OLDER_POSTS_SQL, NEWER_POSTS_SQL,
+                        OLDER_POSTS_BY_ID_SQL, NEWER_POSTS_BY_ID_SQL, POST_BY_ID_SQL, POST_POSITION_SQL)
+
+def _initial_schema(conn: sqlite3.Connection):
+    """Таблицы разделов, подразделов, записей и базовые разделы"""
+    # Таблица разделов
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            created_by INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Таблица подразделов
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS subsections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            section_id INTEGER,
+            name TEXT NOT NULL,
+            description TEXT,
+            created_by INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (section_id) REFERENCES sections (id)
+        )
+    ''')
+
+    # Таблица записей
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subsection_id INTEGER,
+            user_id INTEGER,
+            user_name TEXT,
+            title TEXT NOT NULL,
+            content_type TEXT CHECK(content_type IN ('text', 'image', 'link', 'mixed')),
+            content_text TEXT,
+            image_file_id TEXT,
+            link_url TEXT,
+            link_title TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (subsection_id) REFERENCES subsections (id)
+        )
+    ''')
+
+    # Создаем базовые разделы
+    conn.execute('''
+        INSERT OR IGNORE INTO sections (id, name, description)
+        VALUES
+            (1, '📚 Гайды по игре', 'Полезные гайды и стратегии'),
+            (2, '⚔️ Библиотека сборок', 'Эффективные сборки персонажей'),
+            (3, '📝 Заметки клана', 'Важные объявления и заметки'),
+            (4, '🔗 Полезные ссылки', 'Ссылки на ресурсы и инструменты')
+    ''')
+
+    # Создаем базовые подразделы
+    conn.execute('''
+        INSERT OR IGNORE INTO subsections (id, section_id, name, description)
+        VALUES
+            (1, 1, '🎯 Основы игры', 'Базовые гайды для новичков'),
+            (2, 1, '🏆 Продвинутые стратегии', 'Стратегии для опытных игроков'),
+            (3, 2, '⚔️ PvP сборки', 'Сборки для арены'),
+            (4, 2, '🐉 PvE сборки', 'Сборки для против боссов'),
+            (5, 3, '📢 Объявления', 'Важные объявления клана'),
+            (6, 3, '💡 Идеи и предложения', 'Предложения по развитию клана'),
+            (7, 4, '🌐 Официальные ресурсы', 'Официальные сайты и соцсети'),
+            (8, 4, '🛠️ Калькуляторы и инструменты', 'Полезные инструменты для игры')
+    ''')
+
+def _navigation_indexes(conn: sqlite3.Connection):
+    """Индексы для списков подразделов и ленты записей подраздела"""
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_posts_subsection_created
+        ON posts (subsection_id, created_at DESC, id DESC)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_subsections_section
+        ON subsections (section_id, id)
+    ''')
+
+def _fold_yo(row: str) -> str:
+    """SQL-выражения колонок поиска строки new/old с заменой ё на е"""
+    return ', '.join(
+        f"replace(replace({row}.{column}, 'ё', 'е'), 'Ё', 'Е')"
+        for column in ('title', 'content_text', 'link_title')
+    )
+
+def _posts_search(conn: sqlite3.Connection):
+    """Полнотекстовый индекс FTS5 по записям, синхронизируемый триггерами"""
+    # unicode61 приводит кириллицу к нижнему регистру, префиксные индексы до длины основы
+    # (SEARCH_STEM_LENGTH) позволяют искать по началу слова без перебора словаря
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+            title, content_text, link_title,
+            content='posts', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3 4 5 6'
+        )
+    ''')
+    # Заголовок весит больше текста записи и названия ссылки
+    conn.execute("INSERT INTO posts_fts (posts_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 5.0)')")
+
+    _posts_search_triggers(conn)
+
+    # Индексируем уже существующие записи
+    _posts_search_reindex(conn)
+
+def _posts_search_reindex(conn: sqlite3.Connection):
+    """Заполняет posts_fts заново по всем записям"""
+    conn.execute("INSERT INTO posts_fts (posts_fts) VALUES ('delete-all')")
+    conn.execute(f'''
+        INSERT INTO posts_fts (rowid, title, content_text, link_title)
+        SELECT posts.id, {_fold_yo('posts')} FROM posts
+    ''')
+
+def _posts_search_triggers(conn: sqlite3.Connection):
+    """Триггеры, синхронизирующие posts_fts с таблицей posts"""
+    # unicode61 не снимает диакритику с кириллицы, поэтому ё заменяется на е при индексации
+    # (и в build_match_query). По той же причине индекс нельзя пересобирать командой 'rebuild'.
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+            INSERT INTO posts_fts (rowid, title, content_text, link_title)
+            VALUES (new.id, {_fold_yo('new')});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+            INSERT INTO posts_fts (posts_fts, rowid, title, content_text, link_title)
+            VALUES ('delete', old.id, {_fold_yo('old')});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF title, content_text, link_title ON posts BEGIN
+            INSERT INTO posts_fts (posts_fts, rowid, title, content_text, link_title)
+            VALUES ('delete', old.id, {_fold_yo('old')});
+            INSERT INTO posts_fts (rowid, title, content_text, link_title)
+            VALUES (new.id, {_fold_yo('new')});
+        END
+    ''')
+
+# Объекты, которые поддерживаются на каждую вставку и откладываются на время массовой загрузки
+BULK_LOAD_INDEXES = ('idx_posts_subsection_created', 'idx_subsections_section')
+BULK_LOAD_TRIGGERS = (
+    'posts_fts_insert', 'posts_fts_delete', 'posts_fts_update',
+    'posts_version_insert', 'posts_version_update', 'posts_version_delete'
+)
+FTS_DEFAULT_HASHSIZE = 1024 * 1024
+BULK_LOAD_FTS_HASHSIZE = 64 * 1024 * 1024
+
+def drop_bulk_load_hooks(conn: sqlite3.Connection):
+    """Удаляет индексы навигации и триггеры поиска перед массовой загрузкой"""
+    for index in BULK_LOAD_INDEXES:
+        conn.execute(f'DROP INDEX IF EXISTS {index}')
+    for trigger in BULK_LOAD_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+
+def restore_bulk_load_hooks(conn: sqlite3.Connection):
+    """Строит индексы навигации, триггеры и полнотекстовый индекс после массовой загрузки"""
+    _navigation_indexes(conn)
+    _posts_search_triggers(conn)
+    _content_version_triggers(conn, ('posts',))
+    conn.execute('UPDATE content_version SET version = version + 1')
+
+    # Больший буфер терминов FTS5 - меньше сегментов и слияний при индексации всей таблицы разом
+    conn.execute(f"INSERT INTO posts_fts (posts_fts, rank) VALUES ('hashsize', {BULK_LOAD_FTS_HASHSIZE})")
+    _posts_search_reindex(conn)
+    conn.execute(f"INSERT INTO posts_fts (posts_fts, rank) VALUES ('hashsize', {FTS_DEFAULT_HASHSIZE})")
+
+def restore_interrupted_bulk_load(conn: sqlite3.Connection) -> bool:
+    """Восстанавливает индексы и триггеры, оставшиеся удаленными после прерванной загрузки дампа.
+
+    Загрузка фиксируется пачками, поэтому удаленные объекты фиксируются вместе с первой
+    пачкой; без триггеров поиск не видит загруженные записи, и индекс строится заново"""
+    existing = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")}
+    missing = [name for name in BULK_LOAD_INDEXES + BULK_LOAD_TRIGGERS if name not in existing]
+    if not missing:
+        return False
+
+    print(f"⚠️ Interrupted dump import detected: restoring {', '.join(missing)} and rebuilding the search index")
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        restore_bulk_load_hooks(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+def _rebuild_table(conn: sqlite3.Connection, table: str, create_sql: str):
+    """Пересоздает таблицу по новому определению, сохраняя строки, id и счетчик AUTOINCREMENT"""
+    sequence = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()
+    columns = ', '.join(row[1] for row in conn.execute(f'PRAGMA table_info({table})'))
+
+    conn.execute(create_sql.format(table=f'{table}_new'))
+    conn.execute(f'INSERT INTO {table}_new ({columns}) SELECT {columns} FROM {table}')
+    conn.execute(f'DROP TABLE {table}')
+    conn.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+
+    if sequence:
+        conn.execute('UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = ?', (sequence[0], table))
+
+def _cascade_deletes(conn: sqlite3.Connection):
+    """Внешние ключи с ON DELETE CASCADE: раздел удаляется одним запросом вместе с содержимым"""
+    # Подразделы и записи, оставшиеся от удаленных родителей, не видны в боте и нарушили бы ограничения
+    conn.execute('DELETE FROM subsections WHERE section_id NOT IN (SELECT id FROM sections)')
+    conn.execute('DELETE FROM posts WHERE subsection_id NOT IN (SELECT id FROM subsections)')
+
+    _rebuild_table(conn, 'subsections', '''
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            section_id INTEGER,
+            name TEXT NOT NULL,
+            description TEXT,
+            created_by INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (section_id) REFERENCES sections (id) ON DELETE CASCADE
+        )
+    ''')
+    _rebuild_table(conn, 'posts', '''
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subsection_id INTEGER,
+            user_id INTEGER,
+            user_name TEXT,
+            title TEXT NOT NULL,
+            content_type TEXT CHECK(content_type IN ('text', 'image', 'link', 'mixed')),
+            content_text TEXT,
+            image_file_id TEXT,
+            link_url TEXT,
+            link_title TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (subsection_id) REFERENCES subsections (id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Индексы и триггеры удаляются вместе со старыми таблицами; posts_fts остается верным,
+    # так как id записей сохранены
+    _navigation_indexes(conn)
+    _posts_search_triggers(conn)
+
+    problems = conn.execute('PRAGMA foreign_key_check').fetchall()
+    if problems:
+        raise sqlite3.IntegrityError(f"Foreign key violations after rebuild: {problems[:5]}")
+
+def _user_sessions(conn: sqlite3.Connection):
+    """Таблица сессий пользователей, переживающих перезапуск бота"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            user_id INTEGER PRIMARY KEY,
+            updated_at REAL NOT NULL,
+            data TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at)')
+
+def _session_versions(conn: sqlite3.Connection):
+    """Версия строки сессии для сравнения с записью при общем хранилище"""
+    conn.execute('ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+
+# Таблицы контента, любое изменение которых увеличивает content_version
+CONTENT_TABLES = ('sections', 'subsections', 'posts')
+
+def _content_version_triggers(conn: sqlite3.Connection, tables: Sequence[str] = CONTENT_TABLES):
+    """Триггеры, увеличивающие content_version при изменении контента"""
+    for table in tables:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+                    UPDATE content_version SET version = version + 1;
+                END
+            ''')
+
+def _content_version(conn: sqlite3.Connection):
+    """Счетчик изменений контента: по нему кэши процесса замечают записи других процессов бота"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS content_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO content_version (id, version) VALUES (1, 0)')
+    _content_version_triggers(conn)
+
+def _posts_without_date(conn: sqlite3.Connection):
+    """Пустая строка вместо NULL в created_at: с NULL сравнение курсора (created_at, id)
+    неопределено, и такие записи выпадали из навигации"""
+    conn.execute("UPDATE posts SET created_at = '' WHERE created_at IS NULL")
+
+# Миграции применяются по порядку, номер сохраняется в PRAGMA user_version
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, 'Начальная схема', _initial_schema),
+    (2, 'Индексы для навигации', _navigation_indexes),
+    (3, 'Полнотекстовый поиск по записям', _posts_search),
+    (4, 'Каскадное удаление разделов и подразделов', _cascade_deletes),
+    (5, 'Сессии пользователей', _user_sessions),
+    (6, 'Версии сессий для нескольких процессов', _session_versions),
+    (7, 'Счетчик изменений контента', _content_version),
+    (8, 'Записи без даты', _posts_without_date),
+]
+
+# Запросы, выполняемые на каждое нажатие кнопки, и таблицы, которые им разрешено сканировать целиком
+HOT_QUERIES: Dict[str, Tuple[str, Sequence, Tuple[str, ...]]] = {
+    'tree_sections': (SECTIONS_SQL, (), ('sections',)),
+    'tree_subsections': (SUBSECTIONS_WITH_COUNTS_SQL, (), ('ss',)),
+    'first_posts': (FIRST_POSTS_SQL, (1,), ()),
+    'older_posts': (OLDER_POSTS_SQL, (1, '', 0), ()),
+    'newer_posts': (NEWER_POSTS_SQL, (1, '', 0), ()),
+    'older_posts_by_id': (OLDER_POSTS_BY_ID_SQL, (1, 0, 0), ()),
+    'newer_posts_by_id': (NEWER_POSTS_BY_ID_SQL, (1, 0, 0), ()),
+    'post_by_id': (POST_BY_ID_SQL, (1,), ()),
+    'post_position': (POST_POSITION_SQL, (1, '', 0), ()),
+}
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Возвращает номер последней примененной миграции"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Применяет недостающие миграции, каждую в своей транзакции"""
+    version = get_schema_version(conn)
+
+    # Пересоздание таблиц невозможно с включенными внешними ключами (DROP TABLE удалил бы
+    # дочерние строки), поэтому миграции сами проверяют ключи через foreign_key_check
+    foreign_keys = conn.execute('PRAGMA foreign_keys').fetchone()[0]
+    conn.execute('PRAGMA foreign_keys = OFF')
+
+    try:
+        for number, description, apply in MIGRATIONS:
+            if number <= version:
+                continue
+
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                apply(conn)
+                conn.execute(f'PRAGMA user_version = {number}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+            version = number
+            print(f"✅ Migration {number} applied: {description}")
+    finally:
+        conn.execute(f'PRAGMA foreign_keys = {foreign_keys}')
+
+    return version
+
+def check_query_plans(conn: sqlite3.Connection) -> List[str]:
+    """Возвращает список горячих запросов, план которых выродился в полный просмотр"""
+    problems = []
+
+    for name, (sql, params, allowed_scans) in HOT_QUERIES.items():
+        for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params):
+            detail = row[3]
+            if detail.startswith('SCAN ') and detail.split()[1] not in allowed_scans:
+                problems.append(f"{name}: {detail}")
+            elif detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+                problems.append(f"{name}: {detail}")
+
+    return problems
+
+def init_db():
+    """Приводит схему базы данных к актуальной версии"""
+    try:
+        conn = get_db_connection()
+        version = migrate(conn)
+        restore_interrupted_bulk_load(conn)
+
+        for problem in check_query_plans(conn):
+            print(f"⚠️ Query plan regression: {problem}")
+
+        print(f"✅ Database initialized at: {DB_PATH} (schema v{version})")
+
+        if SESSION_BACKEND == 'shared':
+            # В ту же базу пишут другие процессы бота: кэши сверяются с content_version,
+            # а копия базы в памяти не включается - она не видит их записей
+            content_cache.watch_other_processes()
+            print("✅ Content caches follow writes of other bot processes")
+        elif start_read_replica():
+            print("✅ Reads are served from the in-memory replica")
+
+        restored = start_session_persistence()
+        print(f"✅ Restored {restored} user sessions")
+
+    except Exception as e:
+        print(f"❌ Database initialization error: {e}")
+        raise
+
+if __name__ == '__main__':
+    # python migrations.py - применить миграции и проверить планы запросов
+    connection = get_db_connection()
+    migrate(connection)
+    restore_interrupted_bulk_load(connection)
+
+    regressions = check_query_plans(connection)
+    for regression in regressions:
+        print(f"❌ {regression}")
+
+    if regressions:
+        sys.exit(1)
+    print("✅ Query plans OK")
@@ -0,0 +1,234 @@
+# render_memory.py
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from telegram import InputMediaPhoto
+from telegram.error import BadRequest
+
+from session_manager import SESSION_BACKEND
+
+# Сколько последних сообщений бот помнит. Память у каждого процесса своя, поэтому
+# при общих сессиях (SESSION_BACKEND=shared), когда сообщение может изменить другой
+# процесс, она по умолчанию выключена
+RENDER_MEMORY_SIZE = int(os.getenv('RENDER_MEMORY_SIZE', 0 if SESSION_BACKEND == 'shared' else 10_000))
+
+# Ограничение Telegram на подпись к фото; запись с более длинным текстом показывается без фото
+CAPTION_LIMIT = 1024
+
+MessageKey = Tuple[int, int]
+
+class Rendered(NamedTuple):
+    """Что бот последним показал в сообщении"""
+    kind: str  # 'text' или 'photo'
+    content: int
+    markup: int
+    media: int = 0  # file_id фото; подпись входит только в content
+
+def _markup_digest(reply_markup: Any) -> int:
+    return hash(reply_markup.to_json()) if reply_markup is not None else 0
+
+def _content_digest(*parts: Any) -> int:
+    return hash(parts)
+
+def _rendered(text: str, reply_markup: Any, photo: Optional[str], kwargs: Dict[str, Any]) -> Rendered:
+    if photo:
+        return Rendered('photo', _content_digest(photo, text), _markup_digest(reply_markup), _content_digest(photo))
+    return Rendered('text', _content_digest(text, tuple(sorted(kwargs.items()))), _markup_digest(reply_markup))
+
+def _message_key(query: Any) -> Optional[MessageKey]:
+    """Чат и id сообщения с кнопкой; у inline-сообщений и слишком старых сообщений их нет"""
+    message = query.message
+    return (message.chat_id, message.message_id) if message is not None else None
+
+def message_kind(query: Any) -> Optional[str]:
+    """'text' или 'photo' - что сейчас в сообщении с кнопкой; None для inline-сообщений.
+
+    Сообщение приходит вместе с нажатием, поэтому его вид известен и без памяти"""
+    message = query.message
+    if message is None:
+        return None
+    return 'photo' if message.photo else 'text'
+
+def _not_modified(error: BadRequest) -> bool:
+    return 'not modified' in str(error).lower()
+
+class RenderMemory:
+    """LRU последних показанных сообщений: текст (или фото с подписью) и клавиатура.
+
+    Повторный показ того же экрана не доходит до Telegram, а если изменилась
+    только клавиатура или подпись к тому же фото, отправляется editMessageReplyMarkup
+    или editMessageCaption вместо полной правки."""
+
+    def __init__(self, capacity: int = RENDER_MEMORY_SIZE):
+        self.capacity = capacity
+        self.edits = 0
+        self.skipped = 0
+        self.markup_only = 0
+        self.caption_only = 0
+        self.replaced = 0
+        self.not_modified = 0
+        self._messages: 'OrderedDict[MessageKey, Rendered]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Optional[MessageKey]) -> Optional[Rendered]:
+        """Последнее известное содержимое сообщения"""
+        if key is None or not self.capacity:
+            return None
+        with self._lock:
+            rendered = self._messages.get(key)
+            if rendered is not None:
+                self._messages.move_to_end(key)
+            return rendered
+
+    def remember(self, key: Optional[MessageKey], rendered: Rendered):
+        """Запоминает, что сообщение теперь показывает rendered"""
+        if key is None or not self.capacity:
+            return
+        with self._lock:
+            self._messages[key] = rendered
+            self._messages.move_to_end(key)
+            while len(self._messages) > self.capacity:
+                self._messages.popitem(last=False)
+
+    def forget(self, key: Optional[MessageKey]):
+        """Содержимое сообщения неизвестно (например, после ошибки редактирования)"""
+        if key is None:
+            return
+        with self._lock:
+            self._messages.pop(key, None)
+
+    def plan(self, key: Optional[MessageKey], rendered: Rendered, current_kind: Optional[str] = None) -> str:
+        """'skip', 'markup', 'caption', 'edit' или 'replace' - какой запрос нужен, чтобы показать rendered.
+
+        current_kind - вид сообщения сейчас; текст нельзя правкой превратить в фото и наоборот"""
+        if current_kind is not None and current_kind != rendered.kind:
+            self.forget(key)
+            self.replaced += 1
+            return 'replace'
+        previous = self.get(key)
+        if previous is None or previous.kind != rendered.kind:
+            self.edits += 1
+            return 'edit'
+        if previous.content != rendered.content:
+            if rendered.kind == 'photo' and previous.media == rendered.media:
+                self.caption_only += 1
+                return 'caption'
+            self.edits += 1
+            return 'edit'
+        if previous.markup != rendered.markup:
+            self.markup_only += 1
+            return 'markup'
+        self.skipped += 1
+        return 'skip'
+
+    def stats(self) -> Dict[str, Any]:
+        """Отправленные правки и правки, которых удалось избежать"""
+        return {
+            'size': len(self._messages),
+            'capacity': self.capacity,
+            'edits': self.edits,
+            'skipped': self.skipped,
+            'markup_only': self.markup_only,
+            'caption_only': self.caption_only,
+            'replaced': self.replaced,
+            # Ответ «message is not modified» - запрос все же отправлен, в сэкономленные не входит
+            'not_modified': self.not_modified,
+            'avoided_calls': self.skipped
+        }
+
+# Глобальная память показанных сообщений
+render_memory = RenderMemory()
+
+async def _show(query: Any, text: str, reply_markup: Any, photo: Optional[str], kwargs: Dict[str, Any]):
+    """Показывает текст или фото с подписью в сообщении с кнопкой самым дешевым запросом"""
+    key = _message_key(query)
+    rendered = _rendered(text, reply_markup, photo, kwargs)
+    action = render_memory.plan(key, rendered, message_kind(query))
+    if action == 'skip':
+        return
+
+    if action == 'replace':
+        # Вид сообщения меняется: новое сообщение отправляется до удаления старого,
+        # чтобы при ошибке отправки у пользователя остался прежний экран
+        message = query.message
+        if photo:
+            sent = await message.reply_photo(photo, caption=text, reply_markup=reply_markup)
+        else:
+            sent = await message.reply_text(text, reply_markup=reply_markup, **kwargs)
+        try:
+            await message.delete()
+        except BadRequest:
+            pass  # сообщения старше 48 часов бот удалить не может, оно останется в истории
+        render_memory.remember((sent.chat_id, sent.message_id), rendered)
+        return
+
+    try:
+        if action == 'markup':
+            await query.edit_message_reply_markup(reply_markup=reply_markup)
+        elif action == 'caption':
+            await query.edit_message_caption(caption=text, reply_markup=reply_markup)
+        elif photo:
+            await query.edit_message_media(media=InputMediaPhoto(media=photo, caption=text), reply_markup=reply_markup)
+        else:
+            await query.edit_message_text(text, reply_markup=reply_markup, **kwargs)
+    except BadRequest as e:
+        if not _not_modified(e):
+            render_memory.forget(key)
+            raise
+        render_memory.not_modified += 1
+    render_memory.remember(key, rendered)
+
+async def edit_text(query: Any, text: str, reply_markup: Any = None, **kwargs):
+    """query.edit_message_text без запросов, которые ничего не меняют; сообщение с фото заменяется текстом"""
+    await _show(query, text, reply_markup, None, kwargs)
+
+async def edit_photo(query: Any, photo: str, caption: str, reply_markup: Any = None):
+    """Фото с подписью в сообщении с кнопкой; текстовое сообщение заменяется фото"""
+    await _show(query, caption, reply_markup, photo if len(caption) <= CAPTION_LIMIT else None, {})
+
+def _show_sync(query: Any, text: str, reply_markup: Any, photo: Optional[str], kwargs: Dict[str, Any]):
+    """_show для синхронных обработчиков (python-telegram-bot 13)"""
+    key = _message_key(query)
+    rendered = _rendered(text, reply_markup, photo, kwargs)
+    action = render_memory.plan(key, rendered, message_kind(query))
+    if action == 'skip':
+        return
+
+    if action == 'replace':
+        message = query.message
+        if photo:
+            sent = message.reply_photo(photo, caption=text, reply_markup=reply_markup)
+        else:
+            sent = message.reply_text(text, reply_markup=reply_markup, **kwargs)
+        try:
+            message.delete()
+        except BadRequest:
+            pass
+        render_memory.remember((sent.chat_id, sent.message_id), rendered)
+        return
+
+    try:
+        if action == 'markup':
+            query.edit_message_reply_markup(reply_markup=reply_markup)
+        elif action == 'caption':
+            query.edit_message_caption(caption=text, reply_markup=reply_markup)
+        elif photo:
+            query.edit_message_media(media=InputMediaPhoto(media=photo, caption=text), reply_markup=reply_markup)
+        else:
+            query.edit_message_text(text, reply_markup=reply_markup, **kwargs)
+    except BadRequest as e:
+        if not _not_modified(e):
+            render_memory.forget(key)
+            raise
+        render_memory.not_modified += 1
+    render_memory.remember(key, rendered)
+
+def edit_text_sync(query: Any, text: str, reply_markup: Any = None, **kwargs):
+    """edit_text для синхронных обработчиков (python-telegram-bot 13)"""
+    _show_sync(query, text, reply_markup, None, kwargs)
+
+def edit_photo_sync(query: Any, photo: str, caption: str, reply_markup: Any = None):
+    """edit_photo для синхронных обработчиков (python-telegram-bot 13)"""
+    _show_sync(query, caption, reply_markup, photo if len(caption) <= CAPTION_LIMIT else None, {})
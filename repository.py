@@ -0,0 +1,225 @@
+# repository.py
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from database import run_read
+
+class Section(NamedTuple):
+    """Раздел базы знаний"""
+    id: int
+    name: str
+    description: Optional[str]
+
+class Subsection(NamedTuple):
+    """Подраздел раздела"""
+    id: int
+    section_id: int
+    name: str
+    description: Optional[str]
+
+class Post(NamedTuple):
+    """Запись подраздела в том виде, в каком она показывается пользователю"""
+    id: int
+    subsection_id: int
+    user_name: Optional[str]
+    title: str
+    content_type: str
+    content_text: Optional[str]
+    image_file_id: Optional[str]
+    link_url: Optional[str]
+    link_title: Optional[str]
+    created_at: str
+
+    @property
+    def cursor(self) -> Tuple[str, int]:
+        """Ключ записи для keyset-навигации"""
+        return self.created_at, self.id
+
+# Запросы выбирают только нужные экрану колонки и не меняются, поэтому
+# попадают в кэш подготовленных выражений соединения (cached_statements)
+SECTIONS_SQL = 'SELECT id, name, description FROM sections ORDER BY id'
+SUBSECTIONS_WITH_COUNTS_SQL = '''
+    SELECT ss.id, ss.section_id, ss.name, ss.description, COUNT(p.id)
+    FROM subsections ss
+    LEFT JOIN posts p ON p.subsection_id = ss.id
+    GROUP BY ss.id
+    ORDER BY ss.id
+'''
+
+POST_COLUMNS = ', '.join(Post._fields)
+
+# Общий кэш записей: тексты и file_id хранятся один раз, а не в состоянии каждого пользователя
+POST_CACHE_SIZE = 512
+
+# Keyset-навигация по записям подраздела (новые первыми). Курсор - пара (created_at, id)
+# текущей записи; вторая строка результата показывает, есть ли записи дальше.
+# Запросы возвращают только id и читаются из индекса idx_posts_subsection_created,
+# сами записи берутся из post_cache.
+FIRST_POSTS_SQL = '''
+    SELECT id FROM posts WHERE subsection_id = ?
+    ORDER BY created_at DESC, id DESC LIMIT 2
+'''
+OLDER_POSTS_SQL = '''
+    SELECT id FROM posts WHERE subsection_id = ? AND (created_at, id) < (?, ?)
+    ORDER BY created_at DESC, id DESC LIMIT 2
+'''
+NEWER_POSTS_SQL = '''
+    SELECT id FROM posts WHERE subsection_id = ? AND (created_at, id) > (?, ?)
+    ORDER BY created_at, id LIMIT 2
+'''
+
+# Курсор без даты (кнопка, в которую не поместился длинный created_at): дата берется по id
+OLDER_POSTS_BY_ID_SQL = '''
+    SELECT id FROM posts WHERE subsection_id = ? AND (created_at, id) < ((SELECT created_at FROM posts WHERE id = ?), ?)
+    ORDER BY created_at DESC, id DESC LIMIT 2
+'''
+NEWER_POSTS_BY_ID_SQL = '''
+    SELECT id FROM posts WHERE subsection_id = ? AND (created_at, id) > ((SELECT created_at FROM posts WHERE id = ?), ?)
+    ORDER BY created_at, id LIMIT 2
+'''
+
+# Переход к записи из результатов поиска: сама запись и ее номер в ленте подраздела
+POST_BY_ID_SQL = f'SELECT {POST_COLUMNS} FROM posts WHERE id = ?'
+POST_POSITION_SQL = '''
+    SELECT COUNT(*) FROM posts WHERE subsection_id = ? AND (created_at, id) > (?, ?)
+'''
+
+# Счетчик изменений контента, который увеличивают триггеры (см. миграцию 7)
+CONTENT_VERSION_SQL = 'SELECT version FROM content_version'
+
+class PostCache:
+    """LRU-кэш записей по id, общий для всех пользователей; сбрасывается при любом изменении контента"""
+
+    def __init__(self, capacity: int = POST_CACHE_SIZE):
+        self.capacity = capacity
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._posts: 'OrderedDict[int, Post]' = OrderedDict()
+        self._lock = threading.Lock()
+        # С несколькими процессами бота кэш сверяется с content_version перед каждым чтением
+        self.watch_version = False
+        self._content_version: Optional[int] = None
+
+    def invalidate(self):
+        """Вызывается после каждого изменения записей (через content_cache.invalidate)"""
+        with self._lock:
+            self.generation += 1
+            self._posts.clear()
+
+    def check_version(self, conn: sqlite3.Connection):
+        """Сбрасывает кэш, если контент изменил другой процесс бота"""
+        if not self.watch_version:
+            return
+        version = conn.execute(CONTENT_VERSION_SQL).fetchone()[0]
+        with self._lock:
+            if version != self._content_version:
+                self._content_version = version
+                self.generation += 1
+                self._posts.clear()
+
+    def get_many(self, conn: sqlite3.Connection, post_ids: Sequence[int]) -> List[Post]:
+        """Записи по id в том же порядке; удаленные пропускаются"""
+        self.check_version(conn)
+        found: Dict[int, Post] = {}
+        with self._lock:
+            generation = self.generation
+            for post_id in post_ids:
+                post = self._posts.get(post_id)
+                if post is not None:
+                    self._posts.move_to_end(post_id)
+                    found[post_id] = post
+            self.hits += len(found)
+            self.misses += len(post_ids) - len(found)
+
+        loaded = []
+        for post_id in post_ids:
+            if post_id not in found:
+                row = conn.execute(POST_BY_ID_SQL, (post_id,)).fetchone()
+                if row:
+                    found[post_id] = Post._make(row)
+                    loaded.append(found[post_id])
+
+        if loaded:
+            with self._lock:
+                # Запись, прочитанная до изменения, в кэш нового поколения не попадает
+                if generation == self.generation:
+                    for post in loaded:
+                        self._posts[post.id] = post
+                    while len(self._posts) > self.capacity:
+                        self._posts.popitem(last=False)
+
+        return [found[post_id] for post_id in post_ids if post_id in found]
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика попаданий в кэш"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._posts),
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+# Глобальный кэш записей
+post_cache = PostCache()
+
+def load_sections(conn: sqlite3.Connection) -> List[Section]:
+    """Все разделы по порядку id"""
+    return list(map(Section._make, conn.execute(SECTIONS_SQL)))
+
+def load_subsections_with_counts(conn: sqlite3.Connection) -> List[Tuple[Subsection, int]]:
+    """Все подразделы с количеством записей"""
+    return [(Subsection._make(row[:-1]), row[-1]) for row in conn.execute(SUBSECTIONS_WITH_COUNTS_SQL)]
+
+def _posts_by_query(conn: sqlite3.Connection, sql: str, params: Sequence[Any]) -> List[Post]:
+    """Записи по id, выбранным запросом навигации"""
+    return post_cache.get_many(conn, [row[0] for row in conn.execute(sql, params)])
+
+def first_posts(conn: sqlite3.Connection, subsection_id: int) -> List[Post]:
+    """Самая новая запись подраздела и следующая за ней, если есть"""
+    return _posts_by_query(conn, FIRST_POSTS_SQL, (subsection_id,))
+
+def older_posts(conn: sqlite3.Connection, subsection_id: int, cursor: Tuple[Optional[str], int]) -> List[Post]:
+    """Две записи, следующие за курсором в ленте"""
+    if cursor[0] is None:
+        return _posts_by_query(conn, OLDER_POSTS_BY_ID_SQL, (subsection_id, cursor[1], cursor[1]))
+    return _posts_by_query(conn, OLDER_POSTS_SQL, (subsection_id, *cursor))
+
+def newer_posts(conn: sqlite3.Connection, subsection_id: int, cursor: Tuple[Optional[str], int]) -> List[Post]:
+    """Две записи, предшествующие курсору в ленте (ближайшая первой)"""
+    if cursor[0] is None:
+        return _posts_by_query(conn, NEWER_POSTS_BY_ID_SQL, (subsection_id, cursor[1], cursor[1]))
+    return _posts_by_query(conn, NEWER_POSTS_SQL, (subsection_id, *cursor))
+
+def post_by_id(conn: sqlite3.Connection, post_id: int) -> Optional[Post]:
+    """Запись по id"""
+    posts = post_cache.get_many(conn, (post_id,))
+    return posts[0] if posts else None
+
+def post_position(conn: sqlite3.Connection, post: Post) -> int:
+    """Номер записи в ленте ее подраздела, начиная с 0"""
+    return conn.execute(POST_POSITION_SQL, (post.subsection_id, *post.cursor)).fetchone()[0]
+
+async def fetch_first_posts(subsection_id: int) -> List[Post]:
+    """first_posts в пуле читателей"""
+    return await run_read(first_posts, subsection_id)
+
+async def fetch_older_posts(subsection_id: int, cursor: Tuple[Optional[str], int]) -> List[Post]:
+    """older_posts в пуле читателей"""
+    return await run_read(older_posts, subsection_id, cursor)
+
+async def fetch_newer_posts(subsection_id: int, cursor: Tuple[Optional[str], int]) -> List[Post]:
+    """newer_posts в пуле читателей"""
+    return await run_read(newer_posts, subsection_id, cursor)
+
+async def fetch_post(post_id: int) -> Optional[Post]:
+    """post_by_id в пуле читателей"""
+    return await run_read(post_by_id, post_id)
+
+async def fetch_post_position(post: Post) -> int:
+    """post_position в пуле читателей"""
+    return await run_read(post_position, post)
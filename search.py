@@ -0,0 +1,80 @@
+# search.py
+import os
+import re
+import sqlite3
+from typing import List, NamedTuple, Optional, Tuple
+
+from database import run_read
+
+class SearchResult(NamedTuple):
+    """Строка результатов поиска"""
+    id: int
+    subsection_id: int
+    title: str
+    preview: Optional[str]
+
+# Результатов на одной странице поиска
+SEARCH_PAGE_SIZE = 5
+
+# Ограничение на число слов в запросе
+SEARCH_MAX_TERMS = 8
+
+# Длинные слова обрезаются до основы: так "награда" находит "наградой" и "наградами",
+# а префикс не длиннее самого длинного префиксного индекса FTS5 (см. миграцию 3)
+SEARCH_STEM_LENGTH = 6
+
+# Длина превью текста записи в результатах
+SEARCH_PREVIEW_LENGTH = 80
+
+# BM25 считается по SEARCH_RANK_LIMIT самым новым совпадениям (по умолчанию 400 страниц):
+# ранжирование всех совпадений частого слова в большой базе занимает сотни миллисекунд.
+# Если совпадений больше, пользователь видит предупреждение и может уточнить запрос.
+SEARCH_RANK_LIMIT = int(os.getenv('SEARCH_RANK_LIMIT', 2000))
+
+# Веса колонок bm25 заданы в миграции и совпадают с rank. Записи присоединяются только
+# для строк страницы; одна лишняя строка показывает, есть ли следующая страница,
+# последняя колонка - сколько совпадений попало в окно (SEARCH_RANK_LIMIT + 1 - окно переполнено).
+SEARCH_SQL = f'''
+    WITH candidates AS (
+        SELECT rowid AS id, rank AS score FROM posts_fts
+        WHERE posts_fts MATCH ?
+        ORDER BY rowid DESC LIMIT ?
+    ),
+    page AS (
+        SELECT id, score FROM candidates
+        ORDER BY score, id DESC
+        LIMIT ? OFFSET ?
+    )
+    SELECT p.id, p.subsection_id, p.title, substr(p.content_text, 1, {SEARCH_PREVIEW_LENGTH}),
+           (SELECT count(*) FROM candidates)
+    FROM page
+    JOIN posts p ON p.id = page.id
+    ORDER BY page.score, page.id DESC
+'''
+
+def build_match_query(text: str) -> Optional[str]:
+    """Превращает ввод пользователя в запрос FTS5: все слова обязательны, каждое как префикс основы"""
+    # ё заменяется на е так же, как при индексации (см. миграцию 3)
+    terms = re.findall(r'\w+', text.lower().replace('ё', 'е'))[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    # Слова берутся в кавычки, чтобы операторы FTS5 в вводе не ломали запрос
+    return ' '.join(f'"{term[:SEARCH_STEM_LENGTH]}"*' for term in terms)
+
+def search(conn: sqlite3.Connection, text: str, page: int = 0) -> Tuple[List[SearchResult], bool, bool]:
+    """Возвращает страницу результатов, признак следующей и признак того, что
+    ранжированы не все совпадения (их больше SEARCH_RANK_LIMIT)"""
+    match = build_match_query(text)
+    if match is None:
+        return [], False, False
+
+    rows = conn.execute(
+        SEARCH_SQL, (match, SEARCH_RANK_LIMIT + 1, SEARCH_PAGE_SIZE + 1, page * SEARCH_PAGE_SIZE)
+    ).fetchall()
+    results = [SearchResult._make(row[:4]) for row in rows[:SEARCH_PAGE_SIZE]]
+    truncated = bool(rows) and rows[0][4] > SEARCH_RANK_LIMIT
+    return results, len(rows) > SEARCH_PAGE_SIZE, truncated
+
+async def search_posts(text: str, page: int = 0) -> Tuple[List[SearchResult], bool, bool]:
+    """Поиск по записям в пуле читателей"""
+    return await run_read(search, text, page)
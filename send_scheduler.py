@@ -0,0 +1,236 @@
+# send_scheduler.py
+import asyncio
+import bisect
+import itertools
+import os
+from datetime import timedelta
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+# Приоритеты отправки: ответы пользователю идут раньше массовых рассылок.
+# Рассылка передает rate_limit_args=SEND_BULK в метод бота.
+SEND_INTERACTIVE = 0
+SEND_BULK = 1
+
+# Ограничения Telegram: ~30 сообщений в секунду на бота, ~1 в секунду в личный чат
+# и ~20 в минуту в группу; burst - сколько запросов подряд можно отправить в чат
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', 30))
+SEND_CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', 1))
+SEND_GROUP_RATE = float(os.getenv('SEND_GROUP_RATE', 20 / 60))
+SEND_CHAT_BURST = int(os.getenv('SEND_CHAT_BURST', 3))
+
+# Повторы после RetryAfter и предел числа корзин чатов, после которого полные корзины удаляются
+SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', 3))
+SEND_CHAT_BUCKETS_MAX = 10_000
+
+JSONResult = Union[bool, Dict[str, Any], List[Dict[str, Any]]]
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 - уже доступен)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    @property
+    def full(self) -> bool:
+        return self.tokens >= self.capacity
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'chat_id', 'future', 'queued_at')
+
+    def __init__(self, priority: int, seq: int, chat_id: Union[int, str], future: asyncio.Future, now: float):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.future = future
+        self.queued_at = now
+
+    def __lt__(self, other: '_Waiter') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class SendScheduler(BaseRateLimiter[int]):
+    """Планировщик исходящих запросов к Bot API (подключается через Application.builder().rate_limiter()).
+
+    Запрос с chat_id ждет токен своего чата и общий токен бота; из ожидающих
+    первым получает токен запрос с более высоким приоритетом, даже если его
+    чат стоит в очереди позже. После RetryAfter вся отправка приостанавливается
+    на указанное Telegram время, и запрос повторяется. Запросы без chat_id
+    (answerCallbackQuery, getUpdates) идут без очереди."""
+
+    def __init__(self, global_rate: float = SEND_GLOBAL_RATE, chat_rate: float = SEND_CHAT_RATE,
+                 group_rate: float = SEND_GROUP_RATE, chat_burst: int = SEND_CHAT_BURST,
+                 max_retries: int = SEND_MAX_RETRIES):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+        self._global: Optional[TokenBucket] = None
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        self._waiting: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        self.sent = 0
+        self.retried = 0
+        self.waited = {SEND_INTERACTIVE: 0.0, SEND_BULK: 0.0}
+        self.max_wait = 0.0
+
+    async def initialize(self) -> None:
+        """Запускает раздачу токенов в текущем цикле событий"""
+        if self._worker is None:
+            loop = asyncio.get_running_loop()
+            self._global = TokenBucket(self.global_rate, max(1.0, self.global_rate), loop.time())
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    async def shutdown(self) -> None:
+        """Останавливает раздачу; ожидающие запросы отправляются без очереди"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for waiter in self._waiting:
+            if not waiter.future.done():
+                waiter.future.set_result(None)
+        self._waiting.clear()
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, JSONResult]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> JSONResult:
+        chat_id = data.get('chat_id')
+        priority = SEND_INTERACTIVE if rate_limit_args is None else rate_limit_args
+
+        for attempt in range(self.max_retries + 1):
+            if chat_id is not None:
+                await self._acquire(chat_id, priority)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retried += 1
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                self._pause(retry_after)
+                if chat_id is None:
+                    await asyncio.sleep(retry_after)
+            else:
+                self.sent += 1
+                return result
+
+    def _pause(self, seconds: float):
+        """Telegram попросил подождать - токены не выдаются никому"""
+        loop = asyncio.get_running_loop()
+        self._paused_until = max(self._paused_until, loop.time() + seconds)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _acquire(self, chat_id: Union[int, str], priority: int):
+        """Ждет токены чата и бота в порядке приоритета"""
+        await self.initialize()
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(priority, next(self._seq), chat_id, loop.create_future(), loop.time())
+        bisect.insort(self._waiting, waiter)
+        self._wakeup.set()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiting:
+                self._waiting.remove(waiter)
+            raise
+
+        waited = loop.time() - waiter.queued_at
+        self.waited[priority] = self.waited.get(priority, 0.0) + waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def _chat_bucket(self, chat_id: Union[int, str], now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= SEND_CHAT_BUCKETS_MAX:
+                # Полная корзина ничем не отличается от новой
+                for stale in [key for key, value in self._chats.items() if value.delay(now) == 0 and value.full]:
+                    del self._chats[stale]
+            # Группы и каналы имеют отрицательный id или @username
+            group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(self.group_rate if group else self.chat_rate, self.chat_burst, now)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _grant(self, now: float) -> float:
+        """Выдает один токен первому подходящему запросу; возвращает, сколько ждать до следующей попытки"""
+        delay = max(self._paused_until - now, self._global.delay(now))
+        if delay > 0:
+            return delay
+
+        delay = float('inf')
+        for index, waiter in enumerate(self._waiting):
+            if waiter.future.done():
+                continue
+            chat_delay = self._chat_bucket(waiter.chat_id, now).delay(now)
+            if chat_delay == 0:
+                self._chats[waiter.chat_id].take()
+                self._global.take()
+                del self._waiting[index]
+                waiter.future.set_result(None)
+                return 0.0
+            delay = min(delay, chat_delay)
+        return delay
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._waiting = [waiter for waiter in self._waiting if not waiter.future.done()]
+            if not self._waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._grant(loop.time())
+            if delay == 0:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Отправленные запросы, очередь, повторы и ожидание по приоритетам"""
+        return {
+            'sent': self.sent,
+            'queued': len(self._waiting),
+            'retried': self.retried,
+            'chats': len(self._chats),
+            'wait_interactive_s': self.waited[SEND_INTERACTIVE],
+            'wait_bulk_s': self.waited[SEND_BULK],
+            'max_wait_s': self.max_wait
+        }
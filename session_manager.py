@@ -1,54 +1,683 @@
 # session_manager.py
+import abc
+import asyncio
+import enum
+import itertools
+import json
+import os
+import sys
+import threading
 import time
-from typing import Dict, Any
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from database import DB_PATH, DB_READER_THREADS, ConnectionManager, get_db_connection, write_queue
+
+SESSION_TIMEOUT = 3600  # 1 час в секундах
+SESSION_SWEEP_INTERVAL = 60  # ширина ячейки колеса сроков, секунды
+SESSION_FLUSH_INTERVAL = 5  # период очистки и сброса измененных сессий в хранилище, секунды
+
+# Пределы хранилища в памяти; сверх них вытесняются давно не использованные сессии
+SESSION_MAX_COUNT = int(os.getenv('SESSION_MAX_COUNT', 100_000))
+SESSION_MAX_BYTES = int(os.getenv('SESSION_MAX_BYTES', 64 * 1024 * 1024))
+# Сколько самых старых сессий просматривается в поисках той, что не в мастере ввода
+SESSION_EVICTION_SCAN = 32
+
+# Хранилище сессий: sqlite - один процесс, отложенная запись; shared - несколько процессов
+# бота на одной базе, сверка с базой на каждое обращение и запись после каждого обновления
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'sqlite')
+
+class SessionFlag(enum.IntFlag):
+    """Состояния мастеров ввода, упакованные в одно целое число сессии"""
+    CREATING_SECTION = 1
+    AWAITING_SECTION_NAME = 2
+    AWAITING_SUBSECTION_NAME = 4
+    AWAITING_POST_TITLE = 8
+    AWAITING_POST_CONTENT = 16
+    AWAITING_SEARCH_QUERY = 32
+
+def _flag_property(flag: SessionFlag) -> property:
+    """Булев атрибут сессии, хранящийся битом в UserSession.flags"""
+    def getter(session: 'UserSession') -> bool:
+        return bool(session.flags & flag)
+
+    def setter(session: 'UserSession', value: bool):
+        # В слоте хранится обычный int: малые числа разделяются интерпретатором
+        session.flags = int(session.flags | flag) if value else int(session.flags & ~flag)
+
+    return property(getter, setter)
+
+class UserSession:
+    """Сессия пользователя: только слоты, флаги мастеров в одном бите каждый"""
+    __slots__ = (
+        'user_id', 'updated_at', 'size', 'version', 'flags',
+        'current_section', 'search_query',
+        'adding_post', 'creating_subsection', 'editing_section', 'editing_subsection', 'editing_post',
+    )
+
+    creating_section = _flag_property(SessionFlag.CREATING_SECTION)
+    awaiting_section_name = _flag_property(SessionFlag.AWAITING_SECTION_NAME)
+    awaiting_subsection_name = _flag_property(SessionFlag.AWAITING_SUBSECTION_NAME)
+    awaiting_post_title = _flag_property(SessionFlag.AWAITING_POST_TITLE)
+    awaiting_post_content = _flag_property(SessionFlag.AWAITING_POST_CONTENT)
+    awaiting_search_query = _flag_property(SessionFlag.AWAITING_SEARCH_QUERY)
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.updated_at = time.time()
+        self.size = 0
+        self.version = 0  # версия строки в общем хранилище; 0 - сессия еще не записана
+        self.flags = 0
+        self.current_section: Optional[int] = None
+        self.search_query: Optional[str] = None
+
+        # Данные мастеров добавления и редактирования
+        self.adding_post: Optional[Dict[str, Any]] = None
+        self.creating_subsection: Optional[Dict[str, Any]] = None
+        self.editing_section: Optional[int] = None
+        self.editing_subsection: Optional[int] = None
+        self.editing_post: Optional[int] = None
+
+    def is_valid(self) -> bool:
+        """Проверяет, действительна ли сессия"""
+        return time.time() - self.updated_at < SESSION_TIMEOUT
+
+    def update_time(self):
+        """Обновляет время сессии"""
+        self.updated_at = time.time()
+
+    def clear_adding_state(self):
+        """Очищает состояние добавления контента"""
+        self.flags = 0
+        self.adding_post = None
+        self.creating_subsection = None
+        self.editing_section = None
+        self.editing_subsection = None
+        self.editing_post = None
+
+    def in_wizard(self) -> bool:
+        """Пользователь посреди добавления или редактирования контента"""
+        return bool(self.flags) or any(
+            value is not None for value in (
+                self.adding_post, self.creating_subsection,
+                self.editing_section, self.editing_subsection, self.editing_post,
+            )
+        )
+
+    def measure(self) -> int:
+        """Приблизительный размер сессии в памяти вместе с черновиками, байт"""
+        size = SESSION_BASE_SIZE
+        for value in (self.search_query, self.adding_post, self.creating_subsection):
+            if value is not None:
+                size += _deep_size(value)
+        return size
+
+    def dump(self) -> str:
+        """Состояние сессии в JSON для постоянного хранилища"""
+        return json.dumps(
+            {name: getattr(self, name) for name in PERSISTED_FIELDS},
+            ensure_ascii=False, separators=(',', ':')
+        )
+
+    @classmethod
+    def restore(cls, user_id: int, updated_at: float, data: str) -> 'UserSession':
+        """Сессия из строки постоянного хранилища"""
+        session = cls(user_id)
+        session.updated_at = updated_at
+        for name, value in json.loads(data).items():
+            if name in PERSISTED_FIELDS:
+                setattr(session, name, value)
+        return session
+
+def _deep_size(value: Any) -> int:
+    """sys.getsizeof вместе с элементами словарей, списков и кортежей"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(key) + _deep_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_deep_size(item) for item in value)
+    return size
+
+# Объект сессии, ее ключ и время, ячейки OrderedDict хранилища и колеса сроков
+# (около 220 байт по замеру tracemalloc в benchmark())
+SESSION_BASE_SIZE = sys.getsizeof(UserSession(0)) + sys.getsizeof(2 ** 40) + sys.getsizeof(0.0) + 220
+
+# user_id, updated_at и version хранятся отдельными колонками, size пересчитывается
+PERSISTED_FIELDS = tuple(
+    name for name in UserSession.__slots__ if name not in ('user_id', 'updated_at', 'size', 'version')
+)
+
+LOAD_SESSIONS_SQL = 'SELECT user_id, updated_at, data FROM sessions WHERE updated_at > ? ORDER BY updated_at'
+PURGE_SESSIONS_SQL = 'DELETE FROM sessions WHERE updated_at <= ?'
+SAVE_SESSION_SQL = 'INSERT OR REPLACE INTO sessions (user_id, updated_at, data) VALUES (?, ?, ?)'
+DELETE_SESSION_SQL = 'DELETE FROM sessions WHERE user_id = ?'
+
+# Общее хранилище: данные читаются, только если версия строки отличается от известной процессу;
+# запись проходит, только если строку никто не изменил с момента чтения
+FETCH_SESSION_SQL = '''
+    SELECT version, updated_at, CASE WHEN version = ? THEN NULL ELSE data END
+    FROM sessions WHERE user_id = ?
+'''
+INSERT_SESSION_SQL = '''
+    INSERT INTO sessions (user_id, updated_at, data, version) VALUES (?, ?, ?, 1)
+    ON CONFLICT (user_id) DO NOTHING RETURNING version
+'''
+CAS_SESSION_SQL = '''
+    UPDATE sessions SET updated_at = ?, data = ?, version = version + 1
+    WHERE user_id = ? AND version = ? RETURNING version
+'''
+
+class SessionBackend(abc.ABC):
+    """Постоянное хранилище сессий; без него сессии живут только в памяти процесса"""
+
+    # Хранилище делят несколько процессов: память процесса - только кэш (SharedSessionBackend)
+    shared = False
+
+class WriteBehindSessionBackend(SessionBackend):
+    """Хранилище одного процесса: сессии восстанавливаются при запуске и сбрасываются пачками"""
+
+    @abc.abstractmethod
+    def load(self, since: float) -> Iterable[Tuple[int, float, str]]:
+        """Сессии, обновленные позже since: (user_id, updated_at, данные)"""
+
+    @abc.abstractmethod
+    def save(self, rows: List[Tuple[int, float, str]], deleted: List[int]) -> Optional[Future]:
+        """Записывает измененные сессии и удаляет завершенные; может завершиться позже"""
+
+class SharedSessionBackend(SessionBackend):
+    """Хранилище нескольких процессов: сессия сверяется с ним перед обновлением (fetch)
+    и записывается сразу после него (compare_and_set)"""
+
+    shared = True
+
+    @abc.abstractmethod
+    def fetch(self, user_id: int, known_version: int) -> Optional[Tuple[int, float, Optional[str]]]:
+        """(версия, updated_at, данные или None, если версия равна known_version); None - сессии нет"""
+
+    @abc.abstractmethod
+    def compare_and_set(self, user_id: int, expected_version: int, updated_at: float, data: str) -> Optional[int]:
+        """Записывает сессию, если ее версия все еще expected_version; новая версия или None при конфликте"""
+
+    @abc.abstractmethod
+    def delete(self, user_id: int):
+        """Удаляет сессию"""
+
+    @abc.abstractmethod
+    def purge(self, before: float):
+        """Удаляет сессии, не обновлявшиеся с before"""
+
+def _save_sessions(conn, rows: List[Tuple[int, float, str]], deleted: List[int]):
+    if rows:
+        conn.executemany(SAVE_SESSION_SQL, rows)
+    if deleted:
+        conn.executemany(DELETE_SESSION_SQL, [(user_id,) for user_id in deleted])
+
+class SqliteSessionBackend(WriteBehindSessionBackend):
+    """Сессии в таблице sessions основной базы; запись идет через очередь писателя"""
+
+    def load(self, since: float) -> Iterable[Tuple[int, float, str]]:
+        # Сессии, истекшие пока бот был остановлен, больше не нужны
+        write_queue.submit(lambda conn: conn.execute(PURGE_SESSIONS_SQL, (since,)), replicate=False)
+        return get_db_connection().execute(LOAD_SESSIONS_SQL, (since,)).fetchall()
+
+    def save(self, rows: List[Tuple[int, float, str]], deleted: List[int]) -> Optional[Future]:
+        # Таблица сессий не читается через копию базы в памяти
+        return write_queue.submit(_save_sessions, (rows, deleted), replicate=False)
+
+class SharedSqliteSessionBackend(SharedSessionBackend):
+    """Таблица sessions в файле базы в режиме WAL, общая для нескольких процессов бота.
+
+    Каждое обращение - чтение по первичному ключу, каждая запись - короткая транзакция
+    со сравнением версии; отдельные соединения, чтобы не ждать очередь писателя процесса."""
+
+    def __init__(self, path: str = DB_PATH):
+        self._connections = ConnectionManager(path)
+
+    def _write(self, sql: str, params: Sequence[Any]) -> Optional[tuple]:
+        conn = self._connections.connection()
+        try:
+            row = conn.execute(sql, params).fetchone()
+            conn.commit()
+            return row
+        except Exception:
+            conn.rollback()
+            raise
+
+    def fetch(self, user_id: int, known_version: int) -> Optional[Tuple[int, float, Optional[str]]]:
+        return self._connections.connection().execute(FETCH_SESSION_SQL, (known_version, user_id)).fetchone()
+
+    def compare_and_set(self, user_id: int, expected_version: int, updated_at: float, data: str) -> Optional[int]:
+        if expected_version == 0:
+            row = self._write(INSERT_SESSION_SQL, (user_id, updated_at, data))
+        else:
+            row = self._write(CAS_SESSION_SQL, (updated_at, data, user_id, expected_version))
+        return row[0] if row else None
+
+    def delete(self, user_id: int):
+        self._write(DELETE_SESSION_SQL, (user_id,))
+
+    def purge(self, before: float):
+        self._write(PURGE_SESSIONS_SQL, (before,))
+
+    def close(self):
+        self._connections.close_all()
 
 class SessionManager:
-    def __init__(self):
-        self.sessions: Dict[int, Dict[str, Any]] = {}
-        self.session_timeout = 3600  # 1 час
-        
-    def create_session(self, user_id: int):
+    """Хранилище сессий, общее для всех точек входа бота.
+
+    Просроченные сессии удаляет sweep() по колесу времени: сессия лежит в ячейке тика,
+    в котором истекает, и очистка просматривает только ячейки прошедших тиков.
+
+    Число сессий и их суммарный размер ограничены: сверх пределов вытесняются давно
+    не использованные сессии, в первую очередь те, что не в мастере ввода.
+
+    С подключенным бэкендом измененные сессии сбрасываются в него пачками (flush()),
+    чтения сессий всегда идут из памяти. С общим бэкендом (несколько процессов) память -
+    только кэш: перед обновлением сессия сверяется с хранилищем по версии (refresh()),
+    после него записывается (commit()). Обращения к хранилищу идут без self._lock,
+    асинхронные варианты выполняют их в отдельном пуле потоков."""
+
+    def __init__(self, session_timeout: int = SESSION_TIMEOUT, tick: int = SESSION_SWEEP_INTERVAL,
+                 max_sessions: int = SESSION_MAX_COUNT, max_bytes: int = SESSION_MAX_BYTES):
+        # Порядок - от давно не использованных к недавним
+        self.sessions: 'OrderedDict[int, UserSession]' = OrderedDict()
+        self.session_timeout = session_timeout
+        self.tick = tick
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.evicted_lru = 0
+        self.evicted_wizards = 0
+        self.expired_on_access = 0
+        self.conflicts = 0
+
+        # Тик -> пользователи, чьи сессии истекают в этом тике. Продление сессии колесо
+        # не трогает: sweep() перекладывает такую сессию в ячейку нового срока
+        self._wheel: Dict[int, Set[int]] = {}
+        self._swept_tick = int(time.time() // tick)
+        self._lock = threading.Lock()
+        self._sweeper: Optional[asyncio.Task] = None
+
+        # Сессия, к которой обращались, попадает в два сброса подряд: обработчик мог
+        # изменить ее уже после первого (после await)
+        self.backend: Optional[SessionBackend] = None
+        self._io: Optional[ThreadPoolExecutor] = None
+        self._dirty: Set[int] = set()
+        self._recent: Set[int] = set()
+        self._deleted: Set[int] = set()
+
+    def _schedule(self, user_id: int, expires_at: float):
+        """Кладет пользователя в ячейку тика, в котором истекает его сессия"""
+        self._wheel.setdefault(int(expires_at // self.tick), set()).add(user_id)
+
+    @property
+    def shared(self) -> bool:
+        return self.backend is not None and self.backend.shared
+
+    def _touched(self, user_id: int):
+        if self.backend is not None and not self.backend.shared:
+            self._dirty.add(user_id)
+
+    def _account(self, session: UserSession):
+        """Пересчитывает размер сессии; изменения черновика видны при следующем обращении"""
+        size = session.measure()
+        self.bytes += size - session.size
+        session.size = size
+
+    def _remove(self, user_id: int, local_only: bool = False) -> Optional[UserSession]:
+        """Убирает сессию из памяти и, если не local_only, из постоянного хранилища (под self._lock)"""
+        session = self.sessions.pop(user_id, None)
+        if session is not None:
+            self.bytes -= session.size
+            # Непродленная сессия лежит в ячейке своего срока; продленную уберет sweep()
+            bucket = self._wheel.get(int((session.updated_at + self.session_timeout) // self.tick))
+            if bucket is not None:
+                bucket.discard(user_id)
+        if self.backend is not None and not local_only:
+            self._deleted.add(user_id)
+        return session
+
+    def _known_version(self, user_id: int) -> int:
+        with self._lock:
+            session = self.sessions.get(user_id)
+            return session.version if session is not None else -1
+
+    def _apply_fetched(self, user_id: int, known_version: int, row: Optional[Tuple[int, float, Optional[str]]]):
+        """Применяет прочитанную из общего хранилища строку к кэшу процесса"""
+        with self._lock:
+            session = self.sessions.get(user_id)
+            if (session.version if session is not None else -1) != known_version:
+                # Пока шло чтение, сессию изменили в этом процессе - сверимся в следующий раз
+                return
+
+            if row is None:
+                # Еще не записанная новая сессия этого процесса или удаленная другим
+                if session is not None and session.version != 0:
+                    self._remove(user_id, local_only=True)
+                return
+
+            version, updated_at, data = row
+            if data is None:
+                return
+
+            fresh = UserSession.restore(user_id, updated_at, data)
+            fresh.version = version
+            if session is None:
+                self._schedule(user_id, updated_at + self.session_timeout)
+            else:
+                self.bytes -= session.size
+            self.sessions[user_id] = fresh
+            self._account(fresh)
+
+    def refresh(self, user_id: int):
+        """Сверяет сессию с общим хранилищем перед обработкой обновления и перечитывает ее,
+        если другой процесс ее изменил. Без общего хранилища ничего не делает."""
+        if self.shared:
+            known_version = self._known_version(user_id)
+            self._apply_fetched(user_id, known_version, self.backend.fetch(user_id, known_version))
+
+    async def refresh_async(self, user_id: int):
+        """То же, что refresh(); чтение из хранилища идет в потоке, не в цикле событий"""
+        if self.shared:
+            known_version = self._known_version(user_id)
+            row = await self._run_io(self.backend.fetch, user_id, known_version)
+            self._apply_fetched(user_id, known_version, row)
+
+    async def _run_io(self, func: Callable[..., Any], *args):
+        if self._io is None:
+            self._io = ThreadPoolExecutor(max_workers=DB_READER_THREADS, thread_name_prefix='session-io')
+        return await asyncio.get_running_loop().run_in_executor(self._io, func, *args)
+
+    def _enforce_limits(self):
+        """Вытесняет сессии с холодного конца, пока хранилище не уложится в пределы (под self._lock)"""
+        while len(self.sessions) > 1 and (len(self.sessions) > self.max_sessions or self.bytes > self.max_bytes):
+            victim = next(
+                (user_id for user_id, session
+                 in itertools.islice(self.sessions.items(), min(SESSION_EVICTION_SCAN, len(self.sessions) - 1))
+                 if not session.in_wizard()),
+                None
+            )
+            if victim is None:
+                # Все старейшие сессии в мастерах - жертвуем самой давней
+                victim = next(iter(self.sessions))
+                self.evicted_wizards += 1
+            self._remove(victim, local_only=self.shared)
+            self.evicted_lru += 1
+
+    def create_session(self, user_id: int) -> UserSession:
         """Создает новую сессию для пользователя"""
-        self.sessions[user_id] = {
-            'created_at': time.time(),
-            'current_section': None,
-            'current_subsection': None,
-            'current_post_index': 0,
-            'posts': [],
-            'adding_post': None,
-            'creating_section': False,
-            'creating_subsection': None
-        }
-        return self.sessions[user_id]
-    
-    def get_session(self, user_id: int):
-        """Получает сессию пользователя"""
-        session = self.sessions.get(user_id)
-        if session and time.time() - session['created_at'] > self.session_timeout:
-            del self.sessions[user_id]
-            return None
+        session = UserSession(user_id)
+        with self._lock:
+            previous = self.sessions.pop(user_id, None)
+            if previous is None:
+                self._schedule(user_id, session.updated_at + self.session_timeout)
+            else:
+                # Заменяемая сессия уже лежит в колесе, sweep() учтет новый срок
+                self.bytes -= previous.size
+                # Новая сессия заменяет строку общего хранилища, а не вставляется рядом с ней
+                session.version = previous.version
+            self.sessions[user_id] = session
+            self._account(session)
+            self._enforce_limits()
+        self._touched(user_id)
+        return session
+
+    def get_session(self, user_id: int) -> Optional[UserSession]:
+        """Получает сессию пользователя и продлевает ее"""
+        with self._lock:
+            session = self.sessions.get(user_id)
+            if session is None:
+                self.misses += 1
+                return None
+
+            now = time.time()
+            if now - session.updated_at > self.session_timeout:
+                self._remove(user_id, local_only=self.shared)
+                self.expired_on_access += 1
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            session.updated_at = now
+            self.sessions.move_to_end(user_id)
+            self._account(session)
+            if self.bytes > self.max_bytes:
+                self._enforce_limits()
+
+        self._touched(user_id)
         return session
-    
+
+    def ensure_session(self, user_id: int) -> UserSession:
+        """Гарантирует наличие сессии пользователя"""
+        return self.get_session(user_id) or self.create_session(user_id)
+
     def update_session(self, user_id: int, updates: Dict[str, Any]):
-        """Обновляет сессию пользователя"""
-        if user_id in self.sessions:
-            self.sessions[user_id].update(updates)
-            self.sessions[user_id]['created_at'] = time.time()  # Обновляем время
-        else:
-            self.create_session(user_id)
-            self.sessions[user_id].update(updates)
-    
+        """Обновляет атрибуты сессии пользователя, создавая ее при необходимости"""
+        session = self.ensure_session(user_id)
+        for name, value in updates.items():
+            setattr(session, name, value)
+
     def clear_session(self, user_id: int):
         """Очищает сессию пользователя"""
-        if user_id in self.sessions:
-            del self.sessions[user_id]
-    
+        with self._lock:
+            # Из общего хранилища сессию удалит commit() в конце обновления
+            self._remove(user_id)
+
+    def _prepare_commit(self, user_id: int) -> Tuple[bool, Optional[UserSession], Optional[Tuple[int, float, str]]]:
+        """Снимок сессии для записи и признак удаления, под self._lock"""
+        with self._lock:
+            deleted = user_id in self._deleted
+            self._deleted.discard(user_id)
+            session = self.sessions.get(user_id)
+            if session is None:
+                return deleted, None, None
+            return deleted, session, (session.version, session.updated_at, session.dump())
+
+    def _write_shared(self, user_id: int, deleted: bool, snapshot: Optional[Tuple[int, float, str]]) -> Optional[int]:
+        if deleted:
+            self.backend.delete(user_id)
+        if snapshot is None:
+            return None
+        return self.backend.compare_and_set(user_id, *snapshot)
+
+    def _finish_commit(self, user_id: int, session: Optional[UserSession], version: Optional[int]) -> bool:
+        if session is None:
+            return True
+        with self._lock:
+            if version is None:
+                self.conflicts += 1
+                if self.sessions.get(user_id) is session:
+                    self._remove(user_id, local_only=True)
+                return False
+            session.version = version
+            return True
+
+    def commit(self, user_id: int) -> bool:
+        """Записывает сессию в общее хранилище после обработки обновления.
+
+        False - другой процесс изменил сессию раньше; локальная копия отброшена, следующее
+        обращение прочитает его версию. С отложенной записью помечает сессию измененной:
+        обработчик мог поменять ее после долгого await, когда оба сброса уже прошли."""
+        if not self.shared:
+            if user_id in self.sessions:
+                self._touched(user_id)
+            return True
+
+        deleted, session, snapshot = self._prepare_commit(user_id)
+        return self._finish_commit(user_id, session, self._write_shared(user_id, deleted, snapshot))
+
+    async def commit_async(self, user_id: int) -> bool:
+        """То же, что commit(); запись в хранилище идет в потоке, не в цикле событий"""
+        if not self.shared:
+            return self.commit(user_id)
+
+        deleted, session, snapshot = self._prepare_commit(user_id)
+        if not deleted and session is None:
+            return True
+        version = await self._run_io(self._write_shared, user_id, deleted, snapshot)
+        return self._finish_commit(user_id, session, version)
+
     def clear_adding_data(self, user_id: int):
         """Очищает данные о добавлении контента"""
-        if user_id in self.sessions:
-            self.sessions[user_id]['adding_post'] = None
-            self.sessions[user_id]['creating_section'] = False
-            self.sessions[user_id]['creating_subsection'] = None
+        session = self.sessions.get(user_id)
+        if session:
+            session.clear_adding_state()
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Удаляет сессии, истекшие в прошедших тиках; возвращает их количество"""
+        now = time.time() if now is None else now
+        current_tick = int(now // self.tick)
+        evicted = 0
+
+        with self._lock:
+            while self._swept_tick < current_tick:
+                for user_id in self._wheel.pop(self._swept_tick, ()):
+                    session = self.sessions.get(user_id)
+                    if session is None:
+                        continue
+
+                    expires_at = session.updated_at + self.session_timeout
+                    if expires_at <= now:
+                        # В общем хранилище сессию мог продлить другой процесс
+                        self._remove(user_id, local_only=self.shared)
+                        evicted += 1
+                    else:
+                        self._schedule(user_id, expires_at)
+                self._swept_tick += 1
+
+        self.evicted += evicted
+        return evicted
+
+    def attach_backend(self, backend: SessionBackend) -> int:
+        """Подключает постоянное хранилище и восстанавливает из него живые сессии"""
+        self.backend = backend
+        if backend.shared:
+            # Сессии читаются по мере обращения: в памяти процесса хранится только кэш
+            return 0
+        restored = 0
+
+        with self._lock:
+            for user_id, updated_at, data in backend.load(time.time() - self.session_timeout):
+                try:
+                    session = UserSession.restore(user_id, updated_at, data)
+                except (ValueError, TypeError) as e:
+                    print(f"⚠️ Session of user {user_id} skipped: {e}")
+                    continue
+
+                if user_id not in self.sessions:
+                    self._schedule(user_id, updated_at + self.session_timeout)
+                    self.sessions[user_id] = session
+                    self._account(session)
+                    restored += 1
+
+            # Строки идут от старых к новым, поэтому сверх пределов вытесняются самые старые
+            self._enforce_limits()
+
+        return restored
+
+    def flush(self, wait: bool = False):
+        """Сбрасывает измененные и удаленные сессии в хранилище"""
+        # Общее хранилище записывается commit() сразу после обновления
+        if self.backend is None or self.shared:
+            return
+
+        with self._lock:
+            dirty = self._dirty | self._recent
+            self._recent, self._dirty = self._dirty, set()
+            deleted, self._deleted = self._deleted, set()
+
+        rows = []
+        for user_id in dirty:
+            session = self.sessions.get(user_id)
+            if session is None:
+                deleted.add(user_id)
+                continue
+            try:
+                rows.append((user_id, session.updated_at, session.dump()))
+            except RuntimeError:
+                # Черновик меняется обработчиком в другом потоке - запишем в следующий раз
+                self._dirty.add(user_id)
+
+        # Пользователь мог начать новую сессию после удаления старой
+        deleted = [user_id for user_id in deleted if user_id not in self.sessions]
+        if not rows and not deleted:
+            return
+
+        future = self.backend.save(rows, deleted)
+        if wait and future is not None:
+            future.result()
+
+    def _maintain_local(self):
+        evicted = self.sweep()
+        if evicted:
+            print(f"🧹 Evicted {evicted} expired sessions, {len(self.sessions)} live")
+        self.flush()
+
+    def _maintain_shared(self):
+        """Удаляет из общего хранилища просроченные сессии и завершенные вне обновлений"""
+        with self._lock:
+            deleted = [user_id for user_id in self._deleted if user_id not in self.sessions]
+            self._deleted.difference_update(deleted)
+        for user_id in deleted:
+            self.backend.delete(user_id)
+        self.backend.purge(time.time() - self.session_timeout)
+
+    def maintain(self):
+        """Очистка просроченных сессий и сброс измененных - одна итерация фоновой задачи"""
+        self._maintain_local()
+        if self.shared:
+            self._maintain_shared()
+
+    async def _sweep_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self._maintain_local()
+            if self.shared:
+                await self._run_io(self._maintain_shared)
+
+    def start_sweeper(self, interval: float = SESSION_FLUSH_INTERVAL):
+        """Запускает периодическую очистку и сброс сессий в текущем цикле событий"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop(interval))
+
+    def stop_sweeper(self):
+        """Останавливает периодическую очистку"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Заполненность хранилища, попадания и счетчики удаленных сессий"""
+        lookups = self.hits + self.misses
+        return {
+            'live': len(self.sessions),
+            'max_sessions': self.max_sessions,
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'occupancy': max(len(self.sessions) / self.max_sessions, self.bytes / self.max_bytes),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evicted': self.evicted,
+            'evicted_lru': self.evicted_lru,
+            'evicted_wizards': self.evicted_wizards,
+            'expired_on_access': self.expired_on_access,
+            'conflicts': self.conflicts,
+            'wheel_slots': len(self._wheel),
+            'dirty': len(self._dirty),
+            'persistent': self.backend is not None,
+            'shared': self.shared
+        }
 
 # Глобальный менеджер сессий
 session_manager = SessionManager()
+
+def start_session_persistence() -> int:
+    """Подключает к менеджеру таблицу sessions; возвращает число восстановленных сессий"""
+    if SESSION_BACKEND == 'shared':
+        return session_manager.attach_backend(SharedSqliteSessionBackend())
+    return session_manager.attach_backend(SqliteSessionBackend())
@@ -0,0 +1,75 @@
+# tests/test_callback_codec.py
+import base64
+import sqlite3
+
+import callback_codec
+import repository
+from callback_codec import (CALLBACK_DATA_LIMIT, PACKED_PREFIX, ROUTE_NEXT_POST, ROUTE_PREV_POST,
+                            decode_callback, encode_navigation, is_packed, set_callback_secret)
+from migrations import migrate
+from repository import PostCache, newer_posts, older_posts
+
+def test_round_trip():
+    data = encode_navigation(ROUTE_PREV_POST, 12, 3, ('2024-01-05 10:00:00', 345))
+    assert is_packed(data)
+    navigation = decode_callback(data)
+    assert navigation.route == ROUTE_PREV_POST
+    assert (navigation.subsection_id, navigation.index) == (12, 3)
+    assert navigation.cursor == ('2024-01-05 10:00:00', 345)
+
+def test_largest_ids_fit_telegram_limit():
+    data = encode_navigation(ROUTE_NEXT_POST, 2 ** 32 - 1, 2 ** 32 - 1, ('2024-01-01 12:34:56', 2 ** 32 - 1))
+    assert len(data) <= CALLBACK_DATA_LIMIT
+
+def test_tampered_button_is_rejected():
+    data = encode_navigation(ROUTE_NEXT_POST, 1, 0, ('2024-01-01 00:00:00', 7))
+    raw = bytearray(base64.urlsafe_b64decode(data[1:] + '=' * (-len(data[1:]) % 4)))
+    raw[3] ^= 1  # другой подраздел
+    tampered = PACKED_PREFIX + base64.urlsafe_b64encode(bytes(raw)).rstrip(b'=').decode()
+    assert decode_callback(tampered) is None
+
+def test_garbage_is_rejected():
+    assert decode_callback(PACKED_PREFIX) is None
+    assert decode_callback(PACKED_PREFIX + '!!!') is None
+    assert decode_callback(PACKED_PREFIX + 'AAAA') is None
+    assert not is_packed('next_post_3')
+
+def test_post_without_date():
+    data = encode_navigation(ROUTE_NEXT_POST, 1, 0, (None, 7))
+    assert decode_callback(data).cursor == ('', 7)
+
+def test_buttons_are_signed_with_bot_token(monkeypatch):
+    monkeypatch.setattr(callback_codec, 'CALLBACK_SECRET', None)
+    monkeypatch.setattr(callback_codec, '_KEY', callback_codec._KEY)
+    data = encode_navigation(ROUTE_NEXT_POST, 1, 0, ('2024-01-01 00:00:00', 7))
+
+    # Другой процесс с тем же токеном принимает кнопку, с другим - нет
+    set_callback_secret('123:token')
+    signed = encode_navigation(ROUTE_NEXT_POST, 1, 0, ('2024-01-01 00:00:00', 7))
+    assert decode_callback(data) is None
+    assert decode_callback(signed) is not None
+    set_callback_secret('456:other')
+    assert decode_callback(signed) is None
+
+def test_long_timestamp_falls_back_to_id_cursor():
+    created_at = '2024-01-05T10:00:00.123456+03:00'
+    data = encode_navigation(ROUTE_NEXT_POST, 2 ** 32 - 1, 2 ** 32 - 1, (created_at, 2 ** 32 - 1))
+    assert len(data) <= CALLBACK_DATA_LIMIT
+    assert decode_callback(data).cursor == (None, 2 ** 32 - 1)
+
+def test_id_cursor_navigates_like_full_cursor(tmp_path, monkeypatch):
+    monkeypatch.setattr(repository, 'post_cache', PostCache())
+    conn = sqlite3.connect(str(tmp_path / 'codec.db'))
+    migrate(conn)
+    conn.executemany(
+        "INSERT INTO posts (id, subsection_id, user_id, user_name, title, content_type, content_text, created_at) "
+        "VALUES (?, 1, 0, 'test', ?, 'text', '', ?)",
+        [(post_id, f'Запись {post_id}', f'2024-01-0{post_id}T10:00:00.123456+03:00') for post_id in range(1, 6)]
+    )
+
+    post_id, created_at = conn.execute('SELECT id, created_at FROM posts WHERE id = 3').fetchone()
+    navigation = decode_callback(encode_navigation(ROUTE_NEXT_POST, 1, 2, (created_at, post_id)))
+    assert [post.id for post in older_posts(conn, 1, navigation.cursor)] == [2, 1]
+    assert older_posts(conn, 1, navigation.cursor) == older_posts(conn, 1, (created_at, post_id))
+    assert newer_posts(conn, 1, navigation.cursor) == newer_posts(conn, 1, (created_at, post_id))
+    conn.close()
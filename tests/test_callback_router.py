@@ -0,0 +1,72 @@
+# tests/test_callback_router.py
+import asyncio
+
+import pytest
+
+import callback_router
+from callback_codec import ROUTE_NEXT_POST, decode_callback, encode_navigation
+from callback_router import CallbackRouter
+
+async def _handler(*args):
+    pass
+
+def test_exact_and_prefixed_routes():
+    router = CallbackRouter()
+    router.exact('add_post_choose_section', _handler)
+    router.prefixed('add_post_choose_subsection', _handler)
+    router.prefixed('add_post', _handler)
+
+    route, arguments = router.resolve('add_post_3')
+    assert route.name == 'add_post_*' and arguments == (3,)
+    route, arguments = router.resolve('add_post_choose_subsection_7')
+    assert route.name == 'add_post_choose_subsection_*' and arguments == (7,)
+    route, arguments = router.resolve('add_post_choose_section')
+    assert route.name == 'add_post_choose_section' and arguments == ()
+
+def test_unknown_and_malformed_data():
+    router = CallbackRouter()
+    router.prefixed('view_section', _handler)
+    assert router.resolve('view_section_abc') is None
+    assert router.resolve('nothing') is None
+    assert asyncio.run(router.dispatch('nothing')) is False
+    assert router.stats()['unmatched'] == 1
+
+def test_duplicate_route_is_an_error():
+    router = CallbackRouter()
+    router.exact('back_to_main', _handler)
+    with pytest.raises(ValueError):
+        router.exact('back_to_main', _handler)
+
+def test_packed_routes_do_not_require_session():
+    router = CallbackRouter()
+    seen = []
+
+    async def navigate(update, navigation):
+        seen.append(navigation.index)
+
+    router.packed(ROUTE_NEXT_POST, 'next_post', navigate)
+    router.exact('back_to_main', _handler, stateless=True)
+    router.exact('view_sections', _handler)
+
+    data = encode_navigation(ROUTE_NEXT_POST, 1, 4, ('2024-01-01 00:00:00', 9))
+    assert not router.requires_session(data)
+    assert not router.requires_session('back_to_main')
+    assert router.requires_session('view_sections')
+
+    assert asyncio.run(router.dispatch(data, None)) is True
+    assert seen == [4]
+    assert router.stats()['routes']['next_post']['calls'] == 1
+
+def test_sync_dispatch_resolves_packed_button_once(monkeypatch):
+    router = CallbackRouter()
+    events = []
+    router.packed(ROUTE_NEXT_POST, 'next_post', lambda query, navigation: events.append(navigation.index))
+
+    decoded = []
+    monkeypatch.setattr(callback_router, 'decode_callback', lambda data: decoded.append(data) or decode_callback(data))
+    data = encode_navigation(ROUTE_NEXT_POST, 1, 4, ('2024-01-01 00:00:00', 9))
+    assert router.dispatch_sync(data, None, before=lambda: events.append('answer')) is True
+    assert events == ['answer', 4] and decoded == [data]
+
+    assert router.dispatch_sync('nothing', None, before=lambda: events.append('answer')) is False
+    assert events == ['answer', 4] and router.stats()['unmatched'] == 1
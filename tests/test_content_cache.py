@@ -0,0 +1,58 @@
+# tests/test_content_cache.py
+import sqlite3
+
+import pytest
+
+import content_cache as content_cache_module
+from content_cache import ContentCache
+from migrations import migrate
+from repository import PostCache
+
+@pytest.fixture
+def connections(tmp_path):
+    path = str(tmp_path / 'content.db')
+    ours, theirs = sqlite3.connect(path), sqlite3.connect(path)
+    migrate(ours)
+    yield ours, theirs
+    ours.close()
+    theirs.close()
+
+@pytest.fixture
+def post_cache(monkeypatch):
+    cache = PostCache()
+    monkeypatch.setattr(content_cache_module, 'post_cache', cache)
+    return cache
+
+def test_tree_follows_writes_of_other_process(connections, post_cache):
+    ours, theirs = connections
+    cache = ContentCache()
+    cache.watch_other_processes()
+    before = {section.name for section in cache.snapshot_sync(ours).sections()}
+    assert {section.name for section in cache.snapshot_sync(ours).sections()} == before
+    assert cache.hits == 1
+
+    theirs.execute("INSERT INTO sections (name) VALUES ('Новый раздел')")
+    theirs.commit()
+    after = {section.name for section in cache.snapshot_sync(ours).sections()}
+    assert after == before | {'Новый раздел'}
+
+def test_post_cache_follows_writes_of_other_process(connections, post_cache):
+    ours, theirs = connections
+    post_cache.watch_version = True
+    subsection_id = ours.execute('SELECT id FROM subsections LIMIT 1').fetchone()[0]
+    post_id = ours.execute(
+        "INSERT INTO posts (subsection_id, user_id, user_name, title, content_type, content_text) "
+        "VALUES (?, 0, 'test', 'Старый заголовок', 'text', '')",
+        (subsection_id,)
+    ).lastrowid
+    ours.commit()
+    assert post_cache.get_many(ours, [post_id])[0].title == 'Старый заголовок'
+
+    theirs.execute("UPDATE posts SET title = 'Новый заголовок' WHERE id = ?", (post_id,))
+    theirs.commit()
+    assert post_cache.get_many(ours, [post_id])[0].title == 'Новый заголовок'
+
+def test_unwatched_cache_does_not_query_version(connections, post_cache):
+    ours, _ = connections
+    ours.execute('DROP TABLE content_version')
+    ContentCache().snapshot_sync(ours)
@@ -0,0 +1,60 @@
+# tests/test_database.py
+import sqlite3
+import time
+
+import pytest
+
+import database
+from database import ConnectionManager, ReadReplica, get_read_connection, run_write_sync
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    path = str(tmp_path / 'replica.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE notes (id INTEGER PRIMARY KEY, text TEXT)')
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(database, 'connection_manager', ConnectionManager(path))
+    monkeypatch.setattr(database, 'read_replica', ReadReplica())
+    # Фоновое обновление не мешает проверять состояние копии между фиксациями
+    monkeypatch.setattr(database, 'DB_READ_REPLICA_REFRESH_INTERVAL', 3600)
+    assert database.read_replica.start(path)
+    yield database.read_replica
+    database.read_replica.stop()
+    database.write_queue.stop()
+    database.connection_manager.close_all()
+
+def _count(conn):
+    return conn.execute('SELECT count(*) FROM notes').fetchone()[0]
+
+def test_write_is_visible_before_replica_refresh(replica):
+    assert get_read_connection() is replica.connection()
+
+    run_write_sync(lambda conn: conn.execute("INSERT INTO notes (text) VALUES ('a')"))
+    # Копия устарела: чтение идет в файл и видит запись
+    assert replica.connection() is None
+    assert _count(get_read_connection()) == 1
+
+    assert replica.refresh()
+    assert _count(replica.connection()) == 1
+    assert get_read_connection() is replica.connection()
+
+def test_unreplicated_write_keeps_replica(replica):
+    database.write_queue.submit(lambda conn: conn.execute("INSERT INTO notes (text) VALUES ('a')"), replicate=False).result()
+    assert replica.connection() is not None
+
+def test_replica_disabled_when_database_grows(replica, monkeypatch):
+    monkeypatch.setattr(database, 'DB_READ_REPLICA_MAX_SIZE', 0)
+    assert not replica.refresh()
+    assert not replica.enabled
+    assert get_read_connection() is database.connection_manager.connection()
+
+def test_replica_refreshes_in_background(replica, monkeypatch):
+    monkeypatch.setattr(database, 'DB_READ_REPLICA_REFRESH_INTERVAL', 0)
+    run_write_sync(lambda conn: conn.execute("INSERT INTO notes (text) VALUES ('a')"))
+    for _ in range(200):
+        if replica.connection() is not None:
+            break
+        time.sleep(0.01)
+    assert _count(replica.connection()) == 1
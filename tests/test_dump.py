@@ -0,0 +1,31 @@
+# tests/test_dump.py
+import json
+import sqlite3
+
+from callback_codec import ROUTE_NEXT_POST, decode_callback, encode_navigation
+from dump import import_dump
+from repository import first_posts, older_posts
+
+def test_posts_without_date_stay_navigable(tmp_path):
+    path, db_path = str(tmp_path / 'dump.jsonl'), str(tmp_path / 'dump.db')
+    records = [
+        {'type': 'section', 'id': 100, 'name': 'Раздел'},
+        {'type': 'subsection', 'id': 200, 'section_id': 100, 'name': 'Подраздел'},
+        {'type': 'post', 'id': 1, 'subsection_id': 200, 'title': 'Без даты', 'content_type': 'text', 'created_at': None},
+        {'type': 'post', 'id': 2, 'subsection_id': 200, 'title': 'С датой', 'content_type': 'text',
+         'created_at': '2024-01-01 00:00:00'},
+    ]
+    with open(path, 'w', encoding='utf-8') as file:
+        file.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+
+    assert import_dump(path, db_path) == len(records)
+
+    conn = sqlite3.connect(db_path)
+    newest = first_posts(conn, 200)[0]
+    # Кнопка «следующая» с записи с датой ведет к записи без даты и кодируется без ошибок
+    navigation = decode_callback(encode_navigation(ROUTE_NEXT_POST, 200, 0, newest.cursor))
+    older = older_posts(conn, 200, navigation.cursor)
+    assert newest.title == 'С датой'
+    assert [post.title for post in older] == ['Без даты']
+    assert encode_navigation(ROUTE_NEXT_POST, 200, 1, older[0].cursor)
+    conn.close()
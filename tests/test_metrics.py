@@ -0,0 +1,42 @@
+# tests/test_metrics.py
+import asyncio
+import json
+import logging
+
+from metrics import MetricsReporter, collect, component_sources, report
+
+class _Counter:
+    def __init__(self):
+        self.calls = 0
+
+    def stats(self):
+        self.calls += 1
+        return {'calls': self.calls}
+
+def test_collect_skips_components_without_stats():
+    assert collect({'counter': _Counter(), 'rate_limiter': None}) == {'counter': {'calls': 1}}
+
+def test_report_writes_all_component_stats_as_one_json_line(caplog):
+    with caplog.at_level(logging.INFO, logger='metrics'):
+        report(component_sources())
+
+    (record,) = caplog.records
+    metrics = json.loads(record.getMessage())
+    assert {'sessions', 'content_cache', 'post_cache', 'render_memory', 'write_queue', 'read_replica'} <= set(metrics)
+    assert 'live' in metrics['sessions']
+
+def test_reporter_runs_until_stopped():
+    counter = _Counter()
+
+    async def scenario():
+        reporter = MetricsReporter()
+        reporter.start(lambda: {'counter': counter}, interval=0.01)
+        await asyncio.sleep(0.05)
+        reporter.stop()
+        calls = counter.calls
+        await asyncio.sleep(0.03)
+        return calls
+
+    calls = asyncio.run(scenario())
+    assert calls >= 2
+    assert counter.calls == calls
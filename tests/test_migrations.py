@@ -0,0 +1,54 @@
+# tests/test_migrations.py
+import sqlite3
+
+import pytest
+
+from migrations import (
+    BULK_LOAD_INDEXES, BULK_LOAD_TRIGGERS, check_query_plans, drop_bulk_load_hooks, migrate, restore_interrupted_bulk_load
+)
+from search import search
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'migrations.db'))
+    migrate(conn)
+    yield conn
+    conn.close()
+
+def _schema_objects(conn):
+    return {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")}
+
+def _insert_post(conn, title):
+    subsection_id = conn.execute('SELECT id FROM subsections LIMIT 1').fetchone()[0]
+    conn.execute(
+        "INSERT INTO posts (subsection_id, user_id, user_name, title, content_type, content_text) "
+        "VALUES (?, 0, 'test', ?, 'text', '')",
+        (subsection_id, title)
+    )
+
+def test_interrupted_import_is_repaired(conn):
+    # Загрузка дампа зафиксировала первую пачку и упала
+    conn.execute('BEGIN IMMEDIATE')
+    drop_bulk_load_hooks(conn)
+    _insert_post(conn, 'Загруженная запись')
+    conn.commit()
+    assert search(conn, 'загруженная')[0] == []
+
+    assert restore_interrupted_bulk_load(conn)
+    assert set(BULK_LOAD_INDEXES + BULK_LOAD_TRIGGERS) <= _schema_objects(conn)
+    assert [result.title for result in search(conn, 'загруженная')[0]] == ['Загруженная запись']
+
+    # Триггеры снова поддерживают индекс поиска
+    _insert_post(conn, 'Новая запись')
+    conn.commit()
+    assert search(conn, 'новая')[0]
+
+def test_complete_schema_is_left_alone(conn):
+    assert not restore_interrupted_bulk_load(conn)
+
+def test_hot_queries_use_indexes(conn):
+    assert check_query_plans(conn) == []
+
+def test_missing_navigation_index_is_reported(conn):
+    conn.execute('DROP INDEX idx_posts_subsection_created')
+    assert check_query_plans(conn)
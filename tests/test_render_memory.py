@@ -0,0 +1,109 @@
+# tests/test_render_memory.py
+import asyncio
+
+import pytest
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+import render_memory
+from render_memory import CAPTION_LIMIT, RenderMemory, edit_photo, edit_text
+
+class _Message:
+    def __init__(self, calls, message_id=1, photo=()):
+        self.calls = calls
+        self.chat_id = 10
+        self.message_id = message_id
+        self.photo = photo
+
+    async def reply_text(self, text, reply_markup=None):
+        self.calls.append('sendMessage')
+        return _Message(self.calls, self.message_id + 1)
+
+    async def reply_photo(self, photo, caption=None, reply_markup=None):
+        self.calls.append('sendPhoto')
+        return _Message(self.calls, self.message_id + 1, ('photo',))
+
+    async def delete(self):
+        self.calls.append('deleteMessage')
+
+class _Query:
+    def __init__(self, message):
+        self.message = message
+        self.calls = message.calls
+        self.error = None
+
+    async def _call(self, method):
+        self.calls.append(method)
+        if self.error is not None:
+            raise self.error
+
+    async def edit_message_text(self, text, reply_markup=None):
+        await self._call('editMessageText')
+
+    async def edit_message_media(self, media, reply_markup=None):
+        await self._call('editMessageMedia')
+
+    async def edit_message_caption(self, caption=None, reply_markup=None):
+        await self._call('editMessageCaption')
+
+    async def edit_message_reply_markup(self, reply_markup=None):
+        await self._call('editMessageReplyMarkup')
+
+def _markup(*buttons):
+    return InlineKeyboardMarkup([[InlineKeyboardButton(text, callback_data=text)] for text in buttons])
+
+@pytest.fixture(autouse=True)
+def memory(monkeypatch):
+    memory = RenderMemory(100)
+    monkeypatch.setattr(render_memory, 'render_memory', memory)
+    return memory
+
+def test_repeated_render_is_skipped_and_keyboard_change_edits_markup(memory):
+    calls = []
+
+    async def scenario():
+        await edit_text(_Query(_Message(calls)), 'Разделы', _markup('a'))
+        await edit_text(_Query(_Message(calls)), 'Разделы', _markup('a'))
+        await edit_text(_Query(_Message(calls)), 'Разделы', _markup('a', 'b'))
+
+    asyncio.run(scenario())
+    assert calls == ['editMessageText', 'editMessageReplyMarkup']
+    assert memory.stats()['skipped'] == memory.stats()['avoided_calls'] == 1
+
+def test_not_modified_is_counted_not_raised(memory):
+    calls = []
+    query = _Query(_Message(calls))
+    query.error = BadRequest('Message is not modified')
+    asyncio.run(edit_text(query, 'Текст'))
+    assert memory.stats()['not_modified'] == 1
+    assert memory.stats()['avoided_calls'] == 0
+
+def test_other_errors_forget_the_message(memory):
+    query = _Query(_Message([]))
+    asyncio.run(edit_text(query, 'Текст'))
+    query.error = BadRequest('Message to edit not found')
+    with pytest.raises(BadRequest):
+        asyncio.run(edit_text(query, 'Другой текст'))
+    assert memory.get((10, 1)) is None
+
+def test_kind_change_sends_new_message_and_deletes_old(memory):
+    calls = []
+    asyncio.run(edit_photo(_Query(_Message(calls)), 'file-1', 'Подпись'))
+    assert calls == ['sendPhoto', 'deleteMessage']
+    assert memory.get((10, 2)).kind == 'photo'
+
+    calls.clear()
+    asyncio.run(edit_text(_Query(_Message(calls, 2, ('photo',))), 'Текст'))
+    assert calls == ['sendMessage', 'deleteMessage']
+
+def test_same_photo_edits_caption_only():
+    calls = []
+    asyncio.run(edit_photo(_Query(_Message(calls, photo=('photo',))), 'file-1', 'Первая'))
+    asyncio.run(edit_photo(_Query(_Message(calls, photo=('photo',))), 'file-1', 'Вторая'))
+    asyncio.run(edit_photo(_Query(_Message(calls, photo=('photo',))), 'file-2', 'Вторая'))
+    assert calls == ['editMessageMedia', 'editMessageCaption', 'editMessageMedia']
+
+def test_long_caption_is_shown_as_text():
+    calls = []
+    asyncio.run(edit_photo(_Query(_Message(calls)), 'file-1', 'x' * (CAPTION_LIMIT + 1)))
+    assert calls == ['editMessageText']
@@ -0,0 +1,48 @@
+# tests/test_search.py
+import sqlite3
+
+import pytest
+
+import search
+from migrations import migrate
+from search import SEARCH_PAGE_SIZE
+
+INSERT_POST_SQL = '''
+    INSERT INTO posts (subsection_id, user_id, user_name, title, content_type, content_text)
+    VALUES (?, 0, 'test', ?, 'text', ?)
+'''
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'search.db'))
+    migrate(conn)
+    subsection_id = conn.execute('SELECT id FROM subsections LIMIT 1').fetchone()[0]
+    # Самая релевантная запись - самая старая, за ней сотни новых слабых совпадений
+    conn.execute(INSERT_POST_SQL, (subsection_id, 'Рейд рейд рейд', 'рейд ' * 20))
+    conn.executemany(
+        INSERT_POST_SQL,
+        ((subsection_id, f'Запись {i}', 'длинный текст без ключевого слова ' * 10 + 'рейд') for i in range(300))
+    )
+    conn.commit()
+    yield conn
+    conn.close()
+
+def test_old_relevant_post_ranks_first(conn):
+    results, has_next, truncated = search.search(conn, 'рейд')
+    assert results[0].title == 'Рейд рейд рейд'
+    assert has_next and not truncated
+
+def test_pages_continue_past_old_window(conn):
+    # Прежнее окно в 100 совпадений заканчивалось на 20-й странице
+    results, has_next, _ = search.search(conn, 'рейд', 40)
+    assert len(results) == SEARCH_PAGE_SIZE and has_next
+
+def test_truncated_window_is_reported(conn, monkeypatch):
+    monkeypatch.setattr(search, 'SEARCH_RANK_LIMIT', 50)
+    results, _, truncated = search.search(conn, 'рейд')
+    assert truncated
+    # Старая запись вне окна: ранжируются только 50 самых новых совпадений
+    assert all(result.title != 'Рейд рейд рейд' for result in results)
+
+def test_empty_query(conn):
+    assert search.search(conn, '  ?! ') == ([], False, False)
@@ -0,0 +1,137 @@
+# tests/test_send_scheduler.py
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Tuple
+
+import pytest
+from telegram.error import RetryAfter
+from telegram.ext import ExtBot
+from telegram.request import BaseRequest, RequestData
+
+from send_scheduler import SEND_BULK, SendScheduler
+
+class _StubBotApi(BaseRequest):
+    """Bot API без сети: запоминает отправленные сообщения; первые too_many_requests
+    запросов sendMessage получают 429 с retry_after"""
+
+    def __init__(self, too_many_requests: int = 0, retry_after: float = 0.3):
+        self.too_many_requests = too_many_requests
+        self.retry_after = retry_after
+        self.rejected = 0
+        self.sent: List[Tuple[float, Any, str]] = []
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: RequestData = None, **kwargs) -> Tuple[int, bytes]:
+        endpoint = url.rsplit('/', 1)[-1]
+        if endpoint == 'getMe':
+            return _ok({'id': 1, 'is_bot': True, 'first_name': 'Bot', 'username': 'test_bot'})
+
+        parameters = request_data.parameters
+        if self.rejected < self.too_many_requests:
+            self.rejected += 1
+            return 429, json.dumps({
+                'ok': False,
+                'error_code': 429,
+                'description': 'Too Many Requests',
+                'parameters': {'retry_after': self.retry_after}
+            }).encode()
+
+        self.sent.append((time.perf_counter(), parameters['chat_id'], parameters['text']))
+        return _ok({
+            'message_id': len(self.sent),
+            'date': 0,
+            'chat': {'id': parameters['chat_id'], 'type': 'private'},
+            'text': parameters['text']
+        })
+
+def _ok(result: Dict[str, Any]) -> Tuple[int, bytes]:
+    return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+async def _send(scenario, api: _StubBotApi, **limits):
+    """Бот с SendScheduler поверх stub Bot API; возвращает планировщик после scenario(bot)"""
+    scheduler = SendScheduler(**limits)
+    bot = ExtBot('1:test', request=api, get_updates_request=_StubBotApi(), rate_limiter=scheduler)
+    async with bot:
+        await scenario(bot)
+    return scheduler
+
+def test_interactive_messages_overtake_queued_bulk():
+    api = _StubBotApi()
+
+    async def scenario(bot):
+        # Один токен на чат раз в 50 мс: первая рассылка уходит сразу, остальные ждут
+        bulk = [asyncio.create_task(bot.send_message(7, f'bulk {number}', rate_limit_args=SEND_BULK))
+                for number in range(4)]
+        await asyncio.sleep(0.01)
+        reply = asyncio.create_task(bot.send_message(7, 'reply'))
+        await asyncio.gather(*bulk, reply)
+
+    scheduler = asyncio.run(_send(scenario, api, chat_rate=20, chat_burst=1))
+    assert [text for _, _, text in api.sent] == ['bulk 0', 'reply', 'bulk 1', 'bulk 2', 'bulk 3']
+    # Плюс getMe при инициализации бота
+    assert scheduler.stats()['sent'] == 6
+    assert scheduler.stats()['wait_bulk_s'] > scheduler.stats()['wait_interactive_s']
+
+def test_chat_limit_keeps_burst_then_rate_and_does_not_block_other_chats():
+    api = _StubBotApi()
+
+    async def scenario(bot):
+        await asyncio.gather(
+            *(bot.send_message(7, f'busy {number}') for number in range(5)),
+            bot.send_message(8, 'other')
+        )
+
+    started = time.perf_counter()
+    asyncio.run(_send(scenario, api, chat_rate=10, chat_burst=2))
+    busy = [sent_at - started for sent_at, chat_id, _ in api.sent if chat_id == 7]
+    other = [sent_at - started for sent_at, chat_id, _ in api.sent if chat_id == 8]
+
+    # Два сообщения сразу, дальше не чаще одного в 100 мс
+    assert len(busy) == 5
+    assert busy[1] - busy[0] < 0.05
+    assert all(later - earlier >= 0.08 for earlier, later in zip(busy[1:], busy[2:]))
+    assert other[0] < busy[2]
+
+def test_group_chats_use_group_rate():
+    api = _StubBotApi()
+
+    async def scenario(bot):
+        await asyncio.gather(*(bot.send_message(-100, f'group {number}') for number in range(2)))
+
+    asyncio.run(_send(scenario, api, chat_rate=100, group_rate=5, chat_burst=1))
+    (first, _, _), (second, _, _) = api.sent
+    assert second - first >= 0.15
+
+def test_retry_after_pauses_all_chats_and_retries():
+    api = _StubBotApi(too_many_requests=1, retry_after=0.3)
+
+    async def scenario(bot):
+        first = asyncio.create_task(bot.send_message(7, 'limited'))
+        await asyncio.sleep(0.05)
+        # Пауза после 429 касается всех чатов, а не только того, где она случилась
+        await asyncio.gather(first, bot.send_message(8, 'other'))
+
+    started = time.perf_counter()
+    scheduler = asyncio.run(_send(scenario, api))
+    assert {text for _, _, text in api.sent} == {'limited', 'other'}
+    assert all(sent_at - started >= 0.3 for sent_at, _, _ in api.sent)
+    assert scheduler.stats()['retried'] == 1
+    assert scheduler.stats()['sent'] == 3  # с getMe
+
+def test_retry_after_is_raised_when_retries_run_out():
+    api = _StubBotApi(too_many_requests=10, retry_after=0.1)
+
+    async def scenario(bot):
+        with pytest.raises(RetryAfter):
+            await bot.send_message(7, 'never')
+
+    scheduler = asyncio.run(_send(scenario, api, max_retries=2))
+    assert api.rejected == 3
+    assert api.sent == []
+    assert scheduler.stats()['retried'] == 2
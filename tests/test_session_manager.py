@@ -0,0 +1,154 @@
+# tests/test_session_manager.py
+import asyncio
+import sqlite3
+
+import pytest
+
+from migrations import migrate
+from session_manager import SessionManager, SharedSqliteSessionBackend, UserSession, WriteBehindSessionBackend
+
+def test_flags_and_dump_round_trip():
+    session = UserSession(1)
+    session.awaiting_post_title = True
+    session.adding_post = {'subsection_id': 3}
+    session.search_query = 'сборка'
+
+    restored = UserSession.restore(1, session.updated_at, session.dump())
+    assert restored.awaiting_post_title and not restored.awaiting_section_name
+    assert restored.adding_post == {'subsection_id': 3}
+    assert restored.search_query == 'сборка'
+
+    # Поля навигации из сессий старых версий при чтении пропускаются
+    legacy = UserSession.restore(1, session.updated_at, '{"current_section":2,"post_cursor":["2024-01-01",5]}')
+    assert legacy.current_section == 2 and not hasattr(legacy, 'post_cursor')
+
+def test_lru_eviction_spares_sessions_in_wizards():
+    manager = SessionManager(max_sessions=3)
+    manager.create_session(1).creating_section = True
+    for user_id in (2, 3, 4):
+        manager.create_session(user_id)
+
+    assert set(manager.sessions) == {1, 3, 4}
+    assert manager.stats()['evicted_lru'] == 1
+
+def test_sweep_removes_expired_sessions():
+    manager = SessionManager(session_timeout=60, tick=10)
+    manager.create_session(1)
+    session = manager.create_session(2)
+
+    assert manager.sweep(session.updated_at + 30) == 0
+    assert manager.sweep(session.updated_at + 90) == 2
+    assert manager.get_session(1) is None
+
+class _RecordingBackend(WriteBehindSessionBackend):
+    def __init__(self):
+        self.saved = []
+
+    def load(self, since):
+        return ()
+
+    def save(self, rows, deleted):
+        self.saved.extend(user_id for user_id, _, _ in rows)
+        return None
+
+def test_commit_persists_changes_made_after_both_flushes():
+    manager = SessionManager()
+    backend = _RecordingBackend()
+    manager.attach_backend(backend)
+    session = manager.create_session(1)
+    manager.flush()
+    manager.flush()
+    backend.saved.clear()
+
+    # Обработчик дописал черновик после долгого await, когда оба сброса уже прошли
+    session.adding_post = {'title': 'Запись'}
+    manager.flush()
+    assert backend.saved == []
+
+    manager.commit(1)
+    manager.flush()
+    assert backend.saved == [1]
+
+@pytest.fixture
+def shared_db(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.close()
+    return path
+
+def test_shared_backend_detects_conflicting_writes(shared_db):
+    first, second = SessionManager(), SessionManager()
+    backends = [SharedSqliteSessionBackend(shared_db), SharedSqliteSessionBackend(shared_db)]
+    first.attach_backend(backends[0])
+    second.attach_backend(backends[1])
+
+    first.create_session(7).current_section = 1
+    assert first.commit(7)
+
+    # Второй процесс читает версию первого, оба меняют ее, выигрывает первый записавший
+    second.refresh(7)
+    assert second.get_session(7).current_section == 1
+    first.refresh(7)
+    first.get_session(7).current_section = 2
+    second.get_session(7).current_section = 3
+    assert first.commit(7)
+    assert not second.commit(7)
+    second.refresh(7)
+    assert second.get_session(7).current_section == 2
+
+    for backend in backends:
+        backend.close()
+
+def test_start_resets_stored_shared_session(shared_db):
+    first, second = SessionManager(), SessionManager()
+    backends = [SharedSqliteSessionBackend(shared_db), SharedSqliteSessionBackend(shared_db)]
+    first.attach_backend(backends[0])
+    second.attach_backend(backends[1])
+
+    first.create_session(7).awaiting_section_name = True
+    assert first.commit(7)
+
+    # /start во втором процессе начинает сессию заново поверх записанной первым
+    second.refresh(7)
+    assert second.get_session(7).awaiting_section_name
+    second.create_session(7)
+    assert second.commit(7)
+    assert second.conflicts == 0
+
+    first.refresh(7)
+    assert not first.get_session(7).awaiting_section_name
+
+    for backend in backends:
+        backend.close()
+
+def test_backends_must_implement_their_interface():
+    class Incomplete(WriteBehindSessionBackend):
+        def load(self, since):
+            return ()
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_shared_backend_async_round_trip(shared_db):
+    async def scenario():
+        first, second = SessionManager(), SessionManager()
+        backends = [SharedSqliteSessionBackend(shared_db), SharedSqliteSessionBackend(shared_db)]
+        first.attach_backend(backends[0])
+        second.attach_backend(backends[1])
+
+        first.create_session(7).search_query = 'рейд'
+        assert await first.commit_async(7)
+        await second.refresh_async(7)
+        assert second.get_session(7).search_query == 'рейд'
+
+        # Завершенная сессия удаляется из хранилища в конце обновления
+        second.clear_session(7)
+        assert await second.commit_async(7)
+        await first.refresh_async(7)
+        assert first.get_session(7) is None
+
+        for backend in backends:
+            backend.close()
+
+    asyncio.run(scenario())
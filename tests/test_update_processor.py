@@ -0,0 +1,131 @@
+# tests/test_update_processor.py
+import asyncio
+import json
+import random
+import sqlite3
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from telegram.request import BaseRequest
+
+import update_processor
+from session_manager import SessionManager, SharedSessionBackend
+from update_processor import PerUserUpdateProcessor, UserLocks
+from webhook import PendingUpdateQueue
+
+def test_updates_of_one_user_run_in_order():
+    async def scenario():
+        locks = UserLocks()
+        handled = {user_id: [] for user_id in range(5)}
+        rng = random.Random(1)
+
+        async def process(user_id: int, number: int):
+            async with locks.hold(user_id):
+                await asyncio.sleep(rng.uniform(0, 0.005))
+                handled[user_id].append(number)
+
+        await asyncio.gather(*(process(user_id, number) for number in range(10) for user_id in range(5)))
+        return locks, handled
+
+    locks, handled = asyncio.run(scenario())
+    assert all(numbers == list(range(10)) for numbers in handled.values())
+    assert locks.stats()['active'] == 0
+    assert locks.stats()['contended'] > 0
+
+def test_queued_updates_of_one_user_do_not_take_slots_of_others(monkeypatch):
+    monkeypatch.setattr(update_processor, '_update_user_id', lambda update: update)
+
+    async def scenario():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+        finished = []
+
+        async def handle(user_id: int, number: int):
+            await asyncio.sleep(0.02)
+            finished.append((user_id, number))
+
+        # Пять обновлений первого пользователя пришли раньше единственного обновления второго
+        tasks = [asyncio.create_task(processor.process_update(1, handle(1, number))) for number in range(5)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(processor.process_update(2, handle(2, 0))))
+        await asyncio.gather(*tasks)
+        return finished
+
+    finished = asyncio.run(scenario())
+    assert finished.index((2, 0)) <= 1
+    assert [number for user_id, number in finished if user_id == 1] == list(range(5))
+
+class _LockedBackend(SharedSessionBackend):
+    """Общее хранилище, которое все время занято другим процессом"""
+
+    def fetch(self, user_id, known_version):
+        raise sqlite3.OperationalError('database is locked')
+
+    def compare_and_set(self, user_id, expected_version, updated_at, data):
+        raise sqlite3.OperationalError('database is locked')
+
+    def delete(self, user_id):
+        pass
+
+    def purge(self, before):
+        pass
+
+class _StubBotApi(BaseRequest):
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        result = {'id': 1, 'is_bot': True, 'first_name': 'Bot', 'username': 'test_bot'}
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+def _update(update_id: int):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': 7, 'type': 'private'},
+            'from': {'id': 7, 'is_bot': False, 'first_name': 'User'},
+            'text': 'ping'
+        }
+    }
+
+def test_session_store_errors_do_not_drop_updates_or_leak_queue_slots(monkeypatch):
+    manager = SessionManager()
+    manager.attach_backend(_LockedBackend())
+    monkeypatch.setattr(update_processor, 'session_manager', manager)
+
+    async def scenario():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+        queue = PendingUpdateQueue(max_pending=2)
+        application = (
+            Application.builder()
+            .token('1:test')
+            .request(_StubBotApi())
+            .get_updates_request(_StubBotApi())
+            .concurrent_updates(processor)
+            .update_queue(queue)
+            .build()
+        )
+        handled = []
+
+        async def handle(update, context):
+            manager.ensure_session(update.effective_user.id)
+            handled.append(update.update_id)
+
+        application.add_handler(TypeHandler(Update, handle))
+        async with application:
+            await application.start()
+            # Больше обновлений, чем мест в очереди: каждое должно их освобождать
+            for update_id in range(5):
+                await asyncio.wait_for(queue.put(Update.de_json(_update(update_id), application.bot)), 2)
+            await asyncio.wait_for(queue.join(), 2)
+            await application.stop()
+        return processor, queue, handled
+
+    processor, queue, handled = asyncio.run(scenario())
+    assert handled == list(range(5))
+    assert queue.stats()['pending'] == 0
+    assert processor.stats()['session_errors'] == 10
@@ -0,0 +1,153 @@
+# tests/test_webhook.py
+import asyncio
+import json
+import socket
+from typing import Any, Dict, List, Tuple
+
+import httpx
+import pytest
+
+pytest.importorskip('tornado')
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from telegram.request import BaseRequest, RequestData
+
+from webhook import PendingUpdateQueue, webhook_settings
+
+SECRET = 'test-secret_1'
+
+class _StubBotApi(BaseRequest):
+    """Bot API без сети: отвечает на запросы бота и запоминает их"""
+
+    def __init__(self):
+        self.calls: List[Tuple[str, Dict[str, Any]]] = []
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: RequestData = None, **kwargs) -> Tuple[int, bytes]:
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls.append((endpoint, request_data.parameters if request_data else {}))
+        if endpoint == 'getMe':
+            result: Any = {'id': 1, 'is_bot': True, 'first_name': 'Bot', 'username': 'test_bot'}
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _update(update_id: int) -> Dict[str, Any]:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': 7, 'type': 'private'},
+            'from': {'id': 7, 'is_bot': False, 'first_name': 'User'},
+            'text': 'ping'
+        }
+    }
+
+async def _serve(scenario, max_pending: int = 8):
+    """Поднимает webhook PTB с очередью PendingUpdateQueue и выполняет scenario(client, url, queue, handled, release)"""
+    api = _StubBotApi()
+    queue = PendingUpdateQueue(max_pending)
+    application = (
+        Application.builder()
+        .token('1:test')
+        .request(api)
+        .get_updates_request(_StubBotApi())
+        .update_queue(queue)
+        .build()
+    )
+    handled: List[int] = []
+    release = asyncio.Event()
+
+    async def handle(update: Update, context):
+        handled.append(update.update_id)
+        await release.wait()
+
+    application.add_handler(TypeHandler(Update, handle))
+    port = _free_port()
+    settings = webhook_settings('https://example.com/telegram', '127.0.0.1', port, SECRET)
+
+    async with application:
+        await application.updater.start_webhook(**settings)
+        await application.start()
+        try:
+            async with httpx.AsyncClient(timeout=5) as client:
+                await scenario(client, f'http://127.0.0.1:{port}/telegram', queue, handled, release)
+        finally:
+            release.set()
+            await application.updater.stop()
+            await application.stop()
+    return api, queue
+
+def _post(client: httpx.AsyncClient, url: str, update_id: int, secret: str = SECRET):
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {}
+    return client.post(url, json=_update(update_id), headers=headers)
+
+def test_webhook_accepts_updates_with_secret():
+    async def scenario(client, url, queue, handled, release):
+        release.set()
+        response = await _post(client, url, 1)
+        assert response.status_code == 200
+        for _ in range(100):
+            if handled:
+                break
+            await asyncio.sleep(0.01)
+        assert handled == [1]
+        assert queue.stats()['accepted'] == 1
+
+    api, queue = asyncio.run(_serve(scenario))
+    set_webhook = dict(api.calls)['setWebhook']
+    assert set_webhook['secret_token'] == SECRET
+    assert set_webhook['url'] == 'https://example.com/telegram'
+    assert 'max_connections' in set_webhook
+
+def test_webhook_rejects_wrong_or_missing_secret():
+    async def scenario(client, url, queue, handled, release):
+        assert (await _post(client, url, 1, secret='wrong')).status_code == 403
+        assert (await _post(client, url, 2, secret='')).status_code == 403
+        await asyncio.sleep(0.05)
+        assert handled == []
+        assert queue.stats()['accepted'] == 0
+
+    asyncio.run(_serve(scenario))
+
+def test_webhook_holds_response_while_pending_limit_is_reached():
+    async def scenario(client, url, queue, handled, release):
+        # Первое обновление занимает единственное место до release
+        assert (await _post(client, url, 1)).status_code == 200
+        second = asyncio.create_task(_post(client, url, 2))
+        await asyncio.sleep(0.2)
+        assert not second.done()
+        assert handled == [1]
+
+        release.set()
+        assert (await asyncio.wait_for(second, 5)).status_code == 200
+        for _ in range(100):
+            if len(handled) == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert handled == [1, 2]
+        assert queue.stats()['waited'] == 1
+
+    _, queue = asyncio.run(_serve(scenario, max_pending=1))
+    assert queue.stats()['pending'] == 0
+
+def test_webhook_requires_url_and_secret():
+    with pytest.raises(ValueError):
+        webhook_settings('', '127.0.0.1', 8443, SECRET)
+    with pytest.raises(ValueError):
+        webhook_settings('https://example.com/telegram', '127.0.0.1', 8443, '')
+    with pytest.raises(ValueError):
+        webhook_settings('https://example.com/telegram', '127.0.0.1', 8443, 'no spaces allowed')
+    assert webhook_settings('https://example.com/bot/hook', '0.0.0.0', 8443, SECRET)['url_path'] == 'bot/hook'
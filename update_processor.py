@@ -0,0 +1,118 @@
+# update_processor.py
+import asyncio
+import contextlib
+import logging
+import os
+from typing import Any, AsyncIterator, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from session_manager import session_manager
+
+# Сколько обновлений разных пользователей обрабатывается одновременно
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', 64))
+
+# Предел для семафора BaseUpdateProcessor (см. PerUserUpdateProcessor.__init__)
+UNBOUNDED_UPDATES = 2 ** 31
+
+logger = logging.getLogger(__name__)
+
+class _UserLock:
+    __slots__ = ('lock', 'holders')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.holders = 0
+
+class UserLocks:
+    """asyncio.Lock на пользователя; замок удаляется, когда его никто не держит и не ждет"""
+
+    def __init__(self):
+        self._locks: Dict[int, _UserLock] = {}
+        self.acquired = 0
+        self.contended = 0
+
+    @contextlib.asynccontextmanager
+    async def hold(self, user_id: int) -> AsyncIterator[None]:
+        """Обновления одного пользователя выполняются по одному, в порядке поступления"""
+        entry = self._locks.get(user_id)
+        if entry is None:
+            entry = self._locks[user_id] = _UserLock()
+        elif entry.lock.locked():
+            self.contended += 1
+
+        entry.holders += 1
+        try:
+            # asyncio.Lock будит ожидающих в порядке очереди
+            async with entry.lock:
+                self.acquired += 1
+                yield
+        finally:
+            entry.holders -= 1
+            if entry.holders == 0:
+                del self._locks[user_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """Число активных замков и ожиданий"""
+        return {
+            'active': len(self._locks),
+            'acquired': self.acquired,
+            'contended': self.contended
+        }
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Обновления разных пользователей идут параллельно, одного пользователя - строго по очереди.
+
+    Если бот запущен в нескольких процессах (SESSION_BACKEND=shared), сессия пользователя
+    перед обновлением сверяется с общим хранилищем, а после него записывается в него."""
+
+    def __init__(self, max_concurrent_updates: int = CONCURRENT_UPDATES):
+        # Семафор PTB берется до do_process_update: с настоящим пределом обновления, ждущие
+        # замка своего пользователя, занимали бы места остальных. Поэтому PTB получает
+        # заведомо большой предел, а места выдает свой семафор - уже после замка пользователя
+        super().__init__(UNBOUNDED_UPDATES)
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self.user_locks = UserLocks()
+        self.session_errors = 0
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        user_id = _update_user_id(update)
+        if user_id is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        # Ошибка хранилища сессий не должна терять обновление: иначе PTB не вызовет
+        # update_queue.task_done(), и место в PendingUpdateQueue не освободится
+        async with self.user_locks.hold(user_id):
+            async with self._slots:
+                try:
+                    await session_manager.refresh_async(user_id)
+                except Exception:
+                    self.session_errors += 1
+                    logger.exception("Session refresh failed for user %s, handling the cached session", user_id)
+                try:
+                    await coroutine
+                finally:
+                    try:
+                        await session_manager.commit_async(user_id)
+                    except Exception:
+                        self.session_errors += 1
+                        logger.exception("Session commit failed for user %s", user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Замки пользователей и ошибки общего хранилища сессий"""
+        return {**self.user_locks.stats(), 'session_errors': self.session_errors}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+def _update_user_id(update: object) -> Optional[int]:
+    """Пользователь, от которого пришло обновление (у служебных обновлений его нет)"""
+    if isinstance(update, Update) and update.effective_user:
+        return update.effective_user.id
+    return None
@@ -0,0 +1,99 @@
+# webhook.py
+# Режим webhook для точек входа на python-telegram-bot 20 (bot.py, bot_session.py).
+# main.py на python-telegram-bot 13 работает только через polling: в PTB 13 нет Application
+# и очереди обновлений с пределом, поэтому модуль там не используется
+import asyncio
+import os
+import re
+from typing import Any, Dict
+from urllib.parse import urlsplit
+
+from telegram.ext import Application
+
+# Публичный адрес webhook (https://.../путь) и адрес, на котором слушает сервер PTB
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+
+# Секрет из заголовка X-Telegram-Bot-Api-Secret-Token. Обязателен в режиме webhook и
+# одинаков у всех процессов за одним адресом: setWebhook каждого процесса передает его Telegram
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+# Принятые, но еще не обработанные обновления; сверх этого сервер не отвечает Telegram,
+# пока не освободится место, и Telegram не присылает больше WEBHOOK_MAX_CONNECTIONS сразу
+WEBHOOK_MAX_PENDING = int(os.getenv('WEBHOOK_MAX_PENDING', 256))
+
+# Одновременные соединения Telegram к webhook (параметр setWebhook)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+
+# Допустимые символы секрета по документации setWebhook
+_SECRET_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,256}')
+
+class PendingUpdateQueue(asyncio.Queue):
+    """Очередь обновлений приложения (Application.builder().update_queue()) с пределом
+    на обновления в очереди и в обработке.
+
+    Application вызывает task_done() после обработки каждого обновления. Пока в работе
+    max_pending обновлений, put() ждет: webhook не отвечает Telegram, а polling не
+    запрашивает новые обновления."""
+
+    def __init__(self, max_pending: int = WEBHOOK_MAX_PENDING):
+        super().__init__()
+        self.max_pending = max_pending
+        self.pending = 0
+        self.accepted = 0
+        self.waited = 0
+        self._freed = asyncio.Event()
+
+    async def put(self, item: Any) -> None:
+        if self.pending >= self.max_pending:
+            self.waited += 1
+        while self.pending >= self.max_pending:
+            self._freed.clear()
+            await self._freed.wait()
+        self.put_nowait(item)
+
+    def put_nowait(self, item: Any) -> None:
+        if self.pending >= self.max_pending:
+            raise asyncio.QueueFull
+        self.pending += 1
+        self.accepted += 1
+        super().put_nowait(item)
+
+    def task_done(self) -> None:
+        super().task_done()
+        self.pending -= 1
+        self._freed.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Обновления в работе и ожидания свободного места"""
+        return {
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'accepted': self.accepted,
+            'waited': self.waited
+        }
+
+def webhook_settings(url: str = WEBHOOK_URL, listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT,
+                     secret_token: str = WEBHOOK_SECRET) -> Dict[str, Any]:
+    """Параметры Application.run_webhook()"""
+    if not url:
+        raise ValueError("WEBHOOK_URL is not set")
+    if not secret_token:
+        raise ValueError("WEBHOOK_SECRET is not set")
+    if not _SECRET_PATTERN.fullmatch(secret_token):
+        raise ValueError("WEBHOOK_SECRET must be 1-256 characters A-Z, a-z, 0-9, _ or -")
+    return {
+        'listen': listen,
+        'port': port,
+        'url_path': urlsplit(url).path.lstrip('/'),
+        'webhook_url': url,
+        'secret_token': secret_token,
+        'max_connections': WEBHOOK_MAX_CONNECTIONS
+    }
+
+def run_webhook(application: Application, url: str = WEBHOOK_URL, listen: str = WEBHOOK_LISTEN,
+                port: int = WEBHOOK_PORT, secret_token: str = WEBHOOK_SECRET):
+    """Замена application.run_polling(): обновления принимает webhook-сервер PTB
+    (нужен python-telegram-bot[webhooks])"""
+    application.run_webhook(**webhook_settings(url, listen, port, secret_token))